@@ -0,0 +1,131 @@
+"""
+Benchmark of admission control for outbound calls under a burst.
+
+Fires --calls searches with distinct queries at once, as a worker at peak
+load does, at a Tavily stub that slows down past --capacity requests at once
+and answers 429 past twice that:
+- "uncoordinated": with an admission limit too high to matter, as before;
+- "admitted": with the search limiter at --capacity and its default queue;
+- "small queue": the same with a queue of --small-queue, which turns the
+  overflow away at once instead of letting it wait.
+
+Then queues --calls background searches behind a full limiter and sends
+--chat-calls at chat priority, to check that they jump the queue.
+
+Reports failed calls (429s from the stub, or turned away), latency
+percentiles and the largest queue depth.
+
+    python -m benchmarks.admission_benchmark --calls 200 --capacity 8
+"""
+
+import os
+import time
+import asyncio
+import argparse
+from typing_extensions import Any, Dict, List
+from benchmarks.e2e_benchmark import percentile
+from benchmarks.stubs import TavilyStub
+
+
+def _install_limiter(concurrency: int, max_queue: int):
+    """Replace the search limiter of the running loop."""
+    # pylint: disable=import-outside-toplevel,protected-access
+    from research_canvas.crewai import admission
+    limiter = admission.Limiter("search", concurrency, 0.0, max_queue)
+    admission._LIMITERS.setdefault(asyncio.get_running_loop(), {})["search"] = limiter
+    return limiter
+
+
+async def _burst(label: str, run: int, stub: TavilyStub, concurrency: int, max_queue: int, calls: int) -> Dict[str, Any]:
+    # pylint: disable=import-outside-toplevel
+    from research_canvas.crewai.tools import _search
+    limiter = _install_limiter(concurrency, max_queue)
+    rejected = stub.rejected
+    depth = [0]
+
+    async def watch():
+        while True:
+            depth[0] = max(depth[0], limiter.queued)
+            await asyncio.sleep(0.005)
+
+    async def call(i: int):
+        start = time.perf_counter()
+        try:
+            await _search(f"burst {run} query {i}")
+        except Exception: # pylint: disable=broad-except
+            return None
+        return time.perf_counter() - start
+
+    watcher = asyncio.create_task(watch())
+    start = time.perf_counter()
+    results = await asyncio.gather(*(call(i) for i in range(calls)))
+    elapsed = time.perf_counter() - start
+    watcher.cancel()
+    latencies = [latency for latency in results if latency is not None]
+    p50, p99 = (percentile(latencies, p) * 1000 if latencies else float("nan") for p in (50, 99))
+    failed = 1 - len(latencies) / calls
+    print(
+        f"{label:<14} {failed:>7.1%} {stub.rejected - rejected:>6} {p50:>8.0f} {p99:>8.0f} "
+        f"{depth[0]:>6} {elapsed:>8.2f}"
+    )
+    return {"failed": failed, "p50_ms": p50, "p99_ms": p99}
+
+
+async def _priorities(stub: TavilyStub, capacity: int, calls: int, chat_calls: int):
+    # pylint: disable=import-outside-toplevel
+    from research_canvas.crewai.admission import BACKGROUND, CHAT, admit
+    from research_canvas.crewai.tools import _get_tavily_client
+    _install_limiter(capacity, calls + chat_calls)
+    waits: Dict[int, List[float]] = {CHAT: [], BACKGROUND: []}
+
+    async def call(i: int, priority: int):
+        start = time.perf_counter()
+        async with admit("search", priority):
+            waits[priority].append(time.perf_counter() - start)
+            await _get_tavily_client().search(f"priority {priority} query {i}")
+
+    background = [asyncio.create_task(call(i, BACKGROUND)) for i in range(calls)]
+    await asyncio.sleep(stub.delay)
+    await asyncio.gather(*(call(i, CHAT) for i in range(chat_calls)))
+    await asyncio.gather(*background)
+    for priority, name in ((CHAT, "chat"), (BACKGROUND, "background")):
+        values = waits[priority]
+        print(
+            f"  {name:<12} wait p50 {percentile(values, 50) * 1000:>6.0f} ms, "
+            f"p99 {percentile(values, 99) * 1000:>6.0f} ms"
+        )
+
+
+async def _main(args):
+    stub = TavilyStub(pages_base_url="http://127.0.0.1:9", delay=args.search_delay, capacity=args.capacity)
+    url = await stub.start()
+    os.environ.setdefault("TAVILY_API_KEY", "stub")
+    os.environ["TAVILY_API_BASE_URL"] = url
+
+    print(f"{'':<14} {'failed':>7} {'429s':>6} {'p50 ms':>8} {'p99 ms':>8} {'queue':>6} {'wall s':>8}")
+    await _burst("uncoordinated", 0, stub, 1_000_000, 0, args.calls)
+    await _burst("admitted", 1, stub, args.capacity, 256, args.calls)
+    await _burst("small queue", 2, stub, args.capacity, args.small_queue, args.calls)
+
+    print(f"\n{args.calls} background searches queued, then {args.chat_calls} at chat priority:")
+    await _priorities(stub, args.capacity, args.calls, args.chat_calls)
+
+    # pylint: disable=import-outside-toplevel
+    from research_canvas.crewai.tools import close_tavily_client
+    await close_tavily_client()
+    await stub.stop()
+
+
+def main():
+    """Run the admission benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--chat-calls", type=int, default=10)
+    parser.add_argument("--capacity", type=int, default=8, help="requests the search stub serves at full speed")
+    parser.add_argument("--small-queue", type=int, default=32)
+    parser.add_argument("--search-delay", type=float, default=0.1)
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Measure how long HTML to markdown conversion blocks the event loop.
+
+A ticker coroutine records how late each of its wake-ups is while a large
+review page is converted, first inline and then through the conversion pool.
+
+    python -m benchmarks.convert_benchmark
+"""
+
+import time
+import asyncio
+import html2text
+from research_canvas.crewai.convert import html_to_markdown, shutdown_executor
+
+_TICK = 0.005
+_PAGE = (
+    "<html><body><nav>" + "<a href='/x'>Link</a>" * 500 + "</nav>"
+    + "<article>" + "<h2>Section</h2><p>The ride is <b>comfortable</b> and quiet.</p>" * 5000
+    + "</article></body></html>"
+)
+
+
+async def _measure(convert) -> float:
+    """Return the longest event loop stall, in seconds, while `convert` runs."""
+    stalls = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(_TICK)
+            stalls.append(time.perf_counter() - start - _TICK)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(_TICK * 2)
+    await convert()
+    done.set()
+    await task
+    return max(stalls)
+
+
+async def main():
+    """Run the benchmark."""
+    async def inline():
+        html2text.html2text(_PAGE)
+
+    async def offloaded():
+        await html_to_markdown(_PAGE)
+
+    print(f"page size: {len(_PAGE) / 1024:.0f} KiB")
+    print(f"inline     max loop stall: {await _measure(inline) * 1000:8.1f} ms")
+    print(f"offloaded  max loop stall: {await _measure(offloaded) * 1000:8.1f} ms")
+    shutdown_executor()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,70 @@
+"""
+Benchmark the resource downloader against a local HTTP server with slow pages.
+
+Compares the previous behaviour (one fresh session per URL, awaited one at a
+time) with the pooled, concurrent downloader.
+
+    python -m benchmarks.download_benchmark
+"""
+
+import time
+import asyncio
+import itertools
+import aiohttp
+from aiohttp import web
+from research_canvas.crewai import download
+
+_PAGE_DELAY = 0.2
+_PAGE = "<html><body><h1>Review</h1>" + "<p>Lorem ipsum dolor sit amet.</p>" * 200 + "</body></html>"
+
+_run_ids = itertools.count()
+
+
+async def _slow_page(request: web.Request):
+    await asyncio.sleep(_PAGE_DELAY)
+    return web.Response(text=_PAGE, content_type="text/html")
+
+
+async def _sequential(urls):
+    """The previous downloader: a new session per URL, one URL at a time."""
+    for url in urls:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url) as response:
+                await response.text()
+
+
+async def _concurrent(urls):
+    await asyncio.gather(*(download._download_resource(url) for url in urls)) # pylint: disable=protected-access
+
+
+async def main():
+    """Run the benchmark."""
+    app = web.Application()
+    app.router.add_get("/page/{id}", _slow_page)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1] # pylint: disable=protected-access
+
+    print(f"{'resources':>10} {'sequential':>12} {'concurrent':>12} {'speedup':>8}")
+    for n in (1, 10, 50):
+        run = next(_run_ids)
+        urls = [f"http://127.0.0.1:{port}/page/{run}-{i}" for i in range(n)]
+
+        start = time.perf_counter()
+        await _sequential(urls)
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await _concurrent(urls)
+        concurrent = time.perf_counter() - start
+
+        print(f"{n:>10} {sequential:>11.3f}s {concurrent:>11.3f}s {sequential / concurrent:>7.1f}x")
+
+    await download.close_session()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
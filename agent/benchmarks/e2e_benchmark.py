@@ -0,0 +1,369 @@
+"""
+Offline end-to-end benchmark of ResearchCanvasFlow.
+
+Starts local stand-ins for OpenRouter (a scripted OpenAI-compatible streaming
+server), Tavily and the web (static review pages) in a separate process,
+points the agent at them and drives it through CrewAIAgent, as the CopilotKit
+endpoint does, with scripted multi-turn sessions. Each session asks for
+recommendations, deep dives into one of them and then compares two others.
+With --prefetch the deep-dive sources are prefetched and the hit rate and
+wasted bytes are reported.
+
+Reports end-to-end and per-stage latency percentiles, time to first token,
+throughput at each concurrency level and peak RSS. With --save-baseline the
+results are written to a baseline file; later runs compare against it and
+exit non-zero when a metric regressed by more than --tolerance.
+
+    python -m benchmarks.e2e_benchmark --concurrency 1 8 32
+    python -m benchmarks.e2e_benchmark --save-baseline
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import resource
+import functools
+import multiprocessing
+from collections import defaultdict
+from typing_extensions import Any, AsyncIterator, Callable, Dict, List, Optional
+from benchmarks.stubs import OpenAIStub, TavilyStub, WebStub
+
+_BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "e2e.json")
+
+_NEEDS = [
+    "hybrid SUV for a family of five", "commuter car with great fuel economy",
+    "all wheel drive crossover for snowy winters", "affordable EV with long range",
+    "compact SUV that can tow a small trailer", "reliable used car for a new driver",
+]
+_CARS = [
+    "Toyota RAV4 Hybrid", "Honda CR-V Hybrid", "Mazda CX-5", "Subaru Forester", "Tesla Model Y",
+]
+
+_STAGE_TIMES: Dict[str, List[float]] = defaultdict(list)
+
+
+def _script(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Scripted model: search, extract, deep dive(s), then answer."""
+    tools = [tool["function"]["name"] for tool in body.get("tools") or []]
+    messages = body["messages"]
+    if "ExtractResources" in tools:
+        seed = len(json.dumps(messages[-1]))
+        recommendations = [
+            {
+                "car": _CARS[(seed + i) % len(_CARS)],
+                "tagline": "A strong all-rounder",
+                "content": "Efficient, practical and well equipped for the price."
+            }
+            for i in range(3)
+        ]
+        return {"tool_calls": [{
+            "name": "ExtractResources",
+            "arguments": json.dumps({"recommendations": recommendations}),
+        }]}
+    question = next(m["content"] for m in reversed(messages) if m["role"] == "user")
+    if question.lower().startswith(("tell me more about", "compare the")):
+        # One deep dive per car named, all at once if parallel tool calls are
+        # allowed, else one per round trip.
+        car_names = question.split(" the ", 1)[1].rstrip("?.").split(" and the ")
+        turn = messages[max(i for i, m in enumerate(messages) if m["role"] == "user") + 1:]
+        done = sum(len(m.get("tool_calls") or []) for m in turn if m["role"] == "assistant")
+        pending = car_names[done:] if body.get("parallel_tool_calls", True) else car_names[done:done + 1]
+        if pending:
+            return {"tool_calls": [
+                {"name": "DeepDiveReview", "arguments": json.dumps({"car_name": car_name})}
+                for car_name in pending
+            ]}
+    if messages[-1]["role"] == "tool":
+        return {"content": (
+            "Based on the reviews, these cars balance efficiency, space and reliability well. "
+            "Would you like a deep dive on one of them, or should I refine the search?"
+        )}
+    return {"tool_calls": [{
+        "name": "Search",
+        "arguments": json.dumps({"queries": [question, f"{question} reliability"]}),
+    }]}
+
+
+def serve_stubs(connection, llm_delay: float, search_delay: float, page_delay: float):
+    """Run the stand-in servers until the process is terminated."""
+    async def serve():
+        web_stub = WebStub(delay=page_delay)
+        pages_url = await web_stub.start()
+        search_stub = TavilyStub(pages_base_url=pages_url, delay=search_delay)
+        search_url = await search_stub.start()
+        llm_stub = OpenAIStub(_script, token_delay=llm_delay / 10, first_token_delay=llm_delay)
+        llm_url = await llm_stub.start()
+        connection.send({"llm": llm_url, "search": search_url, "pages": pages_url})
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def _timed(stage: str, function: Callable) -> Callable:
+    """Wrap a function of the agent to record how long each call takes."""
+    if asyncio.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def timed_async(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                _STAGE_TIMES[stage].append(time.perf_counter() - start)
+        return timed_async
+
+    @functools.wraps(function)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _STAGE_TIMES[stage].append(time.perf_counter() - start)
+    return timed
+
+
+def _instrument():
+    """Time the stages of a turn at the names the flow calls them by."""
+    # pylint: disable=import-outside-toplevel,protected-access
+    from research_canvas.crewai import agent, tools
+    agent.download_resources = _timed("download", agent.download_resources)
+    agent.format_prompt = _timed("prompt", agent.format_prompt)
+    agent.stream_completion = _timed("chat_llm", agent.stream_completion)
+    agent.perform_tool_calls = _timed("tool_calls", agent.perform_tool_calls)
+    tools._search = _timed("search", tools._search)
+    tools.stream_completion = _timed("extract_llm", tools.stream_completion)
+
+
+def _to_copilotkit(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Turn the messages of a final agent state back into request messages."""
+    result = []
+    for message in messages:
+        if "actionExecutionId" in message:
+            result.append({**message, "type": "ResultMessage"})
+        elif "arguments" in message:
+            result.append({**message, "type": "ActionExecutionMessage"})
+        else:
+            result.append({**message, "type": "TextMessage"})
+    return result
+
+
+async def consume_events(lines: AsyncIterator[str]):
+    """
+    Read the event stream of one turn. Returns the final state, the messages
+    for the next request, the latency and the time to first token.
+    """
+    start = time.perf_counter()
+    first_token: Optional[float] = None
+    final_state = None
+    async for chunk in lines:
+        for line in chunk.splitlines():
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if event["type"] == "TextMessageContent" and first_token is None:
+                first_token = time.perf_counter() - start
+            elif event["type"] == "AgentStateMessage":
+                final_state = event["state"]
+    latency = time.perf_counter() - start
+    state = json.loads(final_state) if final_state else {}
+    messages = _to_copilotkit(state.pop("messages", []))
+    return state, messages, latency, first_token
+
+
+async def _turn(agent, thread_id: str, state: Dict[str, Any], messages: List[Dict[str, Any]]):
+    """Run one turn in process."""
+    return await consume_events(
+        agent.execute(state=state, thread_id=thread_id, messages=messages, actions=[])
+    )
+
+
+async def run_session(run_turn: Callable, index: int, pages_url: str, results: Dict[str, List[float]]):
+    """
+    Run the scripted turns of one session with `run_turn(thread_id, state, messages)`,
+    recording turn latencies and times to first token in `results`.
+    """
+    thread_id = str(uuid.uuid4())
+    need = _NEEDS[index % len(_NEEDS)]
+    state: Dict[str, Any] = {
+        "resources": [
+            {"url": f"{pages_url}/review/{(index * 3 + i) % 50}", "title": "", "description": ""}
+            for i in range(3)
+        ],
+    }
+    messages: List[Dict[str, Any]] = []
+    for turn, question in enumerate((
+        f"I am looking for a {need} (session {index})",
+        f"Tell me more about the {_CARS[index % len(_CARS)]}",
+        f"Compare the {_CARS[(index + 1) % len(_CARS)]} and the {_CARS[(index + 2) % len(_CARS)]}",
+    )):
+        messages.append({"id": str(uuid.uuid4()), "type": "TextMessage", "role": "user", "content": question})
+        state, messages, latency, first_token = await run_turn(thread_id, state, messages)
+        results["turn"].append(latency)
+        if turn == 0:
+            results["research"].append(latency)
+        elif turn == 1:
+            results["deep_dive"].append(latency)
+        elif turn == 2:
+            results["compare"].append(latency)
+        if first_token is not None:
+            results["first_token"].append(first_token)
+
+
+async def _run(agent, pages_url: str, sessions: int, concurrency: int):
+    """Run `sessions` sessions, at most `concurrency` at a time."""
+    _STAGE_TIMES.clear()
+    results: Dict[str, List[float]] = defaultdict(list)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(index: int):
+        async with semaphore:
+            await run_session(functools.partial(_turn, agent), index, pages_url, results)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(bounded(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - start
+    return elapsed, {**results, **_STAGE_TIMES}
+
+
+def percentile(values: List[float], rank: float) -> float:
+    """The `rank`th percentile of `values`."""
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(rank / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def _report(concurrency: int, sessions: int, elapsed: float, timings: Dict[str, List[float]]):
+    metrics = {
+        "turns_per_second": len(timings.get("turn", [])) / elapsed,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "llm_calls_per_turn": (
+            len(timings.get("chat_llm", [])) + len(timings.get("extract_llm", []))
+        ) / max(1, len(timings.get("turn", []))),
+    }
+    print(f"\nconcurrency {concurrency}: {sessions} sessions in {elapsed:.2f}s, "
+          f"{metrics['turns_per_second']:.1f} turns/s, {metrics['llm_calls_per_turn']:.2f} LLM calls/turn, "
+          f"peak RSS {metrics['peak_rss_mb']:.0f} MB")
+    print(f"  {'stage':<12} {'count':>6} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8}")
+    for stage in ("turn", "research", "deep_dive", "compare", "first_token", "download", "prompt", "chat_llm", "tool_calls", "search", "extract_llm"):
+        values = timings.get(stage)
+        if not values:
+            continue
+        p50, p90, p99 = (percentile(values, p) * 1000 for p in (50, 90, 99))
+        print(f"  {stage:<12} {len(values):>6} {p50:>8.1f} {p90:>8.1f} {p99:>8.1f}")
+        metrics[f"{stage}_p50_ms"] = p50
+        metrics[f"{stage}_p99_ms"] = p99
+    return metrics
+
+
+def _regressions(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float,
+    min_delta: float
+):
+    """
+    Metrics that got worse than the baseline by more than `tolerance`, and,
+    for latencies and memory, by more than `min_delta` in absolute terms.
+    """
+    regressions = []
+    for level, metrics in results.items():
+        for name, value in metrics.items():
+            previous = baseline.get(level, {}).get(name)
+            if previous is None or previous == 0:
+                continue
+            # Throughput regresses downwards, everything else upwards.
+            if name == "turns_per_second":
+                change = (previous - value) / previous
+            elif value - previous > min_delta:
+                change = (value - previous) / previous
+            else:
+                continue
+            if change > tolerance:
+                regressions.append(f"concurrency {level}: {name} {previous:.1f} -> {value:.1f} ({change:+.0%})")
+    return regressions
+
+
+async def _main(args):
+    parent, child = multiprocessing.Pipe()
+    stubs = multiprocessing.Process(
+        target=serve_stubs,
+        args=(child, args.llm_delay, args.search_delay, args.page_delay),
+        daemon=True
+    )
+    stubs.start()
+    urls = parent.recv()
+
+    os.environ.setdefault("OPENROUTER_API_KEY", "stub")
+    os.environ.setdefault("TAVILY_API_KEY", "stub")
+    os.environ["LLM_BASE_URL"] = urls["llm"]
+    os.environ["TAVILY_API_BASE_URL"] = urls["search"]
+    os.environ["PREFETCH_ENABLED"] = "true" if args.prefetch else "false"
+
+    # pylint: disable=import-outside-toplevel
+    from copilotkit.crewai import CrewAIAgent
+    from research_canvas.crewai.agent import ResearchCanvasFlow
+    _instrument()
+    agent = CrewAIAgent(name="research_agent_crewai", description="Research agent.", flow=ResearchCanvasFlow())
+
+    await _run(agent, urls["pages"], 1, 1) # warm up
+    results = {}
+    for concurrency in args.concurrency:
+        sessions = max(args.sessions, concurrency)
+        elapsed, timings = await _run(agent, urls["pages"], sessions, concurrency)
+        results[str(concurrency)] = _report(concurrency, sessions, elapsed, timings)
+
+    from research_canvas.crewai.download import close_session
+    from research_canvas.crewai.llm import close_clients
+    from research_canvas.crewai.tools import close_tavily_client
+    from research_canvas.crewai.prefetch import close_prefetcher, get_prefetch_stats
+    await close_prefetcher()
+    if args.prefetch:
+        stats = get_prefetch_stats()
+        print(
+            f"\nprefetch: {stats['started']:.0f} started, {stats['cancelled']:.0f} cancelled, "
+            f"hit rate {stats['hit_rate']:.0%} of {stats['requested'] - stats['cached']:.0f} uncached deep-dive sources, "
+            f"{stats['wasted_bytes'] / 1024:.0f} of {stats['fetched_bytes'] / 1024:.0f} KiB wasted"
+        )
+    await close_session()
+    await close_clients()
+    await close_tavily_client()
+    stubs.terminate()
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\nsaved baseline to {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = _regressions(results, json.load(f), args.tolerance, args.min_delta)
+        if regressions:
+            print("\nregressions against the baseline:\n  " + "\n  ".join(regressions))
+            return 1
+        print("\nno regressions against the baseline")
+    return 0
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--sessions", type=int, default=8, help="sessions per concurrency level (at least the level)")
+    parser.add_argument("--llm-delay", type=float, default=0.3, help="time to first token of the model stand-in")
+    parser.add_argument("--search-delay", type=float, default=0.3)
+    parser.add_argument("--page-delay", type=float, default=0.1)
+    parser.add_argument("--prefetch", action="store_true", help="prefetch deep-dive sources in the background")
+    parser.add_argument("--baseline", default=_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--min-delta", type=float, default=5.0, help="ignore regressions smaller than this (ms or MB)")
+    sys.exit(asyncio.run(_main(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
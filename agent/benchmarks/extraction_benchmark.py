@@ -0,0 +1,135 @@
+"""
+Benchmark of main-content extraction and near-duplicate detection.
+
+Converts a corpus of review pages to markdown, whole as before and with only
+their main content, and reports the bytes and estimated tokens removed per
+page and the extraction time. Then signs the pages with SimHash and reports
+the near duplicates found among them.
+
+The corpus is the saved pages in --pages (*.html), or by default the review
+pages of the web stub, with every --syndicate-every'th page also published
+on two other sites: the same article inside another site's layout, with a
+cookie banner, a comment thread, a newsletter box and more links.
+
+Then times a malformed page, a review with --unclosed unclosed <font> tags
+followed by as many stray </b> end tags, against converting it whole.
+
+    python -m benchmarks.extraction_benchmark
+    python -m benchmarks.extraction_benchmark --pages saved_pages/
+"""
+
+import os
+import time
+import glob
+import argparse
+import statistics
+import html2text
+from typing_extensions import List, Optional, Tuple
+from research_canvas.crewai.dedup import near_duplicates, simhash
+from research_canvas.crewai.readability import extract_main_content
+from research_canvas.crewai.tokens import estimate_tokens
+from benchmarks.stubs import review_page
+
+_SITES = ["autodaily", "carsweekly"]
+
+
+def _syndicate(page: int, site: str) -> str:
+    """A stub review page's article republished inside another site's layout."""
+    html = review_page(page)
+    article = html[html.index("<article>"):html.index("</article>") + len("</article>")]
+    links = "".join(f'<li><a href="https://{site}.example/{i}">Story {i}</a></li>' for i in range(60))
+    comments = "".join(
+        f'<div class="comment"><p>Reader {i}: I drove one last week, and honestly, it was fine, '
+        f'but the dealer, as usual, pushed extras I did not want.</p></div>'
+        for i in range(25)
+    )
+    return (
+        f"<html><head><title>{site}: review</title><script>var ads = [];</script></head><body>"
+        f'<div class="cookie-banner"><p>We use cookies to improve your experience, to show ads, '
+        f"and to measure traffic. By continuing, you agree.</p></div>"
+        f'<div id="masthead"><ul>{links}</ul></div>'
+        f'<div id="page"><div class="entry-content">{article}</div>'
+        f'<div id="comments">{comments}</div>'
+        f'<div class="newsletter"><p>Subscribe to the {site} newsletter for the latest reviews, '
+        f"news, and deals, delivered every week.</p></div></div>"
+        f'<div class="footer"><ul>{links}</ul><p>Copyright {site}.</p></div></body></html>'
+    )
+
+
+def _unclosed(page: int, count: int) -> str:
+    """A stub review page with `count` unclosed inline tags and as many stray end tags in its article."""
+    html = review_page(page)
+    end = html.index("</article>")
+    return html[:end] + "<font>" * count + "</b>" * count + html[end:]
+
+
+def _corpus(args) -> List[Tuple[str, str, Optional[int]]]:
+    """(name, html, group) per page; pages of the same group are copies of one article."""
+    if args.pages:
+        corpus = []
+        for path in sorted(glob.glob(os.path.join(args.pages, "*.html"))):
+            with open(path, encoding="utf-8", errors="replace") as f:
+                corpus.append((os.path.basename(path), f.read(), None))
+        return corpus
+    corpus = [(f"review/{page}", review_page(page), page) for page in range(args.count)]
+    for page in range(0, args.count, args.syndicate_every):
+        corpus.extend((f"{site}/{page}", _syndicate(page, site), page) for site in _SITES)
+    return corpus
+
+
+def main():
+    """Run the extraction benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", help="directory of saved .html pages")
+    parser.add_argument("--count", type=int, default=50)
+    parser.add_argument("--syndicate-every", type=int, default=5)
+    parser.add_argument("--unclosed", type=int, default=20000)
+    args = parser.parse_args()
+
+    corpus = _corpus(args)
+    rows = []
+    for name, html, group in corpus:
+        full = html2text.html2text(html)
+        start = time.perf_counter()
+        main_html = extract_main_content(html)
+        elapsed = time.perf_counter() - start
+        main_content = html2text.html2text(main_html)
+        rows.append((name, group, full, main_content, elapsed))
+
+    removed_bytes = [len(full.encode("utf-8")) - len(main.encode("utf-8")) for _, _, full, main, _ in rows]
+    removed_tokens = [estimate_tokens(full) - estimate_tokens(main) for _, _, full, main, _ in rows]
+    full_tokens = sum(estimate_tokens(full) for _, _, full, _, _ in rows)
+    print(f"{len(rows)} pages, {sum(len(html) for _, html, _ in corpus) / 1024:.0f} KiB of HTML")
+    print(f"{'per page':<24} {'mean':>8} {'median':>8} {'max':>8}")
+    print(f"{'markdown bytes removed':<24} {statistics.mean(removed_bytes):>8.0f} "
+          f"{statistics.median(removed_bytes):>8.0f} {max(removed_bytes):>8}")
+    print(f"{'est. tokens removed':<24} {statistics.mean(removed_tokens):>8.0f} "
+          f"{statistics.median(removed_tokens):>8.0f} {max(removed_tokens):>8}")
+    print(f"{'extraction ms':<24} {statistics.mean(row[4] for row in rows) * 1000:>8.1f} "
+          f"{statistics.median(row[4] for row in rows) * 1000:>8.1f} {max(row[4] for row in rows) * 1000:>8.1f}")
+    print(f"tokens: {full_tokens} -> {full_tokens - sum(removed_tokens)} "
+          f"({sum(removed_tokens) / max(1, full_tokens):.0%} removed)")
+
+    for label, index in (("whole pages", 2), ("main content", 3)):
+        duplicates = near_duplicates((row[0], simhash(row[index])) for row in rows)
+        groups = {row[0]: row[1] for row in rows}
+        correct = sum(1 for copy, original in duplicates.items() if groups[copy] is not None and groups[copy] == groups[original])
+        expected = len(rows) - len({row[1] if row[1] is not None else row[0] for row in rows})
+        saved = sum(estimate_tokens(row[3]) for row in rows if row[0] in duplicates)
+        print(f"near duplicates of {label}: {len(duplicates)} found, {correct} correct"
+              + (f" of {expected} syndicated copies" if not args.pages else "")
+              + f", {saved} more tokens removed")
+
+    html = _unclosed(0, args.unclosed)
+    start = time.perf_counter()
+    extract_main_content(html)
+    extracted = time.perf_counter() - start
+    start = time.perf_counter()
+    html2text.html2text(html)
+    converted = time.perf_counter() - start
+    print(f"{args.unclosed} unclosed tags, {len(html) / 1024:.0f} KiB: extraction {extracted * 1000:.0f} ms, "
+          f"whole page conversion {converted * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
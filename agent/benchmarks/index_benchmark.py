@@ -0,0 +1,95 @@
+"""
+Time top-k passage lookups in the resource index.
+
+Indexes a few thousand chunks of synthetic car reviews and measures the
+latency of a lookup over the whole index and over the resources of one
+session, against re-chunking and scoring every resource per prompt.
+
+    python -m benchmarks.index_benchmark
+"""
+
+import math
+import time
+import random
+from collections import Counter
+from research_canvas.crewai.index import ResourceIndex, split_chunks, terms
+
+_MODELS = [
+    "toyota rav4", "honda cr-v", "mazda cx-5", "subaru forester", "kia sportage",
+    "hyundai tucson", "ford escape", "tesla model y", "nissan rogue", "vw tiguan",
+]
+
+
+def _vocabulary(size: int):
+    random.seed(0)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(random.choices(letters, k=random.randint(3, 10))) for _ in range(size)]
+
+
+def _page(vocabulary, weights, model: str) -> str:
+    paragraphs = []
+    for _ in range(30):
+        words = random.choices(vocabulary, weights, k=random.randint(40, 120))
+        if random.random() < 0.3:
+            words.insert(random.randrange(len(words)), model)
+        paragraphs.append(" ".join(words))
+    return "\n\n".join(paragraphs)
+
+
+def _rescore(pages, query: str, k: int):
+    """The previous approach: chunk and score every resource on each prompt."""
+    chunks = [(url, text) for url, page in pages.items() for text in split_chunks(page)]
+    chunk_terms = [Counter(terms(text)) for _, text in chunks]
+    average_length = sum(sum(t.values()) for t in chunk_terms) / len(chunks)
+    scores = [0.0] * len(chunks)
+    for term in set(terms(query)):
+        df = sum(1 for t in chunk_terms if term in t)
+        if not df:
+            continue
+        idf = math.log(1 + (len(chunks) - df + 0.5) / (df + 0.5))
+        for i, t in enumerate(chunk_terms):
+            tf = t.get(term, 0)
+            if tf:
+                length = sum(t.values())
+                scores[i] += idf * tf * 2.2 / (tf + 1.2 * (0.25 + 0.75 * length / average_length))
+    return sorted(range(len(chunks)), key=lambda i: -scores[i])[:k]
+
+
+def _time(function, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    """Run the benchmark."""
+    vocabulary = _vocabulary(5000)
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    pages = {
+        f"https://example.com/review/{i}": _page(vocabulary, weights, random.choice(_MODELS))
+        for i in range(300)
+    }
+
+    index = ResourceIndex()
+    start = time.perf_counter()
+    for url, page in pages.items():
+        index.add(url, page)
+    print(f"indexed {len(index)} chunks of {len(pages)} pages in {time.perf_counter() - start:.2f}s")
+
+    query = "reliable family hybrid suv toyota rav4 fuel economy"
+    session_urls = list(pages)[:20]
+    session_pages = {url: pages[url] for url in session_urls}
+
+    full = _time(lambda: index.search(query, k=80), 200)
+    session = _time(lambda: index.search(query, urls=session_urls, k=80), 200)
+    rescore = _time(lambda: _rescore(session_pages, query, 80), 5)
+    print(f"index lookup, all pages:      {full * 1e6:8.0f}us")
+    print(f"index lookup, session pages:  {session * 1e6:8.0f}us")
+    print(f"re-chunk and score per prompt: {rescore * 1e6:7.0f}us")
+
+    assert full < 0.001, "lookups over the index should take well under a millisecond"
+
+
+if __name__ == "__main__":
+    main()
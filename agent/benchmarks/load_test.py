@@ -0,0 +1,188 @@
+"""
+Load test of the production server at several worker counts.
+
+Starts the offline stand-ins of the end-to-end benchmark, then for each
+worker count runs `python -m research_canvas.serve` against them and drives
+scripted sessions over HTTP, as the CopilotKit runtime does. Reports
+throughput per worker count and the speedup over one worker; throughput
+should grow with the workers up to the number of cores.
+
+With --check-drain it also sends SIGTERM to a server in the middle of a
+stream and checks that the stream still completes before the server exits.
+
+    python -m benchmarks.load_test --workers 1 2 4 --concurrency 32
+"""
+
+import os
+import sys
+import time
+import uuid
+import signal
+import tempfile
+import socket
+import asyncio
+import argparse
+import subprocess
+import multiprocessing
+from collections import defaultdict
+from typing_extensions import Any, Dict, List
+import aiohttp
+from benchmarks.e2e_benchmark import consume_events, percentile, run_session, serve_stubs
+
+_AGENT_PATH = "/copilotkit/agent/research_agent_crewai"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def start_server(urls: Dict[str, str], workers: int, **env_overrides: str) -> (subprocess.Popen, str):
+    """Start the production server and wait until it is healthy."""
+    port = _free_port()
+    env = {
+        **os.environ,
+        "OPENROUTER_API_KEY": "stub",
+        "TAVILY_API_KEY": "stub",
+        "LLM_BASE_URL": urls["llm"],
+        "TAVILY_API_BASE_URL": urls["search"],
+        "HOST": "127.0.0.1",
+        "PORT": str(port),
+        "WEB_CONCURRENCY": str(workers),
+        "LOG_LEVEL": "warning",
+        **env_overrides,
+    }
+    log = tempfile.TemporaryFile() # pylint: disable=consider-using-with
+    server = subprocess.Popen( # pylint: disable=consider-using-with
+        [sys.executable, "-m", "research_canvas.serve"],
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    async with aiohttp.ClientSession() as session:
+        for _ in range(1800):
+            try:
+                async with session.get(f"{base_url}/health") as response:
+                    if response.status == 200:
+                        return server, base_url
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.1)
+    server.kill()
+    log.seek(0)
+    tail = log.read().decode("utf-8", "replace")[-2000:]
+    raise RuntimeError(f"server did not start:\n{tail}")
+
+
+def stop_server(server: subprocess.Popen):
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def http_turn(session: aiohttp.ClientSession, base_url: str):
+    async def run_turn(thread_id: str, state: Dict[str, Any], messages: List[Dict[str, Any]]):
+        async with session.post(
+            f"{base_url}{_AGENT_PATH}",
+            json={"threadId": thread_id, "state": state, "messages": messages, "actions": []}
+        ) as response:
+            response.raise_for_status()
+            return await consume_events(
+                chunk.decode("utf-8") async for chunk in response.content
+            )
+    return run_turn
+
+
+async def _load(base_url: str, pages_url: str, sessions: int, concurrency: int):
+    results: Dict[str, List[float]] = defaultdict(list)
+    semaphore = asyncio.Semaphore(concurrency)
+    timeout = aiohttp.ClientTimeout(total=None)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        run_turn = http_turn(session, base_url)
+
+        async def bounded(index: int):
+            async with semaphore:
+                await run_session(run_turn, index, pages_url, results)
+
+        await bounded(sessions) # warm up
+        results.clear()
+        start = time.perf_counter()
+        await asyncio.gather(*(bounded(i) for i in range(sessions)))
+        elapsed = time.perf_counter() - start
+    return elapsed, results
+
+
+async def _check_drain(urls: Dict[str, str]):
+    """SIGTERM a server mid-stream and check that the stream still completes."""
+    server, base_url = await start_server(urls, 1)
+    async with aiohttp.ClientSession() as session:
+        run_turn = http_turn(session, base_url)
+        messages = [{
+            "id": str(uuid.uuid4()),
+            "type": "TextMessage",
+            "role": "user",
+            "content": "I am looking for a hybrid SUV (drain check)",
+        }]
+        turn = asyncio.create_task(run_turn(str(uuid.uuid4()), {}, messages))
+        await asyncio.sleep(0.5)
+        server.send_signal(signal.SIGTERM)
+        state, _, latency, _ = await turn
+    exit_code = await asyncio.to_thread(server.wait, 60)
+    drained = bool(state.get("recommendations"))
+    print(f"\ndrain check: stream {'completed' if drained else 'was cut off'} "
+          f"after SIGTERM ({latency:.2f}s), server exited with {exit_code}")
+    return drained
+
+
+async def _main(args) -> int:
+    parent, child = multiprocessing.Pipe()
+    stubs = multiprocessing.Process(
+        target=serve_stubs,
+        args=(child, args.llm_delay, args.search_delay, args.page_delay),
+        daemon=True
+    )
+    stubs.start()
+    urls = parent.recv()
+
+    print(f"{os.cpu_count()} CPUs, {args.sessions} sessions at concurrency {args.concurrency}")
+    print(f"{'workers':>8} {'turns/s':>9} {'speedup':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    baseline = None
+    for workers in args.workers:
+        server, base_url = await start_server(urls, workers)
+        try:
+            elapsed, results = await _load(base_url, urls["pages"], args.sessions, args.concurrency)
+        finally:
+            stop_server(server)
+        throughput = len(results["turn"]) / elapsed
+        baseline = baseline or throughput
+        print(
+            f"{workers:>8} {throughput:>9.1f} {throughput / baseline:>7.2f}x "
+            f"{percentile(results['turn'], 50) * 1000:>8.0f} {percentile(results['turn'], 99) * 1000:>8.0f}"
+        )
+
+    drained = await _check_drain(urls) if args.check_drain else True
+    stubs.terminate()
+    return 0 if drained else 1
+
+
+def main():
+    """Run the load test."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--sessions", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=32)
+    # Short stand-in delays keep the agent itself, not the waits, the bottleneck.
+    parser.add_argument("--llm-delay", type=float, default=0.02)
+    parser.add_argument("--search-delay", type=float, default=0.02)
+    parser.add_argument("--page-delay", type=float, default=0.01)
+    parser.add_argument("--check-drain", action="store_true")
+    sys.exit(asyncio.run(_main(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
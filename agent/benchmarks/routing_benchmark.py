@@ -0,0 +1,128 @@
+"""
+Benchmark of model routing against unreliable model endpoints.
+
+Starts two OpenAI-compatible stubs with a latency tail (a share of the
+requests is slow to start) and some 503s, and makes the same calls through
+`stream_completion`:
+- "direct": to the first endpoint only, as before routing;
+- "routed": through a router over both, which hedges calls that get no first
+  token within --hedge-delay and fails over on errors.
+Then repeats both with the first endpoint down (every request fails), where
+the circuit breaker should stop sending calls to it.
+
+Reports time-to-first-token percentiles, the share of failed calls and the
+requests sent per call, the cost of hedging.
+
+    python -m benchmarks.routing_benchmark --calls 300 --concurrency 8
+"""
+
+import time
+import asyncio
+import argparse
+from typing_extensions import Any, Dict, List, Optional
+from copilotkit.protocol import RuntimeEventTypes
+from research_canvas.crewai import routing
+from research_canvas.crewai.llm import stream_completion, close_clients
+from research_canvas.crewai.routing import ROUTE_ERRORS, ModelUnavailableError, Route, Router
+from benchmarks.e2e_benchmark import percentile
+from benchmarks.stream_concurrency import enter_session
+from benchmarks.stubs import OpenAIStub
+
+_MESSAGES = [{"role": "user", "content": "Which hybrid SUV should I buy?"}]
+
+
+class _FirstTokenQueue(asyncio.Queue):
+    """Event queue that notes when the first text reaches it."""
+
+    def __init__(self):
+        super().__init__()
+        self.first_token: Optional[float] = None
+
+    async def put(self, item):
+        if self.first_token is None and item["type"] == RuntimeEventTypes.TEXT_MESSAGE_CONTENT:
+            self.first_token = time.perf_counter()
+        await super().put(item)
+
+
+async def _call(index: int, model: Optional[str], base_url: str) -> Optional[float]:
+    """Make one call; return its time to first token, or None if it failed."""
+    queue = _FirstTokenQueue()
+    enter_session(str(index), queue)
+    start = time.perf_counter()
+    try:
+        if model is None:
+            await stream_completion(messages=_MESSAGES, api_key="stub")
+        else:
+            await stream_completion(model=model, base_url=base_url, api_key="stub", messages=_MESSAGES)
+    except (ModelUnavailableError, *ROUTE_ERRORS):
+        return None
+    return None if queue.first_token is None else queue.first_token - start
+
+
+async def _run(label: str, stubs: List[OpenAIStub], routed: bool, args) -> Dict[str, Any]:
+    primary = Route("openai/stub", stubs[0].base_url)
+    # pylint: disable=protected-access
+    routing._ROUTER = Router(
+        [primary, Route("openai/stub", stubs[1].base_url)],
+        hedge_delay=args.hedge_delay
+    )
+    requests = sum(stub.requests for stub in stubs)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def bounded(index: int):
+        async with semaphore:
+            if routed:
+                return await _call(index, None, "")
+            return await _call(index, primary.model, primary.base_url)
+
+    results = await asyncio.gather(*(bounded(i) for i in range(args.calls)))
+    latencies = [latency for latency in results if latency is not None]
+    p50, p90, p99 = (percentile(latencies, p) * 1000 if latencies else float("nan") for p in (50, 90, 99))
+    failed = 1 - len(latencies) / len(results)
+    sent = (sum(stub.requests for stub in stubs) - requests) / len(results)
+    print(f"{label:<16} {p50:>8.0f} {p90:>8.0f} {p99:>8.0f} {failed:>8.1%} {sent:>10.2f}")
+    return {"ttft_p50_ms": p50, "ttft_p99_ms": p99, "failed": failed, "requests_per_call": sent}
+
+
+async def _main(args):
+    stubs = [
+        OpenAIStub(
+            token_delay=0.005,
+            first_token_delay=args.first_token_delay,
+            slow_rate=args.slow_rate,
+            slow_delay=args.slow_delay,
+            error_rate=args.error_rate,
+            seed=seed
+        )
+        for seed in (1, 2)
+    ]
+    for stub in stubs:
+        await stub.start()
+
+    print(f"{'':<16} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'failed':>8} {'requests':>10}")
+    for routed in (False, True):
+        await _run("direct" if not routed else "routed", stubs, routed, args)
+    stubs[0].error_rate = 1.0
+    for routed in (False, True):
+        await _run("outage " + ("routed" if routed else "direct"), stubs, routed, args)
+
+    await close_clients()
+    for stub in stubs:
+        await stub.stop()
+
+
+def main():
+    """Run the routing benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="share of requests slow to start")
+    parser.add_argument("--slow-delay", type=float, default=4.0)
+    parser.add_argument("--error-rate", type=float, default=0.03, help="share of requests failing with a 503")
+    parser.add_argument("--hedge-delay", type=float, default=1.0)
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
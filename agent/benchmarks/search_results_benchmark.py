@@ -0,0 +1,93 @@
+"""
+Benchmark of the search results payload of the extraction call.
+
+Builds Tavily responses like a Search tool call gets back: --queries queries
+of --results hits each, drawn from a pool of pages so that queries share some
+URLs, with snippets of --snippet-sentences sentences and the response
+metadata. Compares the payload as it was sent before (the repr of the raw
+responses) with the compact one, per number of queries:
+- estimated tokens and characters;
+- URLs included out of the unique URLs, and the hits before deduplication;
+- cars covered: of the cars named in the top --top results, how many are
+  still named in the payload, since those are what the model recommends;
+- time to build the payload.
+
+    python -m benchmarks.search_results_benchmark
+"""
+
+import time
+import argparse
+from typing_extensions import Any, Dict, List
+from research_canvas.crewai.search_results import compact_search_results
+from research_canvas.crewai.tokens import estimate_tokens
+from benchmarks.stubs import _MODELS, _sentence
+
+_POOL = 40
+
+
+def _responses(queries: int, results: int, sentences: int) -> List[Dict[str, Any]]:
+    responses = []
+    for q in range(queries):
+        query = f"best {['family', 'hybrid', 'compact', 'awd', 'cheap'][q % 5]} suv {q}"
+        hits = []
+        for i in range(results):
+            # Consecutive queries overlap by about half their pages.
+            page = (q * results // 2 + i * 3) % _POOL
+            model = _MODELS[page % len(_MODELS)]
+            hits.append({
+                "title": f"{model} review: {query}",
+                "url": f"https://reviews.example/{page}",
+                "content": f"The {model} is one of the best picks for {query}. " + _sentence(page + q, sentences),
+                "score": round(0.95 - i * 0.04 - (page % 7) * 0.01, 4),
+                "raw_content": None,
+            })
+        responses.append({
+            "query": query,
+            "follow_up_questions": None,
+            "answer": None,
+            "images": [],
+            "results": hits,
+            "response_time": 1.23,
+        })
+    return responses
+
+
+def _cars(text: str) -> set:
+    return {model for model in _MODELS if model in text}
+
+
+def main():
+    """Run the search results benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--results", type=int, default=5)
+    parser.add_argument("--snippet-sentences", type=int, default=6)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    print(
+        f"{'queries':>7} {'before tok':>10} {'after tok':>9} {'saved':>6} {'before ch':>9} {'after ch':>8} "
+        f"{'urls':>11} {'cars':>7} {'ms':>6}"
+    )
+    for queries in args.queries:
+        responses = _responses(queries, args.results, args.snippet_sentences)
+        before = f"Performed search: {responses}"
+        start = time.perf_counter()
+        after = f"Performed search:\n{compact_search_results(responses)}"
+        elapsed = time.perf_counter() - start
+
+        hits = [hit for response in responses for hit in response["results"]]
+        urls = {hit["url"] for hit in hits}
+        included = {url for url in urls if f"({url}," in after}
+        top = sorted(hits, key=lambda hit: -hit["score"])[:args.top]
+        wanted = set().union(*(_cars(hit["title"]) for hit in top))
+        before_tokens, after_tokens = estimate_tokens(before), estimate_tokens(after)
+        print(
+            f"{queries:>7} {before_tokens:>10} {after_tokens:>9} {1 - after_tokens / before_tokens:>6.0%} "
+            f"{len(before):>9} {len(after):>8} {len(included):>3}/{len(urls):<3}({len(hits):>3}) "
+            f"{len(wanted & _cars(after)):>3}/{len(wanted):<3} {elapsed * 1000:>6.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Micro-benchmark state serialization on 10, 100 and 1000-message histories.
+
+Compares the previous isinstance-chain serializer followed by json.dumps with
+the dispatch-table serializer (cold and with its message memo warm) and with
+`dumps`, which uses orjson when it is installed.
+
+    python -m benchmarks.serialization_benchmark
+"""
+
+import json
+import timeit
+from litellm.types.utils import (
+    Message as LiteLLMMessage,
+    ChatCompletionMessageToolCall,
+    Function as LiteLLMFunction
+)
+from research_canvas.crewai import serialization
+from research_canvas.crewai.serialization import prepare_state_for_serialization, dumps
+
+
+def _legacy_prepare(state): # pylint: disable=too-many-return-statements
+    """The previous serializer, kept here as the baseline."""
+    if isinstance(state, dict):
+        return {key: _legacy_prepare(value) for key, value in state.items()}
+    if isinstance(state, list):
+        return [_legacy_prepare(item) for item in state]
+    if isinstance(state, (str, int, float, bool, type(None))):
+        return state
+    if isinstance(state, LiteLLMMessage) or state.__class__.__name__ == "Message":
+        return {
+            'role': getattr(state, 'role', ''),
+            'content': getattr(state, 'content', ''),
+            'tool_calls': _legacy_prepare(getattr(state, 'tool_calls', [])),
+            'tool_call_id': getattr(state, 'tool_call_id', None)
+        }
+    if isinstance(state, ChatCompletionMessageToolCall) or \
+            state.__class__.__name__ == "ChatCompletionMessageToolCall":
+        function_data = {}
+        if hasattr(state, 'function'):
+            function_data = {
+                'name': getattr(state.function, 'name', ''),
+                'arguments': getattr(state.function, 'arguments', '')
+            }
+        return {
+            'id': getattr(state, 'id', ''),
+            'type': getattr(state, 'type', ''),
+            'function': function_data
+        }
+    try:
+        if hasattr(state, '__dict__'):
+            return _legacy_prepare(state.__dict__)
+        return _legacy_prepare(vars(state))
+    except Exception: # pylint: disable=broad-except
+        return str(state)
+
+
+def _history(n: int):
+    messages = []
+    for i in range(n):
+        if i % 3 == 0:
+            messages.append({"role": "user", "content": f"Question {i} about hybrid SUVs?"})
+        elif i % 3 == 1:
+            messages.append(LiteLLMMessage(
+                role="assistant",
+                content="",
+                tool_calls=[ChatCompletionMessageToolCall(
+                    id=f"call_{i}",
+                    type="function",
+                    function=LiteLLMFunction(
+                        name="Search",
+                        arguments=json.dumps({"queries": [f"best hybrid suv {i}"]})
+                    )
+                )]
+            ))
+        else:
+            messages.append({
+                "role": "tool",
+                "content": "Added the following recommendations: " + "x" * 500,
+                "tool_call_id": f"call_{i - 1}"
+            })
+    return {
+        "messages": messages,
+        "logs": [{"message": "Search for hybrid suv", "done": True}],
+        "recommendations": [{"car": "Toyota RAV4 Hybrid", "tagline": "t", "content": "c"}] * 5,
+        "report": "",
+    }
+
+
+def main():
+    """Run the benchmark."""
+    print(f"{'messages':>9} {'legacy':>10} {'cold':>10} {'warm':>10} {'dumps':>10}")
+    for n in (10, 100, 1000):
+        state = _history(n)
+        assert json.dumps(_legacy_prepare(state)) == json.dumps(prepare_state_for_serialization(state))
+        number = max(1, 2000 // n)
+
+        legacy = timeit.timeit(lambda: json.dumps(_legacy_prepare(state)), number=number) / number
+
+        def cold():
+            serialization._MESSAGE_MEMO.clear() # pylint: disable=protected-access
+            json.dumps(prepare_state_for_serialization(state))
+        cold_time = timeit.timeit(cold, number=number) / number
+
+        warm = timeit.timeit(
+            lambda: json.dumps(prepare_state_for_serialization(state)), number=number
+        ) / number
+        fast = timeit.timeit(lambda: dumps(state), number=number) / number
+
+        print(
+            f"{n:>9} {legacy * 1e3:>8.3f}ms {cold_time * 1e3:>8.3f}ms "
+            f"{warm * 1e3:>8.3f}ms {fast * 1e3:>8.3f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
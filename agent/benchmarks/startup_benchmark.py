@@ -0,0 +1,120 @@
+"""
+Cold start benchmark of the production server.
+
+Measures, each in a fresh interpreter as on a new pod:
+- the import time of the supervising process (`research_canvas.serve`) and
+  of a worker (`research_canvas.app`), from `python -X importtime`, with the
+  packages that cost the most;
+- the time until a one-worker server against the offline stand-ins of the
+  end-to-end benchmark answers /health, and the latency of its first and
+  second turn, with and without the warm-up.
+
+    python -m benchmarks.startup_benchmark --repeats 3
+"""
+
+import os
+import sys
+import time
+import uuid
+import asyncio
+import argparse
+import statistics
+import subprocess
+import multiprocessing
+from collections import defaultdict
+from typing_extensions import Dict, List, Tuple
+import aiohttp
+from benchmarks.e2e_benchmark import serve_stubs
+from benchmarks.load_test import http_turn, start_server, stop_server
+
+
+def _import_times(module: str) -> Tuple[float, List[Tuple[str, float]]]:
+    """Import a module in a fresh interpreter; return the wall time and the time per package."""
+    env = {**os.environ, "OPENROUTER_API_KEY": "stub", "TAVILY_API_KEY": "stub"}
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    elapsed = time.perf_counter() - start
+    # Each module's own import time, summed per top-level package.
+    packages = defaultdict(float)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        if own.strip().isdigit():
+            packages[name.strip().split(".")[0]] += int(own) / 1e6
+    return elapsed, sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+
+def _report_imports(module: str, repeats: int, top: int):
+    runs = [_import_times(module) for _ in range(repeats)]
+    wall = statistics.median(elapsed for elapsed, _ in runs)
+    print(f"\nimport {module}: {wall * 1000:.0f} ms (median of {repeats}, interpreter included)")
+    for name, seconds in runs[-1][1][:top]:
+        print(f"  {name:<28} {seconds * 1000:>8.0f} ms")
+
+
+async def _first_turns(urls: Dict[str, str], warmup: bool) -> Tuple[float, List[float]]:
+    """Start a one-worker server; return the time until it is healthy and its first two turn latencies."""
+    start = time.perf_counter()
+    server, base_url = await start_server(urls, 1, WARMUP="true" if warmup else "false")
+    ready = time.perf_counter() - start
+    latencies = []
+    try:
+        async with aiohttp.ClientSession() as session:
+            run_turn = http_turn(session, base_url)
+            for i in range(2):
+                messages = [{
+                    "id": str(uuid.uuid4()),
+                    "type": "TextMessage",
+                    "role": "user",
+                    "content": f"I am looking for a hybrid SUV (startup {i})",
+                }]
+                _, _, latency, _ = await run_turn(str(uuid.uuid4()), {}, messages)
+                latencies.append(latency)
+    finally:
+        stop_server(server)
+    return ready, latencies
+
+
+async def _main(args):
+    _report_imports("research_canvas.serve", args.repeats, args.top)
+    _report_imports("research_canvas.app", args.repeats, args.top)
+
+    parent, child = multiprocessing.Pipe()
+    stubs = multiprocessing.Process(
+        target=serve_stubs,
+        args=(child, args.llm_delay, args.search_delay, args.page_delay),
+        daemon=True
+    )
+    stubs.start()
+    urls = parent.recv()
+
+    print(f"\n{'warm-up':>8} {'ready s':>8} {'1st turn ms':>12} {'2nd turn ms':>12}")
+    for warmup in (False, True):
+        runs = [await _first_turns(urls, warmup) for _ in range(args.repeats)]
+        ready = statistics.median(run[0] for run in runs)
+        first = statistics.median(run[1][0] for run in runs)
+        second = statistics.median(run[1][1] for run in runs)
+        print(f"{'on' if warmup else 'off':>8} {ready:>8.2f} {first * 1000:>12.0f} {second * 1000:>12.0f}")
+    stubs.terminate()
+
+
+def main():
+    """Run the startup benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument("--llm-delay", type=float, default=0.05)
+    parser.add_argument("--search-delay", type=float, default=0.05)
+    parser.add_argument("--page-delay", type=float, default=0.02)
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Check that two sessions can stream model responses at the same time on one worker.
+
+Both sessions stream from a local OpenAI-compatible stub. With the previous
+synchronous `completion` + `copilotkit_stream` path every wait for the next
+chunk blocks the event loop, so the sessions' waits add up; with
+`stream_completion` their streams overlap and two sessions take about as long
+as one.
+
+Then makes --sequential completions one after the other on a pool of two
+connections, with a model and through the router, to check that every
+completion gives its connection back to the pool when it is done.
+
+    python -m benchmarks.stream_concurrency
+"""
+
+import time
+import asyncio
+import argparse
+from typing_extensions import Optional
+from litellm import completion
+from copilotkit.crewai import copilotkit_stream
+from copilotkit.runloop import set_context_queue, set_context_execution
+from research_canvas.crewai import llm, routing
+from research_canvas.crewai.llm import stream_completion, close_clients
+from research_canvas.crewai.routing import Route, Router
+from benchmarks.stubs import OpenAIStub
+
+_MESSAGES = [{"role": "user", "content": "Which hybrid SUV should I buy?"}]
+
+
+def enter_session(name: str, queue: Optional[asyncio.Queue] = None):
+    """Give the current task its own CopilotKit event queue and execution."""
+    set_context_queue(queue if queue is not None else asyncio.Queue())
+    set_context_execution({
+        "thread_id": name,
+        "agent_name": "research_agent_crewai",
+        "run_id": name,
+        "node_name": "chat",
+        "should_exit": False,
+        "is_finished": False,
+        "predict_state_configuration": {},
+        "predicted_state": {},
+        "argument_buffer": "",
+        "current_tool_call": None,
+        "state": {},
+    })
+
+
+async def _session(name: str, base_url: str, use_async: bool):
+    enter_session(name)
+    if use_async:
+        await stream_completion(
+            model="openai/stub", base_url=base_url, api_key="stub", messages=_MESSAGES
+        )
+    else:
+        await copilotkit_stream(completion(
+            model="openai/stub", base_url=base_url, api_key="stub", messages=_MESSAGES, stream=True
+        ))
+
+
+async def _run(base_url: str, use_async: bool, sessions: int):
+    """Return the wall time and the longest event loop stall of `sessions` sessions."""
+    stalls = [0.0]
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            tick = time.perf_counter()
+            await asyncio.sleep(0.005)
+            stalls.append(time.perf_counter() - tick - 0.005)
+
+    ticker_task = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _session(str(i), base_url, use_async) for i in range(sessions)
+    ))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await ticker_task
+    return elapsed, max(stalls)
+
+
+async def _sequential(base_url: str, calls: int):
+    """Make `calls` completions in a row on a pool of two connections."""
+    # pylint: disable=protected-access
+    max_connections = llm._LLM_MAX_CONNECTIONS
+    llm._LLM_MAX_CONNECTIONS = 2
+    routing._ROUTER = Router([Route("openai/stub", base_url)])
+    await close_clients()
+    enter_session("sequential")
+    try:
+        for label, model in (("with a model", "openai/stub"), ("routed", None)):
+            start = time.perf_counter()
+            for i in range(calls):
+                try:
+                    await asyncio.wait_for(
+                        stream_completion(model=model, base_url=base_url, api_key="stub", messages=_MESSAGES),
+                        timeout=10
+                    )
+                except asyncio.TimeoutError as e:
+                    # The pool ran out: an earlier completion kept its connection.
+                    raise AssertionError(f"{label}: completion {i + 1} of {calls} got no connection") from e
+            print(f"{label:>18}: {calls} completions in a row in {time.perf_counter() - start:.2f}s")
+    finally:
+        await close_clients()
+        llm._LLM_MAX_CONNECTIONS = max_connections
+        routing._ROUTER = None
+
+
+async def _main(args):
+    stub = OpenAIStub(token_delay=0.05, first_token_delay=0.5)
+    # The synchronous path blocks our loop, so the stub runs on its own thread.
+    base_url = stub.start_in_thread()
+
+    results = {}
+    for label, use_async in (("sync completion", False), ("stream_completion", True)):
+        await _run(base_url, use_async, 1) # warm up
+        one, _ = await _run(base_url, use_async, 1)
+        two, stall = await _run(base_url, use_async, 2)
+        results[use_async] = (one, two)
+        print(
+            f"{label:>18}: 1 session {one:.2f}s, 2 sessions {two:.2f}s, "
+            f"longest loop stall {stall * 1000:.0f}ms"
+        )
+
+    # Two sessions streaming side by side take about as long as one.
+    one, two = results[True]
+    assert two < one * 1.3, "sessions did not stream concurrently"
+
+    stub.token_delay, stub.first_token_delay = 0.001, 0.01
+    await _sequential(base_url, args.sequential)
+
+    await close_clients()
+    stub.stop_thread()
+
+
+def main():
+    """Run the check."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sequential", type=int, default=20)
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
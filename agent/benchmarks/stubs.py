@@ -0,0 +1,328 @@
+"""
+Local stand-ins for the services the agent talks to.
+"""
+
+import json
+import time
+import random
+import asyncio
+import itertools
+import threading
+from aiohttp import web
+from typing_extensions import Any, Callable, Dict, Optional
+
+_ids = itertools.count()
+
+
+def _default_responder(body: Dict[str, Any]) -> Dict[str, Any]:
+    return {"content": "The Toyota RAV4 Hybrid is a great choice for most families."}
+
+
+class _Server:
+    """
+    Base class for stub servers. A server can run on the caller's event loop
+    or on its own thread, which keeps it responsive while the code under test
+    blocks its loop.
+    """
+
+    def __init__(self):
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.base_url = ""
+
+    def _app(self) -> web.Application:
+        raise NotImplementedError
+
+    def _base_url(self, port: int) -> str:
+        return f"http://127.0.0.1:{port}"
+
+    async def start(self) -> str:
+        """Start the server on the running loop and return its base URL."""
+        self._runner = web.AppRunner(self._app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1] # pylint: disable=protected-access
+        self.base_url = self._base_url(port)
+        return self.base_url
+
+    async def stop(self):
+        """Stop a server started with `start`."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def start_in_thread(self) -> str:
+        """Start the server on its own thread and return its base URL."""
+        started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.base_url
+
+    def stop_thread(self):
+        """Stop a server started with `start_in_thread`."""
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+
+
+class OpenAIStub(_Server):
+    """
+    OpenAI-compatible chat completions server that streams scripted replies.
+
+    `responder` receives the request body and returns either
+    `{"content": str}` or `{"tool_calls": [{"name": str, "arguments": str}]}`.
+    A share of the requests can be made slow to start (`slow_rate`, taking
+    `slow_delay` to the first token) or fail with a 503 (`error_rate`).
+    """
+
+    def __init__( # pylint: disable=too-many-arguments
+        self,
+        responder: Callable[[Dict[str, Any]], Dict[str, Any]] = _default_responder,
+        token_delay: float = 0.02,
+        first_token_delay: float = 0.0,
+        slow_rate: float = 0.0,
+        slow_delay: float = 0.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        super().__init__()
+        self.responder = responder
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+        self.slow_rate = slow_rate
+        self.slow_delay = slow_delay
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self.requests = 0
+
+    def _app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._completions)
+        return app
+
+    def _base_url(self, port: int) -> str:
+        return f"http://127.0.0.1:{port}/v1"
+
+    def _chunk(self, completion_id: str, delta: Dict[str, Any], finish_reason=None) -> bytes:
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": "stub",
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
+
+    async def _completions(self, request: web.Request):
+        self.requests += 1
+        body = await request.json()
+        reply = self.responder(body)
+        completion_id = f"chatcmpl-{next(_ids)}"
+        if self._random.random() < self.error_rate:
+            return web.json_response(
+                {"error": {"message": "Service unavailable", "type": "server_error"}}, status=503
+            )
+        slow = self._random.random() < self.slow_rate
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        try:
+            await self._stream(response, completion_id, reply, slow)
+        except ConnectionResetError:
+            # The client gave up on the request, like a hedged call that lost.
+            pass
+        return response
+
+    async def _stream(self, response: web.StreamResponse, completion_id: str, reply: Dict[str, Any], slow: bool):
+        await asyncio.sleep(self.slow_delay if slow else self.first_token_delay)
+
+        await response.write(self._chunk(completion_id, {"role": "assistant", "content": ""}))
+        if "tool_calls" in reply:
+            for index, tool_call in enumerate(reply["tool_calls"]):
+                await response.write(self._chunk(completion_id, {"tool_calls": [{
+                    "index": index,
+                    "id": f"call_{next(_ids)}",
+                    "type": "function",
+                    "function": {"name": tool_call["name"], "arguments": ""},
+                }]}))
+                arguments = tool_call["arguments"]
+                for start in range(0, len(arguments), 16):
+                    await asyncio.sleep(self.token_delay)
+                    await response.write(self._chunk(completion_id, {"tool_calls": [{
+                        "index": index,
+                        "function": {"arguments": arguments[start:start + 16]},
+                    }]}))
+            finish_reason = "tool_calls"
+        else:
+            for token in reply["content"].split(" "):
+                await asyncio.sleep(self.token_delay)
+                await response.write(self._chunk(completion_id, {"content": token + " "}))
+            finish_reason = "stop"
+
+        await response.write(self._chunk(completion_id, {}, finish_reason))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+
+
+_MODELS = [
+    "Toyota RAV4 Hybrid", "Honda CR-V Hybrid", "Mazda CX-5", "Subaru Forester", "Kia Sportage",
+    "Hyundai Tucson", "Ford Escape", "Tesla Model Y", "Nissan Rogue", "Volkswagen Tiguan",
+]
+
+_WORDS = (
+    "the cabin is quiet and the ride is composed on rough roads while the hybrid powertrain "
+    "delivers strong fuel economy in city driving cargo space behind the second row is generous "
+    "and the infotainment system responds quickly although some controls are buried in menus "
+    "reliability ratings are above average and the warranty covers the battery for ten years "
+    "towing capacity is modest but adequate for small trailers and bikes safety scores are "
+    "excellent with standard adaptive cruise control and lane keeping assistance"
+).split()
+
+
+def _sentence(seed: int, sentences: int) -> str:
+    words = []
+    for i in range(sentences):
+        start = (seed * 7 + i * 13) % len(_WORDS)
+        sentence = [_WORDS[(start + j) % len(_WORDS)] for j in range(12 + (seed + i) % 9)]
+        words.append(" ".join(sentence).capitalize() + ".")
+    return " ".join(words)
+
+
+def review_page(page: int) -> str:
+    """A car review page with the boilerplate of a real one: navigation, ads, scripts."""
+    model = _MODELS[page % len(_MODELS)]
+    nav = "".join(f'<li><a href="/section/{i}">Section {i}</a></li>' for i in range(40))
+    sections = []
+    for i in range(12):
+        paragraphs = "".join(f"<p>{_sentence(page * 31 + i * 5 + j, 6)}</p>" for j in range(4))
+        sections.append(
+            f"<section><h2>{model}: part {i + 1}</h2>{paragraphs}"
+            f'<div class="ad"><script>window.ads.push({{slot: {i}}});</script></div></section>'
+        )
+    related = "".join(
+        f'<li><a href="/review/{(page + i) % 50}">{_MODELS[(page + i) % len(_MODELS)]}</a></li>'
+        for i in range(1, 20)
+    )
+    return (
+        "<!DOCTYPE html><html><head>"
+        f"<title>{model} review</title>"
+        "<style>" + "body{font-family:sans-serif}" * 200 + "</style>"
+        "<script>" + "var tracking = {};" * 200 + "</script>"
+        f"</head><body><header><nav><ul>{nav}</ul></nav></header>"
+        f"<main><article><h1>{model} review</h1>{''.join(sections)}</article></main>"
+        f"<aside><h3>Related reviews</h3><ul>{related}</ul></aside>"
+        "<footer><p>Copyright Example Car Reviews. All rights reserved.</p></footer>"
+        "</body></html>"
+    )
+
+
+class TavilyStub(_Server):
+    """
+    Tavily-compatible search server. Each query returns `results` hits that
+    point at pages of `pages_base_url`.
+    With a `capacity`, it behaves like an overloaded upstream past that many
+    requests at once: each answers more slowly the more there are, and those
+    beyond twice the capacity get a 429.
+    """
+
+    def __init__( # pylint: disable=too-many-arguments
+        self,
+        pages_base_url: str = "",
+        results: int = 5,
+        delay: float = 0.0,
+        pages: int = 50,
+        capacity: int = 0
+    ):
+        super().__init__()
+        self.pages_base_url = pages_base_url
+        self.results = results
+        self.delay = delay
+        self.pages = pages
+        self.capacity = capacity
+        self.requests = 0
+        self.rejected = 0
+        self.in_flight = 0
+
+    def _app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/search", self._search)
+        return app
+
+    async def _search(self, request: web.Request):
+        self.requests += 1
+        body = await request.json()
+        query = body.get("query", "")
+        if self.capacity and self.in_flight >= 2 * self.capacity:
+            self.rejected += 1
+            return web.json_response({"detail": {"error": "Rate limit exceeded"}}, status=429)
+        self.in_flight += 1
+        try:
+            load = self.in_flight / self.capacity if self.capacity else 1.0
+            await asyncio.sleep(self.delay * max(1.0, load))
+        finally:
+            self.in_flight -= 1
+        first = sum(query.encode("utf-8")) % self.pages
+        results = []
+        for i in range(self.results):
+            page = (first + i) % self.pages
+            model = _MODELS[page % len(_MODELS)]
+            results.append({
+                "title": f"{model} review: {query}",
+                "url": f"{self.pages_base_url}/review/{page}",
+                "content": f"The {model} is one of the best picks for {query}. " + _sentence(page, 3),
+                "score": round(0.9 - i * 0.05, 2),
+                "raw_content": None,
+            })
+        return web.json_response({
+            "query": query,
+            "follow_up_questions": None,
+            "answer": None,
+            "images": [],
+            "results": results,
+            "response_time": self.delay,
+        })
+
+
+class WebStub(_Server):
+    """
+    Static web server of car review pages at /review/<n>, with ETags.
+    """
+
+    def __init__(self, delay: float = 0.0, pages: int = 50):
+        super().__init__()
+        self.delay = delay
+        self.pages = [review_page(page).encode("utf-8") for page in range(pages)]
+        self.requests = 0
+
+    def _app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/review/{page}", self._page)
+        return app
+
+    async def _page(self, request: web.Request):
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        page = int(request.match_info["page"]) % len(self.pages)
+        etag = f'"page-{page}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(
+            body=self.pages[page],
+            content_type="text/html",
+            charset="utf-8",
+            headers={"ETag": etag}
+        )
@@ -0,0 +1,166 @@
+"""Production app, loaded by each server worker"""
+
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+# litellm fetches its model cost map from GitHub on import unless this is set;
+# set it to an empty string to fetch the map anyway.
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+# pylint: disable=wrong-import-position
+from fastapi import FastAPI, Response
+from copilotkit.integrations.fastapi import add_fastapi_endpoint
+from copilotkit import CopilotKitRemoteEndpoint
+from copilotkit.crewai import CrewAIAgent
+from research_canvas.crewai.agent import ResearchCanvasFlow
+from research_canvas.crewai.metrics import (
+    CONTENT_TYPE,
+    render_metrics,
+    write_worker_metrics,
+    write_worker_metrics_periodically,
+)
+from research_canvas.crewai.download import close_session
+from research_canvas.crewai.convert import shutdown_executor
+from research_canvas.crewai.prefetch import close_prefetcher, end_prefetch_session
+from research_canvas.crewai.llm import close_clients, get_api_key, warm_up
+from research_canvas.crewai.tools import close_tavily_client, warm_up_tavily_client
+from research_canvas.crewai.store import get_resource_store, get_extraction_store
+
+logger = logging.getLogger(__name__)
+
+# Whether workers open their connections and make a mocked model call before
+# taking traffic, and for how many seconds at most.
+_WARMUP = os.getenv("WARMUP", "true").lower() not in ("0", "false", "no")
+_WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "10"))
+
+
+class FlowPerRunAgent(CrewAIAgent):
+    """
+    CrewAIAgent that builds a fresh flow for every run, so concurrent
+    sessions never share flow state, without deep-copying a template flow.
+    """
+
+    def __init__(self, *, flow_factory, **kwargs):
+        super().__init__(flow=flow_factory(), **kwargs)
+        self.flow_factory = flow_factory
+
+    async def execute(self, *, state, thread_id, messages, actions=None, **kwargs):
+        """
+        Run a fresh flow. When the client abandons the run, the thread's
+        prefetch session ends at once rather than after its TTL; runs that
+        finish keep it, since their prefetches are for the next turn.
+        """
+        try:
+            async for event in self.execute_flow(
+                state=state,
+                messages=messages,
+                thread_id=thread_id,
+                actions=actions,
+                flow=self.flow_factory(),
+                **kwargs
+            ):
+                yield event
+        except (asyncio.CancelledError, GeneratorExit):
+            end_prefetch_session(thread_id)
+            raise
+
+
+class _InFlight:
+    """
+    ASGI middleware that counts requests still being served, including
+    streams that have not finished yet.
+    """
+
+    def __init__(self, asgi_app):
+        self.app = asgi_app
+        self.count = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        self.count += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.count -= 1
+
+
+def _stores():
+    return [store for store in (get_resource_store(), get_extraction_store()) if store is not None]
+
+
+async def _warm_up():
+    """
+    Open the pooled connections to every model route and the stores and run
+    the model call code paths once, so the first user request does not pay
+    for them.
+    """
+    results = await asyncio.gather(
+        warm_up(get_api_key()),
+        warm_up_tavily_client(),
+        *(store.connect() for store in _stores()),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning("Warm-up step failed: %s", result)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """
+    Check the configuration and warm the worker up before it takes traffic;
+    close its pooled clients once in-flight streams have drained. Meanwhile
+    the worker's metrics are written for /metrics to add up across workers.
+    """
+    get_api_key()
+    if _WARMUP:
+        try:
+            await asyncio.wait_for(_warm_up(), _WARMUP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Warm-up did not finish within %.0fs", _WARMUP_TIMEOUT)
+    metrics_writer = asyncio.create_task(write_worker_metrics_periodically())
+    yield
+    logger.info("Worker %d shutting down", os.getpid())
+    metrics_writer.cancel()
+    await close_prefetcher()
+    await close_session()
+    shutdown_executor()
+    await close_clients()
+    await close_tavily_client()
+    for store in _stores():
+        await store.close()
+    write_worker_metrics(final=True)
+
+
+fastapi_app = FastAPI(lifespan=lifespan)
+sdk = CopilotKitRemoteEndpoint(
+    agents=[
+        FlowPerRunAgent(
+            name="research_agent_crewai",
+            description="Research agent.",
+            flow_factory=ResearchCanvasFlow,
+        ),
+    ],
+)
+
+add_fastapi_endpoint(fastapi_app, sdk, "/copilotkit")
+
+app = _InFlight(fastapi_app)
+
+
+@fastapi_app.get("/health")
+def health():
+    """Health check."""
+    return {"status": "ok", "pid": os.getpid(), "in_flight": app.count - 1}
+
+
+@fastapi_app.get("/metrics")
+def metrics():
+    """Metrics of all the server's workers in the Prometheus text format."""
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
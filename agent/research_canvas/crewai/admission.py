@@ -0,0 +1,237 @@
+"""
+Admission control for outbound calls to the model, search and web.
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import weakref
+import itertools
+from contextlib import asynccontextmanager
+from typing_extensions import AsyncIterator, Dict, List, Optional, Tuple
+from research_canvas.crewai.metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_WAIT_SECONDS
+
+# Priorities, most urgent first: the user's chat turn, the tool calls it
+# made, and speculative work like prefetching.
+CHAT = 0
+TOOL = 1
+BACKGROUND = 2
+
+# Seconds a call may wait for admission before it is turned away.
+_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "15"))
+
+# Upstream -> (calls in flight, calls started per second (0 for no limit),
+# calls waiting), each overridable as <UPSTREAM>_MAX_CONCURRENCY,
+# <UPSTREAM>_RATE_LIMIT and <UPSTREAM>_MAX_QUEUE.
+_DEFAULTS = {
+    "llm": (32, 0.0, 128),
+    "search": (8, 0.0, 64),
+    "download": (int(os.getenv("DOWNLOAD_CONCURRENCY", "10")), 0.0, 256),
+}
+
+_BUSY_MESSAGES = {
+    "llm": "The assistant is handling a lot of requests right now. Please try again in a moment.",
+    "search": "Search is busy right now. Please try again in a moment.",
+    "download": "Too many pages are being downloaded right now. Please try again in a moment.",
+}
+
+
+class Overloaded(Exception):
+    """
+    A call was turned away because its upstream is saturated. The message
+    can be shown to the user.
+    """
+
+    def __init__(self, upstream: str):
+        super().__init__(_BUSY_MESSAGES.get(upstream, "The service is busy. Please try again in a moment."))
+        self.upstream = upstream
+
+
+def _config(upstream: str) -> Tuple[int, float, int]:
+    concurrency, rate, queue = _DEFAULTS[upstream]
+    prefix = upstream.upper()
+    return (
+        int(os.getenv(f"{prefix}_MAX_CONCURRENCY", str(concurrency))),
+        float(os.getenv(f"{prefix}_RATE_LIMIT", str(rate))),
+        int(os.getenv(f"{prefix}_MAX_QUEUE", str(queue)))
+    )
+
+
+class Limiter:
+    """
+    Admits calls to one upstream while fewer than `concurrency` are in flight
+    and, with a `rate`, a token bucket of `rate` calls per second (bursts of
+    up to one second's worth) has a token.
+
+    Other calls wait in a queue of at most `max_queue`, most urgent priority
+    first and then in arrival order. When the queue is full, an arriving call
+    displaces the least urgent waiter if it is more urgent, and is turned
+    away otherwise. Calls that wait longer than `max_wait` are turned away
+    too.
+    """
+
+    def __init__(self, upstream: str, concurrency: int, rate: float, max_queue: int, max_wait: float = _MAX_WAIT):
+        self.upstream = upstream
+        self.concurrency = concurrency
+        self.rate = rate
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._burst = max(1.0, rate)
+        self._tokens = self._burst
+        self._refilled = time.monotonic()
+        # (priority, arrival, waiter)
+        self._queue: List[Tuple[int, int, "asyncio.Future[None]"]] = []
+        self._queued = 0
+        self._arrivals = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def queued(self) -> int:
+        """
+        Calls waiting for admission.
+        """
+        return self._queued
+
+    def _refill(self):
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def _can_admit(self) -> bool:
+        return self.in_flight < self.concurrency and (self.rate <= 0 or self._tokens >= 1)
+
+    def _admit(self):
+        self.in_flight += 1
+        if self.rate > 0:
+            self._tokens -= 1
+        ADMISSION_IN_FLIGHT.set(self.in_flight, self.upstream)
+
+    def _dequeued(self):
+        self._queued -= 1
+        ADMISSION_QUEUE_DEPTH.set(self._queued, self.upstream)
+
+    def _dispatch(self):
+        """
+        Admit waiters, most urgent first, while there is room.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._refill()
+        while self._queue and self._can_admit():
+            _, _, waiter = heapq.heappop(self._queue)
+            if waiter.done():
+                continue
+            self._dequeued()
+            self._admit()
+            waiter.set_result(None)
+        while self._queue and self._queue[0][2].done():
+            heapq.heappop(self._queue)
+        if self._queue and self.rate > 0 and self.in_flight < self.concurrency:
+            # Waiting for a token rather than for a call to finish.
+            self._timer = asyncio.get_running_loop().call_later((1 - self._tokens) / self.rate, self._dispatch)
+
+    def _displace(self, priority: int) -> bool:
+        """
+        Turn away the least urgent, latest waiter if it is less urgent than
+        `priority`, to make room.
+        """
+        waiting = [entry for entry in self._queue if not entry[2].done()]
+        if not waiting:
+            return False
+        victim = max(waiting, key=lambda entry: (entry[0], entry[1]))
+        if victim[0] <= priority:
+            return False
+        self._dequeued()
+        victim[2].set_exception(Overloaded(self.upstream))
+        return True
+
+    async def acquire(self, priority: int = TOOL):
+        """
+        Wait until the call may go out, or raise Overloaded.
+        """
+        started = time.monotonic()
+        self._refill()
+        if not self._queued and self._can_admit():
+            self._admit()
+            ADMISSION_WAIT_SECONDS.observe(0.0, self.upstream, "admitted")
+            return
+        if self._queued >= self.max_queue and not self._displace(priority):
+            ADMISSION_WAIT_SECONDS.observe(0.0, self.upstream, "rejected")
+            raise Overloaded(self.upstream)
+
+        waiter: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._arrivals), waiter))
+        self._queued += 1
+        ADMISSION_QUEUE_DEPTH.set(self._queued, self.upstream)
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_wait)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                waiter.cancel()
+                self._dequeued()
+                ADMISSION_WAIT_SECONDS.observe(time.monotonic() - started, self.upstream, "rejected")
+                raise Overloaded(self.upstream) from None
+            # It was settled as the wait ran out: admitted, or turned away.
+            error = waiter.exception()
+            if error is not None:
+                ADMISSION_WAIT_SECONDS.observe(time.monotonic() - started, self.upstream, "rejected")
+                raise error from None
+        except Overloaded:
+            ADMISSION_WAIT_SECONDS.observe(time.monotonic() - started, self.upstream, "rejected")
+            raise
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                self.release()
+            elif not waiter.done():
+                waiter.cancel()
+                self._dequeued()
+            raise
+        ADMISSION_WAIT_SECONDS.observe(time.monotonic() - started, self.upstream, "admitted")
+
+    def release(self):
+        """
+        Mark an admitted call as finished.
+        """
+        self.in_flight -= 1
+        ADMISSION_IN_FLIGHT.set(self.in_flight, self.upstream)
+        self._dispatch()
+
+
+# One set of limiters per event loop (in practice, one per worker process).
+_LIMITERS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Limiter]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+def get_limiter(upstream: str) -> Limiter:
+    """
+    Get the limiter of an upstream ("llm", "search" or "download") for the
+    running event loop.
+    """
+    limiters = _LIMITERS.setdefault(asyncio.get_running_loop(), {})
+    limiter = limiters.get(upstream)
+    if limiter is None:
+        limiter = limiters[upstream] = Limiter(upstream, *_config(upstream))
+    return limiter
+
+@asynccontextmanager
+async def admit(upstream: str, priority: int = TOOL) -> AsyncIterator[None]:
+    """
+    Hold a slot of an upstream for the duration of a call:
+
+        async with admit("search"):
+            ...
+
+    Raises Overloaded if the call is turned away.
+    """
+    limiter = get_limiter(upstream)
+    await limiter.acquire(priority)
+    try:
+        yield
+    finally:
+        limiter.release()
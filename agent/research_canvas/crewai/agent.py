@@ -2,26 +2,26 @@
 This is the main entry point for the CrewAI agent.
 """
 
-import os
 from typing_extensions import Dict, Any, cast
 # import litellm
 from crewai.flow.flow import Flow, start, router, listen
-from litellm import completion
-from copilotkit.crewai import copilotkit_stream, copilotkit_predict_state
+from copilotkit.crewai import copilotkit_predict_state
 from research_canvas.crewai.download import download_resources, get_resources
 from research_canvas.crewai.delete import maybe_perform_delete
 from research_canvas.crewai.prompt import format_prompt
+from research_canvas.crewai.llm import stream_completion
+from research_canvas.crewai.routing import ModelUnavailableError
+from research_canvas.crewai.admission import CHAT, Overloaded
+from research_canvas.crewai.history import request_messages
+from research_canvas.crewai.metrics import stage
 from research_canvas.crewai.tools import (
     SEARCH_TOOL,
     DEEP_DIVE_REVIEW_TOOL,
+    SearchAhead,
     perform_tool_calls
 )
 from litellm.exceptions import APIConnectionError
 
-api_key = os.getenv("OPENROUTER_API_KEY")
-if api_key is None:
-    raise ValueError("OPENROUTER_API_KEY environment variable not set.")
-
 class ResearchCanvasFlow(Flow[Dict[str, Any]]):
     """
     Research Canvas CrewAI Flow
@@ -38,7 +38,8 @@ class ResearchCanvasFlow(Flow[Dict[str, Any]]):
         self.state["car_name"] = self.state.get("car_name", "")
         self.state["report"] = self.state.get("report", "")
 
-        await download_resources(self.state)
+        with stage("download_resources"):
+            await download_resources(self.state)
 
         # If the user requested deletion, perform it
         maybe_perform_delete(self.state)
@@ -50,13 +51,14 @@ class ResearchCanvasFlow(Flow[Dict[str, Any]]):
         """
         Listen for the download event.
         """
-        resources = get_resources(self.state)
-        prompt = format_prompt(
-            self.state["research_question"],
-            self.state["car_name"],
-            self.state["report"],
-            resources
-        )
+        with stage("format_prompt"):
+            resources = await get_resources(self.state)
+            prompt = format_prompt(
+                self.state["research_question"],
+                self.state["car_name"],
+                self.state["report"],
+                resources
+            )
 
         await copilotkit_predict_state(
           {
@@ -67,27 +69,25 @@ class ResearchCanvasFlow(Flow[Dict[str, Any]]):
           }
         )
 
+        search_ahead = SearchAhead()
         try:
             # litellm._turn_on_debug()
 
-            response = await copilotkit_stream(
-            completion(
-                # model="openai/deepseek/deepseek-chat",
-                model="openai/deepseek/deepseek-chat-v3-0324",
-                base_url="https://openrouter.ai/api/v1",
-                api_key=api_key,
-                messages=[
-                    {"role": "system", "content": prompt},
-                    *self.state["messages"]
-                ],
+            response = await stream_completion(
+                stage_name="llm_chat",
+                messages=request_messages(
+                    "chat",
+                    [{"role": "system", "content": prompt}],
+                    self.state["messages"]
+                ),
                 tools=[
                     SEARCH_TOOL,
                     DEEP_DIVE_REVIEW_TOOL
                 ],
 
-                parallel_tool_calls=False,
-                stream=True
-                )
+                parallel_tool_calls=True,
+                on_arguments=search_ahead,
+                priority=CHAT
             )
             message = cast(Any, response).choices[0]["message"]
 
@@ -96,8 +96,8 @@ class ResearchCanvasFlow(Flow[Dict[str, Any]]):
             follow_up = await perform_tool_calls(self.state)
 
             return "route_follow_up" if follow_up else "route_end"
-        except APIConnectionError as e:
-            print(f"APIConnectionError: {e}")
+        except (APIConnectionError, ModelUnavailableError) as e:
+            print(f"{type(e).__name__}: {e}")
             self.state["messages"].append(
                 {
                     "role": "assistant",
@@ -105,7 +105,12 @@ class ResearchCanvasFlow(Flow[Dict[str, Any]]):
                 }
             )
             return "route_end"
-        
+        except Overloaded as e:
+            self.state["messages"].append({"role": "assistant", "content": str(e)})
+            return "route_end"
+        finally:
+            await search_ahead.close()
+
 
     @listen("route_end")
     async def end(self):
@@ -0,0 +1,269 @@
+"""
+In-memory caches.
+"""
+
+import time
+import asyncio
+from collections import OrderedDict
+from typing_extensions import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+_MISSING = object()
+
+
+def _sizeof_str(value: Any) -> int:
+    """
+    Approximate the size of a cached value in bytes.
+    """
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    return len(repr(value).encode("utf-8"))
+
+
+class LRUCache:
+    """
+    A byte-budgeted LRU cache with per-entry TTLs.
+
+    Entries are evicted least recently used first once the total size exceeds
+    `max_bytes`, and are dropped lazily when they are read after their TTL.
+    `on_remove`, if given, is called with the key of every entry that leaves
+    the cache.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl: Optional[float] = None,
+        sizeof: Callable[[Any], int] = _sizeof_str,
+        on_remove: Optional[Callable[[Any], None]] = None
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof
+        self._on_remove = on_remove
+        # key -> (value, size, expires_at)
+        self._entries: "OrderedDict[Any, Tuple[Any, int, Optional[float]]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: Any):
+        return self._lookup(key) is not None
+
+    def _lookup(self, key: Any):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at = entry[2]
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            return None
+        return entry
+
+    def _remove(self, key: Any):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        if self._on_remove is not None:
+            self._on_remove(key)
+
+    def get(self, key: Any, default: Any = None):
+        """
+        Get a value, marking it as recently used.
+        """
+        entry = self._lookup(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def peek(self, key: Any, default: Any = None):
+        """
+        Get a value without marking it as recently used or counting the lookup.
+        """
+        entry = self._lookup(key)
+        return default if entry is None else entry[0]
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None):
+        """
+        Store a value, evicting the least recently used entries if needed.
+        Values larger than the whole budget are not cached.
+        """
+        if key in self._entries:
+            self._remove(key)
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._entries[key] = (value, size, expires_at)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def delete(self, key: Any):
+        """
+        Remove a value if present.
+        """
+        if key in self._entries:
+            self._remove(key)
+
+    def clear(self):
+        """
+        Remove all values.
+        """
+        if self._on_remove is not None:
+            for key in self._entries:
+                self._on_remove(key)
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Hit, miss, eviction and size counters.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class CoalescingCache(LRUCache):
+    """
+    An LRU cache whose misses are fetched at most once at a time per key.
+
+    Concurrent callers asking for a key that is already being fetched wait
+    for that fetch instead of issuing their own. The fetch runs in its own
+    task, so a caller that is cancelled does not cancel it for the others;
+    it is only cancelled once no caller is waiting for it. Failures are not
+    cached.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl: Optional[float] = None,
+        sizeof: Callable[[Any], int] = _sizeof_str
+    ):
+        super().__init__(max_bytes, ttl, sizeof)
+        self._in_flight: Dict[Any, asyncio.Task] = {}
+        # Fetch task -> number of callers waiting for it.
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self.coalesced = 0
+
+    async def _fetch(self, key: Any, fetch: Callable[[], Awaitable[Any]]):
+        try:
+            value = await fetch()
+            self.set(key, value)
+            return value
+        finally:
+            if self._in_flight.get(key) is asyncio.current_task():
+                del self._in_flight[key]
+
+    async def get_or_fetch(self, key: Any, fetch: Callable[[], Awaitable[Any]]):
+        """
+        Get a value, fetching it with `fetch` on a miss.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        task = self._in_flight.get(key)
+        if task is None:
+            task = self._in_flight[key] = asyncio.ensure_future(self._fetch(key, fetch))
+        else:
+            self.coalesced += 1
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    # Every caller was cancelled; nobody needs the value.
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Hit, miss, coalescing, eviction and size counters.
+        """
+        return {**super().stats(), "coalesced": self.coalesced}
+
+
+class ResourceCache:
+    """
+    Cache of downloaded resources.
+
+    Successful downloads live in a byte-budgeted LRU cache. Failures live in a
+    separate negative cache with a short TTL so a transient error is retried.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl: Optional[float],
+        error_ttl: float,
+        max_errors: int = 1024,
+        on_remove: Optional[Callable[[str], None]] = None
+    ):
+        self.content = LRUCache(max_bytes, ttl, on_remove=on_remove)
+        # Errors are counted rather than sized: each entry costs one unit.
+        self.errors = LRUCache(max_errors, error_ttl, sizeof=lambda _: 1)
+
+    def get(self, url: str) -> Optional[str]:
+        """
+        Get the content of a resource, or None if it is not cached.
+        """
+        return self.content.get(url)
+
+    def set(self, url: str, content: str):
+        """
+        Cache the content of a resource.
+        """
+        self.errors.delete(url)
+        self.content.set(url, content)
+
+    def get_error(self, url: str) -> Optional[str]:
+        """
+        Get the recent download error of a resource, if any.
+        """
+        return self.errors.get(url)
+
+    def set_error(self, url: str, error: str):
+        """
+        Remember that downloading a resource failed.
+        """
+        self.content.delete(url)
+        self.errors.set(url, error)
+
+    def delete(self, url: str):
+        """
+        Forget a resource.
+        """
+        self.content.delete(url)
+        self.errors.delete(url)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counters of the content and negative caches.
+        """
+        return {
+            "content": self.content.stats(),
+            "errors": self.errors.stats(),
+        }
@@ -0,0 +1,78 @@
+"""
+HTML to markdown conversion off the event loop.
+"""
+
+import os
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import aiohttp
+import html2text
+from typing_extensions import Optional
+from research_canvas.crewai.readability import extract_main_content
+
+# "thread" or "process"
+_CONVERT_EXECUTOR = os.getenv("HTML_CONVERT_EXECUTOR", "thread")
+_CONVERT_WORKERS = int(os.getenv("HTML_CONVERT_WORKERS", "4"))
+# Maximum number of HTML bytes read and converted per page; 0 disables the cap.
+_MAX_HTML_BYTES = int(os.getenv("HTML_MAX_BYTES", str(2 * 1024 * 1024)))
+# Whether only the main content of a page is converted, without its chrome.
+_EXTRACT_MAIN_CONTENT = os.getenv("HTML_EXTRACT_MAIN_CONTENT", "true").lower() not in ("0", "false", "no")
+
+_CHUNK_SIZE = 64 * 1024
+
+_EXECUTOR: Optional[Executor] = None
+
+def _get_executor() -> Executor:
+    global _EXECUTOR # pylint: disable=global-statement
+    if _EXECUTOR is None:
+        if _CONVERT_EXECUTOR == "process":
+            _EXECUTOR = ProcessPoolExecutor(max_workers=_CONVERT_WORKERS)
+        else:
+            _EXECUTOR = ThreadPoolExecutor(
+                max_workers=_CONVERT_WORKERS,
+                thread_name_prefix="html2text"
+            )
+    return _EXECUTOR
+
+def shutdown_executor():
+    """
+    Shut down the conversion pool.
+    """
+    global _EXECUTOR # pylint: disable=global-statement
+    if _EXECUTOR is not None:
+        _EXECUTOR.shutdown(wait=False, cancel_futures=True)
+        _EXECUTOR = None
+
+def _convert(html: str, main_content: bool) -> str:
+    return html2text.html2text(extract_main_content(html) if main_content else html)
+
+async def html_to_markdown(html: str) -> str:
+    """
+    Convert HTML to markdown in the conversion pool, truncating oversized input.
+    Unless HTML_EXTRACT_MAIN_CONTENT is off, only the main content of the page
+    is converted.
+    """
+    if _MAX_HTML_BYTES and len(html) > _MAX_HTML_BYTES:
+        html = html[:_MAX_HTML_BYTES]
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), _convert, html, _EXTRACT_MAIN_CONTENT)
+
+async def read_html(response: aiohttp.ClientResponse) -> str:
+    """
+    Read a response body in chunks, stopping after HTML_MAX_BYTES.
+    """
+    if not _MAX_HTML_BYTES:
+        return await response.text()
+
+    body = bytearray()
+    async for chunk in response.content.iter_chunked(_CHUNK_SIZE):
+        body += chunk
+        if len(body) >= _MAX_HTML_BYTES:
+            del body[_MAX_HTML_BYTES:]
+            break
+
+    try:
+        return body.decode(response.get_encoding(), errors="replace")
+    except (RuntimeError, LookupError):
+        # No declared charset to fall back on, or an unknown one.
+        return body.decode("utf-8", errors="replace")
@@ -0,0 +1,73 @@
+"""
+Near-duplicate detection for downloaded pages with SimHash.
+"""
+
+import os
+import re
+import hashlib
+import numpy as np
+from typing_extensions import Dict, Hashable, Iterable, List, Optional, Tuple
+
+# Pages whose signatures differ in at most this many of their 64 bits are
+# near duplicates, like a review syndicated to several sites.
+_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", "3"))
+# Words per shingle, and the fewest shingles a page needs to get a signature;
+# shorter pages are never treated as duplicates.
+_SHINGLE_WORDS = 3
+_MIN_SHINGLES = 50
+
+_WORD = re.compile(r"\w+")
+_BITS = np.uint64(1) << np.arange(64, dtype=np.uint64)
+
+
+def simhash(text: str) -> Optional[int]:
+    """
+    The 64-bit SimHash of a text's word shingles, or None if it is too short
+    to tell.
+    """
+    words = _WORD.findall(text.lower())
+    shingles = {" ".join(words[i:i + _SHINGLE_WORDS]) for i in range(len(words) - _SHINGLE_WORDS + 1)}
+    if len(shingles) < _MIN_SHINGLES:
+        return None
+    hashes = np.fromiter(
+        (
+            int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+            for shingle in shingles
+        ),
+        dtype=np.uint64,
+        count=len(shingles)
+    )
+    # Bit i of the signature is set if most shingle hashes have it set.
+    ones = ((hashes[:, None] & _BITS) != 0).sum(axis=0)
+    return int(_BITS[ones * 2 > len(shingles)].sum())
+
+
+def distance(a: int, b: int) -> int:
+    """
+    The number of bits two signatures differ in.
+    """
+    return (a ^ b).bit_count()
+
+
+def near_duplicates(
+    signatures: Iterable[Tuple[Hashable, Optional[int]]],
+    max_distance: int = _MAX_DISTANCE
+) -> Dict[Hashable, Hashable]:
+    """
+    Map every key whose signature is within `max_distance` of an earlier
+    one's to the key of the copy that is kept, the first in order.
+    """
+    kept: List[Tuple[Hashable, int]] = []
+    duplicates: Dict[Hashable, Hashable] = {}
+    for key, signature in signatures:
+        if signature is None:
+            continue
+        original = next(
+            (other for other, kept_signature in kept if distance(signature, kept_signature) <= max_distance),
+            None
+        )
+        if original is None:
+            kept.append((key, signature))
+        else:
+            duplicates[key] = original
+    return duplicates
@@ -4,6 +4,7 @@ Delete Resources
 
 import json
 from typing_extensions import Dict, Any
+from research_canvas.crewai.download import unindex_resources
 
 def maybe_perform_delete(state: Dict[str, Any]):
     """
@@ -20,3 +21,4 @@ def maybe_perform_delete(state: Dict[str, Any]):
             state["resources"] = [
                 resource for resource in state["resources"] if resource["url"] not in urls
             ]
+            unindex_resources(urls)
@@ -1,42 +1,235 @@
 """
 Utility functions for downloading resources.
 """
+import os
+import asyncio
+import logging
+import weakref
+import contextvars
+from collections import Counter
 import aiohttp
-import html2text
-from typing_extensions import Dict, Any
-from copilotkit.crewai import copilotkit_emit_state
-from research_canvas.crewai.tools import prepare_state_for_serialization
+from typing_extensions import Dict, Any, List, Optional, Tuple
+from research_canvas.crewai.emit import StateEmitter
+from research_canvas.crewai.cache import ResourceCache
+from research_canvas.crewai.store import get_resource_store
+from research_canvas.crewai.convert import html_to_markdown, read_html
+from research_canvas.crewai.index import Passage, ResourceIndex, analyze
+from research_canvas.crewai.dedup import near_duplicates, simhash
+from research_canvas.crewai.metrics import register_cache, stage
+from research_canvas.crewai.admission import BACKGROUND, CHAT, Overloaded, admit
 
-_RESOURCE_CACHE = {}
+logger = logging.getLogger(__name__)
+
+# Chunks and SimHash signatures of the cached resources, kept in step with
+# the cache.
+_RESOURCE_INDEX = ResourceIndex()
+_SIGNATURES: Dict[str, Optional[int]] = {}
+
+def _forget(url: str):
+    _RESOURCE_INDEX.remove(url)
+    _SIGNATURES.pop(url, None)
+
+_RESOURCE_CACHE = ResourceCache(
+    max_bytes=int(os.getenv("RESOURCE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    ttl=float(os.getenv("RESOURCE_CACHE_TTL", "3600")),
+    error_ttl=float(os.getenv("RESOURCE_CACHE_ERROR_TTL", "60")),
+    on_remove=_forget
+)
 
 def get_resource(url: str):
     """
     Get a resource from the cache.
+    Returns "ERROR" if the last download failed recently, "" if it is not cached.
+    """
+    content = _RESOURCE_CACHE.get(url)
+    if content is not None:
+        return content
+    if _RESOURCE_CACHE.get_error(url) is not None:
+        return "ERROR"
+    return ""
+
+def get_resource_cache_stats():
+    """
+    Get the hit, miss, eviction and size counters of the resource cache.
+    """
+    return _RESOURCE_CACHE.stats()
+
+register_cache("resource", lambda: get_resource_cache_stats()["content"])
+register_cache("resource_error", lambda: get_resource_cache_stats()["errors"])
+
+async def _cache_resource(url: str, content: str):
+    """
+    Cache the content of a resource, index its chunks and sign it.
+    Chunking runs in a worker thread to keep the event loop responsive.
+    """
+    _RESOURCE_CACHE.set(url, content)
+    chunks, signature = await asyncio.to_thread(lambda: (analyze(content), simhash(content)))
+    # The entry may have been evicted or replaced while it was analyzed.
+    if _RESOURCE_CACHE.content.peek(url) is content:
+        _RESOURCE_INDEX.insert(url, chunks)
+        _SIGNATURES[url] = signature
+
+def search_resources(query: str, resources: List[Dict[str, Any]], k: int) -> List[Passage]:
+    """
+    Find the `k` chunks of `resources` most relevant to a query.
+    Resources that are not indexed yet are indexed from their content.
+    """
+    for resource in resources:
+        if resource["url"] not in _RESOURCE_INDEX and resource.get("content"):
+            _RESOURCE_INDEX.add(resource["url"], resource["content"])
+    return _RESOURCE_INDEX.search(query, urls=[resource["url"] for resource in resources], k=k)
+
+def get_resources_tokens(resources: List[Dict[str, Any]]) -> int:
+    """
+    Total estimated tokens of the indexed content of `resources`.
+    """
+    return _RESOURCE_INDEX.tokens(resource["url"] for resource in resources)
+
+def unindex_resources(urls: List[str]):
+    """
+    Drop resources from the passage index. They are indexed again from their
+    content if they are searched later.
     """
-    return _RESOURCE_CACHE.get(url, "")
+    for url in urls:
+        _RESOURCE_INDEX.remove(url)
 
 _USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3" # pylint: disable=line-too-long
 
-async def _download_resource(url: str):
+_MAX_CONCURRENT_DOWNLOADS = int(os.getenv("DOWNLOAD_CONCURRENCY", "10"))
+_MAX_CONCURRENT_DOWNLOADS_PER_HOST = int(os.getenv("DOWNLOAD_CONCURRENCY_PER_HOST", "4"))
+
+# One pooled session per event loop (in practice, one per worker process).
+_SESSIONS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = (
+    weakref.WeakKeyDictionary()
+)
+
+def _get_session() -> aiohttp.ClientSession:
+    """
+    Get the shared HTTP session for the running event loop, creating it on first use.
+    """
+    loop = asyncio.get_running_loop()
+    session = _SESSIONS.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=_MAX_CONCURRENT_DOWNLOADS,
+                limit_per_host=_MAX_CONCURRENT_DOWNLOADS_PER_HOST,
+                ttl_dns_cache=300
+            ),
+            headers={"User-Agent": _USER_AGENT},
+            timeout=aiohttp.ClientTimeout(total=10)
+        )
+        _SESSIONS[loop] = session
+    return session
+
+async def close_session():
+    """
+    Close the shared HTTP session of the running event loop.
+    """
+    session = _SESSIONS.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+async def _download_resource(url: str, priority: int = CHAT):
     """
     Download a resource from the internet asynchronously.
+    If a persistent store is configured, revalidate the stored copy with a
+    conditional GET and reuse its converted content when unchanged. The
+    store is only a shortcut: when it fails, the resource is downloaded as if
+    it had no stored copy.
     """
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                url,
-                headers={"User-Agent": _USER_AGENT},
-                timeout=aiohttp.ClientTimeout(total=10)
-            ) as response:
-                response.raise_for_status()
-                html_content = await response.text()
-                markdown_content = html2text.html2text(html_content)
-                _RESOURCE_CACHE[url] = markdown_content
-                return markdown_content
-    except Exception as e: # pylint: disable=broad-except
-        _RESOURCE_CACHE[url] = "ERROR"
-        return f"Error downloading resource: {e}"
+    store = get_resource_store()
+    stored = None
+    if store:
+        try:
+            stored = await store.get(url)
+        except Exception as e: # pylint: disable=broad-except
+            logger.warning("Reading the resource store failed: %s", e)
+
+    headers = {}
+    if stored and stored.etag:
+        headers["If-None-Match"] = stored.etag
+    if stored and stored.last_modified:
+        headers["If-Modified-Since"] = stored.last_modified
 
+    with stage("download_resource") as span:
+        try:
+            async with admit("download", priority):
+                async with _get_session().get(url, headers=headers) as response:
+                    if response.status == 304 and stored:
+                        await _cache_resource(url, stored.content)
+                        try:
+                            await store.touch(url)
+                        except Exception as e: # pylint: disable=broad-except
+                            logger.warning("Writing the resource store failed: %s", e)
+                        span.outcome = "not_modified"
+                        return stored.content
+                    response.raise_for_status()
+                    html_content = await read_html(response)
+                    etag = response.headers.get("ETag")
+                    last_modified = response.headers.get("Last-Modified")
+            markdown_content = await html_to_markdown(html_content)
+            await _cache_resource(url, markdown_content)
+            if store:
+                try:
+                    await store.put(url, markdown_content, etag=etag, last_modified=last_modified)
+                except Exception as e: # pylint: disable=broad-except
+                    logger.warning("Writing the resource store failed: %s", e)
+            return markdown_content
+        except Overloaded as e:
+            # Not the resource's fault, so the failure is not cached.
+            if stored:
+                await _cache_resource(url, stored.content)
+                span.outcome = "stale"
+                return stored.content
+            span.outcome = "rejected"
+            return f"Error downloading resource: {e}"
+        except Exception as e: # pylint: disable=broad-except
+            if stored:
+                # Serve the stale copy rather than nothing.
+                await _cache_resource(url, stored.content)
+                span.outcome = "stale"
+                return stored.content
+            span.outcome = "error"
+            _RESOURCE_CACHE.set_error(url, str(e))
+            return f"Error downloading resource: {e}"
+
+
+# Downloads in progress per event loop: URL -> task, and URL -> number of
+# foreground callers waiting for it.
+_DOWNLOADS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[Dict[str, asyncio.Task], Counter]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+async def download_resource(url: str, background: bool = False) -> str:
+    """
+    Download a resource, joining a download of the same URL that is already
+    in progress. Cancelling a background caller (a prefetch) also cancels the
+    download, unless a foreground caller is waiting for it too.
+    """
+    loop = asyncio.get_running_loop()
+    tasks, waiters = _DOWNLOADS.setdefault(loop, ({}, Counter()))
+    task = tasks.get(url)
+    if task is None or task.cancelling():
+        # A fresh context, so the download does not hold on to the turn that started it.
+        task = loop.create_task(
+            _download_resource(url, BACKGROUND if background else CHAT), context=contextvars.Context()
+        )
+        tasks[url] = task
+        task.add_done_callback(lambda done: tasks.pop(url) if tasks.get(url) is done else None)
+    if not background:
+        waiters[url] += 1
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        if background and not waiters[url]:
+            task.cancel()
+        raise
+    finally:
+        if not background:
+            waiters[url] -= 1
+            if not waiters[url]:
+                del waiters[url]
 
 async def download_resources(state: Dict[str, Any]):
     """
@@ -57,22 +250,44 @@ async def download_resources(state: Dict[str, Any]):
                 "done": False
             })
 
-    # Prepare serializable state and emit to let the UI update
-    serializable_state = prepare_state_for_serialization(state)
-    await copilotkit_emit_state(serializable_state)
+    # Emit to let the UI update
+    emitter = StateEmitter(state)
+    await emitter.emit(force=True)
 
-    # Download the resources
-    for i, resource in enumerate(resources_to_download):
-        await _download_resource(resource["url"])
+    async def download_and_log(i: int, resource: Dict[str, Any]):
+        await download_resource(resource["url"])
         state["logs"][logs_offset + i]["done"] = True
+        await emitter.emit()
+
+    # Download the resources concurrently; the pooled session caps the
+    # number of open connections globally and per host.
+    await asyncio.gather(*(
+        download_and_log(i, resource) for i, resource in enumerate(resources_to_download)
+    ))
+    await emitter.flush()
 
-        # Prepare serializable state and update UI
-        serializable_state = prepare_state_for_serialization(state)
-        await copilotkit_emit_state(serializable_state)
+async def _signatures(resources: List[Dict[str, Any]]) -> Dict[str, Optional[int]]:
+    """
+    The signatures of resources with content, signing those not signed yet,
+    like pages still being analyzed, in a worker thread.
+    """
+    signatures = {
+        resource["url"]: _SIGNATURES[resource["url"]] for resource in resources if resource["url"] in _SIGNATURES
+    }
+    unsigned = [resource for resource in resources if resource["url"] not in signatures]
+    if unsigned:
+        signed = await asyncio.to_thread(lambda: [simhash(resource["content"]) for resource in unsigned])
+        for resource, signature in zip(unsigned, signed):
+            signatures[resource["url"]] = signature
+            if _RESOURCE_CACHE.content.peek(resource["url"]) is resource["content"]:
+                _SIGNATURES[resource["url"]] = signature
+    return signatures
 
-def get_resources(state: Dict[str, Any]):
+async def get_resources(state: Dict[str, Any]):
     """
     Get the resources from the state.
+    Of pages that are near duplicates of each other, like a review
+    syndicated to several sites, only the first is returned.
     """
     resources = []
 
@@ -85,4 +300,11 @@ def get_resources(state: Dict[str, Any]):
             "content": content
         })
 
-    return resources
+    signatures = await _signatures([resource for resource in resources if resource["content"]])
+    duplicates = near_duplicates(
+        (resource["url"], signatures[resource["url"]])
+        for resource in resources if resource["content"]
+    )
+    for url, original in duplicates.items():
+        logger.info("Skipping %s, a near duplicate of %s", url, original)
+    return [resource for resource in resources if resource["url"] not in duplicates]
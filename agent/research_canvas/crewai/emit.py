@@ -0,0 +1,116 @@
+"""
+Incremental state emission.
+"""
+
+import os
+import json
+import time
+import asyncio
+from typing_extensions import Any, Dict, Optional, Tuple
+from copilotkit.runloop import queue_put, get_context_execution
+from copilotkit.protocol import agent_state_message
+from research_canvas.crewai.serialization import dumps
+from research_canvas.crewai.metrics import stage
+
+# Minimum number of seconds between two emitted snapshots.
+_EMIT_WINDOW = float(os.getenv("STATE_EMIT_WINDOW", "0.1"))
+
+# Keys the runtime drops from intermediate snapshots; the message history is
+# sent back with every request and merged into the state by CopilotKit.
+_EXCLUDED_KEYS = ("messages", "id")
+
+_IMMUTABLE_TYPES = (str, int, float, bool, type(None), tuple)
+
+
+class StateEmitter:
+    """
+    Emits state snapshots to CopilotKit while a tool is running.
+
+    The JSON of immutable values that are still the same object is reused;
+    mutable values like the logs, resources and recommendations lists are
+    changed in place, by this and by other tool calls' emitters, so they are
+    serialized again on every emit. An unchanged snapshot is not sent again,
+    and bursts of updates within the emit window are coalesced into one
+    trailing snapshot.
+    """
+
+    def __init__(self, state: Dict[str, Any], window: float = _EMIT_WINDOW):
+        self.state = state
+        self.window = window
+        # key -> (value last serialized, JSON fragment)
+        self._fragments: Dict[str, Tuple[Any, str]] = {}
+        self._last_payload: Optional[str] = None
+        self._last_emit = float("-inf")
+        self._pending: Optional[asyncio.Task] = None
+        self.emitted = 0
+        self.skipped = 0
+
+    def _serialize(self) -> str:
+        fragments = {}
+        parts = []
+        for key, value in self.state.items():
+            if key in _EXCLUDED_KEYS:
+                continue
+            cached = self._fragments.get(key)
+            if cached is not None and cached[0] is value and isinstance(value, _IMMUTABLE_TYPES):
+                fragment = cached[1]
+            else:
+                fragment = dumps(value)
+            fragments[key] = (value, fragment)
+            parts.append(f"{json.dumps(key)}:{fragment}")
+        self._fragments = fragments
+        return "{" + ",".join(parts) + "}"
+
+    async def _send(self):
+        with stage("serialize_state"):
+            payload = self._serialize()
+        if payload == self._last_payload:
+            self.skipped += 1
+            return
+        self._last_payload = payload
+        self._last_emit = time.monotonic()
+        self.emitted += 1
+
+        execution = get_context_execution()
+        with stage("emit_state"):
+            await queue_put(
+                agent_state_message(
+                    thread_id=execution["thread_id"],
+                    agent_name=execution["agent_name"],
+                    node_name=execution["node_name"],
+                    run_id=execution["run_id"],
+                    active=True,
+                    role="assistant",
+                    state=payload,
+                    running=True
+                )
+            )
+
+    async def _send_later(self, delay: float):
+        await asyncio.sleep(delay)
+        self._pending = None
+        await self._send()
+
+    def _cancel_pending(self):
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+
+    async def emit(self, force: bool = False):
+        """
+        Emit the current state, or schedule it for the end of the emit window.
+        """
+        elapsed = time.monotonic() - self._last_emit
+        if force or elapsed >= self.window:
+            self._cancel_pending()
+            await self._send()
+        elif self._pending is None:
+            self._pending = asyncio.create_task(self._send_later(self.window - elapsed))
+
+    async def flush(self):
+        """
+        Emit any update still waiting for the emit window to pass.
+        """
+        if self._pending is not None:
+            self._cancel_pending()
+            await self._send()
@@ -0,0 +1,174 @@
+"""
+Conversation history compaction.
+"""
+
+import os
+import logging
+from typing_extensions import Any, Dict, List, Optional
+from research_canvas.crewai.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Number of most recent user turns that are always sent verbatim.
+_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "3"))
+# Estimated token budget for the history sent with each request.
+_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "8000"))
+# Older messages longer than this are cut down to a stub of this length.
+_STUB_TOKENS = int(os.getenv("HISTORY_STUB_TOKENS", "60"))
+# Per-message overhead of the chat format.
+_MESSAGE_TOKENS = 4
+
+
+def _get(message: Any, key: str, default: Any = None) -> Any:
+    if isinstance(message, dict):
+        return message.get(key, default)
+    return getattr(message, key, default)
+
+def _tool_call_dict(tool_call: Any) -> Dict[str, Any]:
+    if isinstance(tool_call, dict):
+        return tool_call
+    if hasattr(tool_call, "model_dump"):
+        return tool_call.model_dump()
+    return dict(tool_call)
+
+def count_tokens(messages: List[Any]) -> int:
+    """
+    Estimate the number of tokens of chat messages, including tool calls.
+    """
+    total = 0
+    for message in messages:
+        total += _MESSAGE_TOKENS + estimate_tokens(_get(message, "content") or "")
+        for tool_call in _get(message, "tool_calls") or []:
+            function = _tool_call_dict(tool_call).get("function") or {}
+            total += estimate_tokens(function.get("name") or "")
+            total += estimate_tokens(function.get("arguments") or "")
+    return total
+
+def _truncate(text: str, max_tokens: int) -> str:
+    words = []
+    tokens = 0
+    for word in text.split():
+        tokens += estimate_tokens(word)
+        if tokens > max_tokens:
+            return " ".join(words) + " …"
+        words.append(word)
+    return text
+
+def _split_turns(messages: List[Any]) -> List[List[Any]]:
+    """
+    Group messages into turns, each starting at a user message. Tool results
+    always stay in the turn of the assistant message that called them.
+    """
+    turns: List[List[Any]] = [[]]
+    for message in messages:
+        if _get(message, "role") == "user" and turns[-1]:
+            turns.append([])
+        turns[-1].append(message)
+    return [turn for turn in turns if turn]
+
+def _latest_tool_results(messages: List[Any]) -> set:
+    """
+    Ids of the latest tool result of each tool, which later turns may still
+    depend on.
+    """
+    names = {}
+    for message in messages:
+        for tool_call in _get(message, "tool_calls") or []:
+            tool_call = _tool_call_dict(tool_call)
+            names[tool_call.get("id")] = (tool_call.get("function") or {}).get("name")
+    latest = {}
+    for message in messages:
+        if _get(message, "role") == "tool":
+            tool_call_id = _get(message, "tool_call_id")
+            latest[names.get(tool_call_id)] = tool_call_id
+    return set(latest.values())
+
+def _compact_message(message: Any, keep_tool_results: set, stub_tokens: int) -> Any:
+    """
+    Cut a long assistant or tool message down to a stub, keeping its role and
+    tool call ids so calls and results still pair up.
+    """
+    role = _get(message, "role")
+    content = _get(message, "content") or ""
+    if role not in ("assistant", "tool") or estimate_tokens(content) <= stub_tokens:
+        return message
+    if role == "tool":
+        if _get(message, "tool_call_id") in keep_tool_results:
+            return message
+        return {
+            "role": "tool",
+            "content": f"[Earlier tool result, shortened] {_truncate(content, stub_tokens)}",
+            "tool_call_id": _get(message, "tool_call_id"),
+        }
+    compacted: Dict[str, Any] = {"role": "assistant", "content": _truncate(content, stub_tokens)}
+    tool_calls = _get(message, "tool_calls")
+    if tool_calls:
+        compacted["tool_calls"] = [_tool_call_dict(tool_call) for tool_call in tool_calls]
+    return compacted
+
+def compact_history(
+    messages: List[Any],
+    keep_turns: int = _KEEP_TURNS,
+    max_tokens: int = _MAX_TOKENS,
+    stub_tokens: int = _STUB_TOKENS
+) -> List[Any]:
+    """
+    Compact the conversation history for a model request. `messages` itself is
+    not modified.
+
+    The last `keep_turns` user turns and the latest result of each tool are
+    kept verbatim. Long assistant and tool messages of older turns are cut
+    down to stubs, and if the history is still over `max_tokens` the oldest
+    turns are dropped whole, so every tool result still follows its call.
+    """
+    if count_tokens(messages) <= max_tokens:
+        return list(messages)
+
+    turns = _split_turns(messages)
+    split = max(0, len(turns) - max(1, keep_turns))
+    keep_tool_results = _latest_tool_results(messages)
+    older = [
+        [_compact_message(message, keep_tool_results, stub_tokens) for message in turn]
+        for turn in turns[:split]
+    ]
+    recent = [message for turn in turns[split:] for message in turn]
+
+    budget = max_tokens - count_tokens(recent)
+    sizes = [count_tokens(turn) for turn in older]
+    dropped = 0
+    while dropped < len(older) and sum(sizes[dropped:]) > budget:
+        dropped += 1
+
+    compacted: List[Any] = []
+    if dropped:
+        compacted.append({
+            "role": "system",
+            "content": f"{dropped} earlier conversation turns were omitted for brevity.",
+        })
+    for turn in older[dropped:]:
+        compacted.extend(turn)
+    compacted.extend(recent)
+    return compacted
+
+def request_messages(
+    step: str,
+    system: List[Dict[str, Any]],
+    history: List[Any],
+    pending: Optional[List[Dict[str, Any]]] = None
+) -> List[Any]:
+    """
+    Assemble the messages of a model request from the system messages, the
+    compacted history and any pending messages, and log how many tokens
+    are sent.
+    """
+    compacted = compact_history(history)
+    messages = [*system, *compacted, *(pending or [])]
+    logger.info(
+        "%s: sending %d tokens in %d messages (history %d -> %d tokens)",
+        step,
+        count_tokens(messages),
+        len(messages),
+        count_tokens(history),
+        count_tokens(compacted)
+    )
+    return messages
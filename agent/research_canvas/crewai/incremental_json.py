@@ -0,0 +1,80 @@
+"""
+Incremental parsing of streamed JSON.
+"""
+
+import json
+from typing_extensions import Any, List, Optional
+
+
+class ArrayItemParser:
+    """
+    Parses a JSON object as it streams in, piece by piece, and returns the
+    items of one of its top-level arrays as soon as each item is complete:
+
+        parser = ArrayItemParser("queries")
+        parser.feed('{"queries": ["hybrid SUV", "hyb')  # ["hybrid SUV"]
+        parser.feed('rid SUV reliability"]}')           # ["hybrid SUV reliability"]
+
+    Each character is scanned once; only complete items are decoded.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self._buffer: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        # Start of the string being read, and the last string read at the top level.
+        self._string_start = 0
+        self._last_key: Optional[str] = None
+        self._in_array = False
+        self._item_start: Optional[int] = None
+        self._position = 0
+
+    def feed(self, text: str) -> List[Any]:
+        """
+        Add the next piece of the JSON text; returns the items it completed.
+        """
+        items: List[Any] = []
+        self._buffer.append(text)
+        for char in text:
+            position = self._position
+            self._position += 1
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and not self._in_array:
+                        self._last_key = json.loads(self._text(self._string_start, position + 1))
+                continue
+            if self._in_array and self._item_start is None and not char.isspace() and char not in ",]":
+                self._item_start = position
+            if char == '"':
+                self._in_string = True
+                self._string_start = position
+            elif char in "{[":
+                self._depth += 1
+                if char == "[" and self._depth == 2 and self._last_key == self.key:
+                    self._in_array = True
+            elif char in "}]":
+                if self._in_array and self._depth == 2:
+                    self._complete_item(position, items)
+                    self._in_array = False
+                self._depth -= 1
+            elif char == "," and self._in_array and self._depth == 2:
+                self._complete_item(position, items)
+        return items
+
+    def _text(self, start: int, end: int) -> str:
+        text = "".join(self._buffer)
+        self._buffer = [text]
+        return text[start:end]
+
+    def _complete_item(self, end: int, items: List[Any]):
+        if self._item_start is None:
+            return
+        items.append(json.loads(self._text(self._item_start, end)))
+        self._item_start = None
@@ -0,0 +1,266 @@
+"""
+Retrieval index over downloaded resources.
+"""
+
+import re
+import math
+from collections import Counter
+import numpy as np
+from typing_extensions import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from research_canvas.crewai.tokens import estimate_tokens
+
+_CHUNK_TOKENS = 200
+
+_TERM = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it of on or that the this to "
+    "was were what which with you your i me my we our best good car cars".split()
+)
+
+# BM25 parameters
+_K1 = 1.2
+_B = 0.75
+
+
+def terms(text: str) -> List[str]:
+    """
+    Lowercase search terms of a text, without stopwords.
+    """
+    return [term for term in _TERM.findall(text.lower()) if term not in _STOPWORDS]
+
+def split_chunks(text: str, max_tokens: int = _CHUNK_TOKENS) -> List[str]:
+    """
+    Split markdown into chunks of whole paragraphs of at most `max_tokens` each.
+    Paragraphs longer than that are split on words.
+    """
+    chunks = []
+    current: List[str] = []
+    current_tokens = 0
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        tokens = estimate_tokens(paragraph)
+        if tokens > max_tokens:
+            words = paragraph.split()
+            step = max(1, len(words) * max_tokens // tokens)
+            pieces = [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+        else:
+            pieces = [paragraph]
+        for piece in pieces:
+            piece_tokens = estimate_tokens(piece)
+            if current and current_tokens + piece_tokens > max_tokens:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+class AnalyzedChunk(NamedTuple):
+    """
+    A chunk of a resource with its term frequencies.
+    """
+    text: str
+    tokens: int
+    term_counts: Dict[str, int]
+
+def analyze(text: str) -> List[AnalyzedChunk]:
+    """
+    Chunk a resource and count the terms of each chunk.
+    Pure and picklable, so it can run in a worker thread or process.
+    """
+    return [
+        AnalyzedChunk(chunk, estimate_tokens(chunk), dict(Counter(terms(chunk))))
+        for chunk in split_chunks(text)
+    ]
+
+
+class Passage(NamedTuple):
+    """
+    A chunk returned by a search.
+    """
+    url: str
+    position: int
+    text: str
+    tokens: int
+    score: float
+
+
+class ResourceIndex:
+    """
+    Incremental BM25 index over resource chunks.
+
+    Per-chunk statistics live in growable NumPy arrays and each term keeps a
+    posting list of (chunk, frequency) arrays, so a lookup touches only the
+    postings of the query terms and ranks candidates with vectorized
+    operations. Removed chunks are tombstoned and compacted away once they
+    make up half of the index.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._urls: List[Optional[str]] = []
+        self._texts: List[Optional[str]] = []
+        self._lengths = np.zeros(capacity, dtype=np.float32)
+        self._positions = np.zeros(capacity, dtype=np.int32)
+        self._tokens = np.zeros(capacity, dtype=np.int32)
+        self._url_ids = np.zeros(capacity, dtype=np.int32)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._chunks_by_url: Dict[str, List[int]] = {}
+        self._resources: Dict[str, List[AnalyzedChunk]] = {}
+        self._url_id_by_url: Dict[str, int] = {}
+        # term -> ([chunk ids], [frequencies]); arrays are built lazily
+        self._postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        self._posting_arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._live_chunks = 0
+        self._total_length = 0.0
+
+    def __contains__(self, url: str):
+        return url in self._chunks_by_url
+
+    def __len__(self):
+        return self._live_chunks
+
+    def tokens(self, urls: Iterable[str]) -> int:
+        """
+        Total estimated tokens of the indexed resources among `urls`.
+        """
+        return sum(
+            int(self._tokens[self._chunks_by_url[url]].sum())
+            for url in urls if url in self._chunks_by_url
+        )
+
+    def _grow(self, size: int):
+        capacity = len(self._lengths)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for name in ("_lengths", "_positions", "_tokens", "_url_ids", "_alive"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def add(self, url: str, text: str):
+        """
+        Index a resource, replacing any previous version of it.
+        """
+        self.insert(url, analyze(text))
+
+    def insert(self, url: str, chunks: List[AnalyzedChunk]):
+        """
+        Index a resource that was already analyzed with `analyze`.
+        """
+        self.remove(url)
+        url_id = self._url_id_by_url.setdefault(url, len(self._url_id_by_url))
+        start = len(self._urls)
+        self._grow(start + len(chunks))
+        ids = []
+        for position, chunk in enumerate(chunks):
+            chunk_id = start + position
+            length = sum(chunk.term_counts.values())
+            self._urls.append(url)
+            self._texts.append(chunk.text)
+            self._lengths[chunk_id] = length
+            self._positions[chunk_id] = position
+            self._tokens[chunk_id] = chunk.tokens
+            self._url_ids[chunk_id] = url_id
+            self._alive[chunk_id] = True
+            self._total_length += length
+            for term, count in chunk.term_counts.items():
+                chunk_ids, counts = self._postings.setdefault(term, ([], []))
+                chunk_ids.append(chunk_id)
+                counts.append(count)
+                self._posting_arrays.pop(term, None)
+            ids.append(chunk_id)
+        self._chunks_by_url[url] = ids
+        self._resources[url] = chunks
+        self._live_chunks += len(ids)
+
+    def remove(self, url: str):
+        """
+        Drop a resource from the index.
+        """
+        ids = self._chunks_by_url.pop(url, None)
+        self._resources.pop(url, None)
+        if not ids:
+            return
+        self._alive[ids] = False
+        self._total_length -= float(self._lengths[ids].sum())
+        self._live_chunks -= len(ids)
+        for chunk_id in ids:
+            self._texts[chunk_id] = None
+            self._urls[chunk_id] = None
+        if len(self._urls) > 64 and self._live_chunks < len(self._urls) // 2:
+            self._compact()
+
+    def _compact(self):
+        """
+        Rebuild the index without tombstoned chunks.
+        """
+        resources = self._resources
+        self.__init__(capacity=max(1024, len(self._lengths) // 2))
+        for url, chunks in resources.items():
+            self.insert(url, chunks)
+
+    def _posting(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        arrays = self._posting_arrays.get(term)
+        if arrays is None:
+            posting = self._postings.get(term)
+            if posting is None:
+                return None
+            arrays = (np.asarray(posting[0], dtype=np.int32), np.asarray(posting[1], dtype=np.float32))
+            self._posting_arrays[term] = arrays
+        return arrays
+
+    def search(self, query: str, urls: Optional[Iterable[str]] = None, k: int = 16) -> List[Passage]:
+        """
+        Return the top `k` chunks for a query, optionally only from `urls`.
+        Ties, including every chunk when the query has no terms, rank earlier
+        chunks of each resource first.
+        """
+        size = len(self._urls)
+        if not self._live_chunks or k <= 0:
+            return []
+
+        candidates = self._alive[:size].copy()
+        if urls is not None:
+            url_ids = [self._url_id_by_url[url] for url in urls if url in self._chunks_by_url]
+            candidates &= np.isin(self._url_ids[:size], url_ids)
+
+        scores = np.zeros(size, dtype=np.float32)
+        average_length = self._total_length / self._live_chunks or 1.0
+        norms = _K1 * (1 - _B + _B * self._lengths[:size] / average_length)
+        for term in set(terms(query)):
+            posting = self._posting(term)
+            if posting is None:
+                continue
+            chunk_ids, counts = posting
+            alive = self._alive[chunk_ids]
+            df = int(np.count_nonzero(alive))
+            if not df:
+                continue
+            idf = math.log(1 + (self._live_chunks - df + 0.5) / (df + 0.5))
+            scores[chunk_ids] += alive * idf * counts * (_K1 + 1) / (counts + norms[chunk_ids])
+
+        # Rank by score, then by position within the resource.
+        keys = np.where(candidates, scores - self._positions[:size] * 1e-6, -np.inf)
+        count = min(k, int(np.count_nonzero(candidates)))
+        if count == 0:
+            return []
+        top = np.argpartition(-keys, count - 1)[:count] if count < size else np.arange(size)
+        top = top[np.argsort(-keys[top], kind="stable")][:count]
+
+        return [
+            Passage(
+                self._urls[i],
+                int(self._positions[i]),
+                self._texts[i],
+                int(self._tokens[i]),
+                float(scores[i])
+            )
+            for i in top
+        ]
@@ -0,0 +1,358 @@
+"""
+Asynchronous LLM streaming.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import weakref
+import httpx
+from openai import AsyncOpenAI
+from litellm import acompletion
+from litellm.types.utils import (
+    ModelResponse,
+    Choices,
+    Message as LiteLLMMessage,
+    ChatCompletionMessageToolCall,
+    Function as LiteLLMFunction
+)
+from typing_extensions import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from copilotkit.runloop import queue_put
+from research_canvas.crewai.metrics import stage, observe_stage
+from research_canvas.crewai.routing import LLM_BASE_URL, ROUTE_ERRORS, Route, get_router
+from research_canvas.crewai.admission import TOOL, admit
+from copilotkit.protocol import (
+    text_message_start,
+    text_message_content,
+    text_message_end,
+    action_execution_start,
+    action_execution_args,
+    action_execution_end,
+)
+
+# Called with the tool call id, the tool name and a piece of the arguments.
+ArgumentsListener = Callable[[str, str, str], Awaitable[None]]
+
+_LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+_LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+
+def get_api_key() -> str:
+    """
+    Get the OpenRouter API key. It is read when first needed rather than at
+    import, so importing the agent does not depend on the environment.
+    """
+    api_key = os.getenv("OPENROUTER_API_KEY")
+    if api_key is None:
+        raise ValueError("OPENROUTER_API_KEY environment variable not set.")
+    return api_key
+
+# One pooled client per event loop and endpoint.
+_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, str], AsyncOpenAI]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+def _get_client(base_url: str, api_key: str) -> AsyncOpenAI:
+    """
+    Get the shared OpenAI-compatible client for an endpoint, creating it on first use.
+    """
+    clients = _CLIENTS.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get((base_url, api_key))
+    if client is None:
+        client = AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=_LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=_LLM_MAX_CONNECTIONS
+                ),
+                timeout=_LLM_TIMEOUT
+            )
+        )
+        clients[(base_url, api_key)] = client
+    return client
+
+async def warm_up(api_key: str, routes: Optional[List[Route]] = None):
+    """
+    Open a pooled connection to each route's endpoint and run the client's and
+    litellm's first-call code paths with a mocked response, so the first user
+    request pays for none of them.
+    """
+    await asyncio.gather(*(
+        _warm_up_route(route, api_key) for route in (routes or get_router().routes)
+    ))
+
+async def _warm_up_route(route: Route, api_key: str):
+    client = _get_client(route.base_url, api_key)
+    # The client imports its resource modules, about 1.5s, on first access.
+    _ = client.chat.completions
+    try:
+        await client.get("/models", cast_to=httpx.Response)
+    except Exception: # pylint: disable=broad-except
+        # Any answer, even an error status, leaves an open connection behind.
+        pass
+    response = await acompletion(
+        model=route.model,
+        base_url=route.base_url,
+        api_key=api_key,
+        messages=[{"role": "user", "content": "warm up"}],
+        client=client,
+        stream=True,
+        mock_response="ok"
+    )
+    async for _ in response:
+        pass
+
+async def close_clients():
+    """
+    Close the shared LLM clients of the running event loop.
+    """
+    clients = _CLIENTS.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.close()
+
+
+async def stream_completion(
+    *,
+    messages: List[Any],
+    stage_name: str = "llm",
+    on_arguments: Optional[ArgumentsListener] = None,
+    model: Optional[str] = None,
+    base_url: str = LLM_BASE_URL,
+    api_key: Optional[str] = None,
+    priority: int = TOOL,
+    **kwargs
+) -> ModelResponse:
+    """
+    Stream a completion token by token to CopilotKit without blocking the event loop.
+    Returns the assembled response, like `copilotkit_stream`.
+    The call and its time to first token are timed as `stage_name` and
+    `<stage_name>_first_token`.
+    `on_arguments(tool_call_id, name, delta)` is awaited for every piece of
+    tool call arguments as it arrives, to act on them before the call is complete.
+    Without a `model` the call goes through the shared router; only the
+    attempt that wins is streamed.
+    The call waits for admission at `priority` and raises Overloaded if the
+    model calls of this worker are saturated.
+    """
+    api_key = api_key or get_api_key()
+    with stage(stage_name):
+        started = time.perf_counter()
+        async with admit("llm", priority):
+            route: Optional[Route] = None
+            if model is not None:
+                response, first = await _open_stream(Route(model, base_url), api_key, messages, kwargs)
+            else:
+                route, (response, first) = await get_router().first(
+                    lambda route: _open_stream(route, api_key, messages, kwargs),
+                    lambda opened: _close_stream(opened[0])
+                )
+            chunks = _prepend(first, response)
+            try:
+                return await _stream_to_copilotkit(
+                    chunks, f"{stage_name}_first_token", started, on_arguments
+                )
+            except ROUTE_ERRORS as e:
+                if route is not None:
+                    get_router().failed(route, e)
+                raise
+            finally:
+                # The stream stops being read at the finish reason; close it
+                # so its connection goes back to the pool right away.
+                await chunks.aclose()
+                await _close_stream(response)
+
+
+async def _open_stream(
+    route: Route,
+    api_key: str,
+    messages: List[Any],
+    kwargs: Dict[str, Any]
+) -> Tuple[Any, Any]:
+    """
+    Start a streamed completion on a route and wait for its first chunk.
+    """
+    response = await acompletion(
+        model=route.model,
+        base_url=route.base_url,
+        api_key=api_key,
+        messages=messages,
+        client=_get_client(route.base_url, api_key),
+        stream=True,
+        **kwargs
+    )
+    try:
+        return response, await anext(response, None)
+    except BaseException:
+        await _close_stream(response)
+        raise
+
+async def _close_stream(response):
+    stream = getattr(response, "completion_stream", None)
+    close = getattr(stream, "close", None)
+    if close is not None:
+        try:
+            await close()
+        except Exception: # pylint: disable=broad-except
+            pass
+
+async def _prepend(first: Any, response) -> AsyncIterator[Any]:
+    if first is None:
+        return
+    yield first
+    async for chunk in response:
+        yield chunk
+
+
+async def _stream_to_copilotkit( # pylint: disable=too-many-locals,too-many-branches,too-many-statements
+    response,
+    first_token_stage: str,
+    started: float,
+    on_arguments: Optional[ArgumentsListener] = None
+) -> ModelResponse:
+    message_id = ""
+    content = ""
+    created = 0
+    model = ""
+    system_fingerprint = None
+    finish_reason = None
+    text_open = False
+    open_tool_call_id: Optional[str] = None
+    tool_calls: List[Dict[str, str]] = []
+    tool_calls_by_index: Dict[int, Dict[str, str]] = {}
+
+    async for chunk in response:
+        if not message_id:
+            message_id = chunk.id
+            observe_stage(first_token_stage, time.perf_counter() - started)
+        created = chunk.created
+        model = chunk.model
+        system_fingerprint = getattr(chunk, "system_fingerprint", None)
+        if not chunk.choices:
+            continue
+
+        choice = chunk.choices[0]
+        delta = choice.delta
+        finish_reason = choice.finish_reason
+
+        if delta.content:
+            if open_tool_call_id is not None:
+                await queue_put(action_execution_end(action_execution_id=open_tool_call_id))
+                open_tool_call_id = None
+            if not text_open:
+                await queue_put(text_message_start(message_id=message_id, parent_message_id=None))
+                text_open = True
+            content += delta.content
+            await queue_put(text_message_content(message_id=message_id, content=delta.content))
+
+        for tool_call_delta in delta.tool_calls or []:
+            if text_open:
+                await queue_put(text_message_end(message_id=message_id))
+                text_open = False
+
+            index = tool_call_delta.index if tool_call_delta.index is not None else len(tool_calls) - 1
+            function = tool_call_delta.function
+            if tool_call_delta.id is not None:
+                # start a new tool call
+                if open_tool_call_id is not None:
+                    await queue_put(action_execution_end(action_execution_id=open_tool_call_id))
+                tool_call = {
+                    "id": tool_call_delta.id,
+                    "name": getattr(function, "name", None) or "",
+                    "arguments": "",
+                }
+                tool_calls.append(tool_call)
+                tool_calls_by_index[index] = tool_call
+                open_tool_call_id = tool_call["id"]
+                await queue_put(
+                    action_execution_start(
+                        action_execution_id=tool_call["id"],
+                        action_name=tool_call["name"],
+                        parent_message_id=message_id
+                    )
+                )
+
+            tool_call = tool_calls_by_index.get(index)
+            arguments = getattr(function, "arguments", None)
+            if tool_call is not None and arguments:
+                tool_call["arguments"] += arguments
+                if on_arguments is not None:
+                    await on_arguments(tool_call["id"], tool_call["name"], arguments)
+                if tool_call["id"] == open_tool_call_id:
+                    await queue_put(
+                        action_execution_args(
+                            action_execution_id=tool_call["id"],
+                            args=arguments
+                        )
+                    )
+
+        if finish_reason is not None:
+            break
+
+    if text_open:
+        await queue_put(text_message_end(message_id=message_id))
+    if open_tool_call_id is not None:
+        await queue_put(action_execution_end(action_execution_id=open_tool_call_id))
+
+    return _model_response(message_id, created, model, system_fingerprint, finish_reason, content, tool_calls)
+
+
+async def replay_tool_call(name: str, arguments: str) -> ModelResponse:
+    """
+    Stream a tool call to CopilotKit as if the model had just made it, for
+    results served from a cache. Returns the response the model would have.
+    """
+    message_id = f"chatcmpl-{uuid.uuid4()}"
+    tool_call = {"id": f"call_{uuid.uuid4().hex}", "name": name, "arguments": arguments}
+    await queue_put(
+        action_execution_start(
+            action_execution_id=tool_call["id"],
+            action_name=name,
+            parent_message_id=message_id
+        )
+    )
+    await queue_put(action_execution_args(action_execution_id=tool_call["id"], args=arguments))
+    await queue_put(action_execution_end(action_execution_id=tool_call["id"]))
+    return _model_response(message_id, int(time.time()), "cache", None, "tool_calls", "", [tool_call])
+
+
+def _model_response( # pylint: disable=too-many-arguments
+    message_id: str,
+    created: int,
+    model: str,
+    system_fingerprint: Optional[str],
+    finish_reason: Optional[str],
+    content: str,
+    tool_calls: List[Dict[str, str]]
+) -> ModelResponse:
+    message_tool_calls = [
+        ChatCompletionMessageToolCall(
+            function=LiteLLMFunction(
+                arguments=tool_call["arguments"],
+                name=tool_call["name"]
+            ),
+            id=tool_call["id"],
+            type="function"
+        )
+        for tool_call in tool_calls
+    ]
+    return ModelResponse(
+        id=message_id,
+        created=created,
+        model=model,
+        object="chat.completion",
+        system_fingerprint=system_fingerprint,
+        choices=[
+            Choices(
+                finish_reason=finish_reason,
+                index=0,
+                message=LiteLLMMessage(
+                    content=content,
+                    role="assistant",
+                    tool_calls=message_tool_calls if message_tool_calls else None,
+                    function_call=None
+                )
+            )
+        ]
+    )
@@ -0,0 +1,424 @@
+"""
+Stage timing metrics in the Prometheus text format.
+"""
+
+import os
+import glob
+import json
+import time
+import asyncio
+import logging
+from bisect import bisect_left
+from typing_extensions import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() not in ("0", "false", "no")
+
+# Directory shared by the workers of a server, where each one writes its
+# metrics for /metrics to add up; set by the production server. Without it
+# /metrics serves the metrics of the worker that answers.
+_METRICS_DIR = os.getenv("METRICS_DIR")
+# Seconds between two writes of a worker's metrics to the directory.
+_WRITE_INTERVAL = float(os.getenv("METRICS_WRITE_INTERVAL", "5"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """
+    A labeled histogram with fixed buckets.
+
+    Observations are only made from the event loop thread, so the counters
+    are not locked.
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...], buckets=_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        # label values -> [per-bucket counts..., sum, count]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *label_values: str):
+        """
+        Record one observation for the given label values.
+        """
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def samples(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        """
+        The series of every label values, as `add` takes them.
+        """
+        return list(self._series.items())
+
+    def add(self, samples: List[Tuple[Tuple[str, ...], Any]]):
+        """
+        Add the series of another histogram with the same buckets to this one.
+        """
+        for label_values, other in samples:
+            series = self._series.setdefault(tuple(label_values), [0] * (len(self.buckets) + 2))
+            for index, value in enumerate(other):
+                series[index] += value
+
+    def empty(self) -> "Histogram":
+        """
+        A histogram like this one without observations.
+        """
+        return Histogram(self.name, self.documentation, self.label_names, self.buckets)
+
+    def render(self) -> List[str]:
+        """
+        The histogram in the Prometheus text format.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self._series.items()):
+            labels = ",".join(
+                f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, label_values)
+            )
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-2]}")
+            lines.append(f"{self.name}_count{{{labels}}} {series[-1]}")
+        return lines
+
+
+class Counter:
+    """
+    A labeled counter, only incremented from the event loop thread.
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        """
+        Add to the counter for the given label values.
+        """
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def set(self, value: float, *label_values: str):
+        """
+        Set the value for the given label values, for a total counted elsewhere.
+        """
+        self._values[label_values] = value
+
+    def value(self, *label_values: str) -> float:
+        """
+        The current value for the given label values.
+        """
+        return self._values.get(label_values, 0)
+
+    def samples(self) -> List[Tuple[Tuple[str, ...], Any]]:
+        """
+        The value of every label values, as `add` takes them.
+        """
+        return list(self._values.items())
+
+    def add(self, samples: List[Tuple[Tuple[str, ...], Any]]):
+        """
+        Add the values of another counter to this one.
+        """
+        for label_values, value in samples:
+            self.inc(*label_values, amount=value)
+
+    def empty(self) -> "Counter":
+        """
+        A counter like this one without values.
+        """
+        return type(self)(self.name, self.documentation, self.label_names)
+
+    def render(self) -> List[str]:
+        """
+        The counter in the Prometheus text format.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self._values.items()):
+            labels = ",".join(
+                f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, label_values)
+            )
+            lines.append(f"{self.name}{{{labels}}} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    """
+    A labeled gauge, only set from the event loop thread.
+    """
+
+    def render(self) -> List[str]:
+        """
+        The gauge in the Prometheus text format.
+        """
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+STAGE_SECONDS = Histogram(
+    "research_canvas_stage_duration_seconds",
+    "Time spent in each stage of a turn.",
+    ("stage", "tool", "outcome")
+)
+
+PREFETCH_EVENTS = Counter(
+    "research_canvas_prefetch_total",
+    "Speculative prefetches by event: started, completed, failed, cancelled, and deep-dive sources requested, already cached and hit.",
+    ("event",)
+)
+
+PREFETCH_BYTES = Counter(
+    "research_canvas_prefetch_bytes_total",
+    "Converted content of prefetched resources: fetched, used by a deep dive, or wasted.",
+    ("kind",)
+)
+
+ROUTE_EVENTS = Counter(
+    "research_canvas_llm_route_total",
+    "Model route events: failed calls, hedged calls and hedges won, failovers, and circuit breakers opened and closed.",
+    ("route", "event")
+)
+
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "research_canvas_admission_queue_depth",
+    "Outbound calls waiting for admission, per upstream.",
+    ("upstream",)
+)
+
+ADMISSION_IN_FLIGHT = Gauge(
+    "research_canvas_admission_in_flight",
+    "Outbound calls admitted and not finished yet, per upstream.",
+    ("upstream",)
+)
+
+ADMISSION_WAIT_SECONDS = Histogram(
+    "research_canvas_admission_wait_seconds",
+    "Time outbound calls waited for admission, per upstream and outcome: admitted or rejected.",
+    ("upstream", "outcome")
+)
+
+CACHE_LOOKUPS = Counter(
+    "research_canvas_cache_lookups_total",
+    "Cache lookups per cache and result: hit or miss.",
+    ("cache", "result")
+)
+
+CACHE_COALESCED = Counter(
+    "research_canvas_cache_coalesced_total",
+    "Cache misses that joined a fetch of the same key already in progress.",
+    ("cache",)
+)
+
+CACHE_REMOVALS = Counter(
+    "research_canvas_cache_removals_total",
+    "Cache entries removed per cache and reason: evicted to make room, or expired.",
+    ("cache", "reason")
+)
+
+CACHE_ENTRIES = Gauge(
+    "research_canvas_cache_entries",
+    "Entries held per cache.",
+    ("cache",)
+)
+
+CACHE_BYTES = Gauge(
+    "research_canvas_cache_bytes",
+    "Size of the entries held per cache, in the cache's own units.",
+    ("cache",)
+)
+
+# Cache name -> function returning the cache's counters, as LRUCache.stats does.
+_CACHES: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+def register_cache(name: str, stats: Callable[[], Dict[str, Any]]):
+    """
+    Export the counters of a cache with the metrics. `stats` is read on
+    every scrape and returns a dict like `LRUCache.stats()`.
+    """
+    _CACHES[name] = stats
+
+def _collect_caches():
+    for name, stats in _CACHES.items():
+        values = stats()
+        CACHE_LOOKUPS.set(values["hits"], name, "hit")
+        CACHE_LOOKUPS.set(values["misses"], name, "miss")
+        if "coalesced" in values:
+            CACHE_COALESCED.set(values["coalesced"], name)
+        CACHE_REMOVALS.set(values["evictions"], name, "evicted")
+        CACHE_REMOVALS.set(values["expirations"], name, "expired")
+        CACHE_ENTRIES.set(values["entries"], name)
+        CACHE_BYTES.set(values["bytes"], name)
+
+
+class _Stage:
+    """
+    Times a block of code as a stage. The outcome is "ok", "error" or
+    "cancelled" depending on how the block exits, unless it was set on the
+    stage inside the block.
+    """
+
+    __slots__ = ("name", "tool", "outcome", "_start")
+
+    def __init__(self, name: str, tool: str):
+        self.name = name
+        self.tool = tool
+        self.outcome: Optional[str] = None
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        outcome = self.outcome
+        if outcome is None:
+            if exc_type is None:
+                outcome = "ok"
+            elif issubclass(exc_type, asyncio.CancelledError):
+                outcome = "cancelled"
+            else:
+                outcome = "error"
+        STAGE_SECONDS.observe(time.perf_counter() - self._start, self.name, self.tool, outcome)
+        return False
+
+
+class _NoopStage:
+    """
+    Stands in for `_Stage` when metrics are disabled.
+    """
+
+    outcome: Optional[str] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+_NOOP_STAGE = _NoopStage()
+
+
+def stage(name: str, tool: str = ""):
+    """
+    Time a block of code as a stage:
+
+        with stage("search", tool="Search") as span:
+            ...
+            span.outcome = "cached"
+    """
+    if not _ENABLED:
+        return _NOOP_STAGE
+    return _Stage(name, tool)
+
+def observe_stage(name: str, seconds: float, tool: str = "", outcome: str = "ok"):
+    """
+    Record the duration of a stage that was timed by the caller.
+    """
+    if _ENABLED:
+        STAGE_SECONDS.observe(seconds, name, tool, outcome)
+
+_METRICS = (
+    STAGE_SECONDS, PREFETCH_EVENTS, PREFETCH_BYTES, ROUTE_EVENTS,
+    ADMISSION_QUEUE_DEPTH, ADMISSION_IN_FLIGHT, ADMISSION_WAIT_SECONDS,
+    CACHE_LOOKUPS, CACHE_COALESCED, CACHE_REMOVALS, CACHE_ENTRIES, CACHE_BYTES,
+)
+
+def _worker_path(pid: str) -> str:
+    return os.path.join(_METRICS_DIR or "", f"worker-{pid}.json")
+
+def write_worker_metrics(final: bool = False):
+    """
+    Write this worker's metrics to the metrics directory, if there is one.
+    A worker's `final` metrics leave out its gauges, which stop counting
+    once it exits; its counters and histograms stay in the totals.
+    """
+    if not _METRICS_DIR:
+        return
+    _collect_caches()
+    snapshot = {
+        "pid": os.getpid(),
+        "metrics": {
+            metric.name: metric.samples()
+            for metric in _METRICS if not (final and isinstance(metric, Gauge))
+        },
+    }
+    path = _worker_path(str(os.getpid()))
+    try:
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(f"{path}.tmp", path)
+    except OSError as e:
+        logger.warning("Writing the worker metrics failed: %s", e)
+
+async def write_worker_metrics_periodically():
+    """
+    Write this worker's metrics every METRICS_WRITE_INTERVAL seconds, until cancelled.
+    """
+    while True:
+        await asyncio.sleep(_WRITE_INTERVAL)
+        write_worker_metrics()
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _server_metrics() -> List[Any]:
+    """
+    The metrics of all the server's workers added up: the last metrics each
+    worker wrote, this one's written just now, so that a scrape answered by
+    any worker sees the same totals and they never go down. Gauges only
+    count workers still running.
+    """
+    write_worker_metrics()
+    totals = {metric.name: metric.empty() for metric in _METRICS}
+    for path in glob.glob(_worker_path("*")):
+        try:
+            with open(path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Reading the metrics in %s failed: %s", path, e)
+            continue
+        alive = _alive(snapshot["pid"])
+        for name, samples in snapshot["metrics"].items():
+            total = totals.get(name)
+            if total is not None and (alive or not isinstance(total, Gauge)):
+                total.add(samples)
+    return list(totals.values())
+
+def render_metrics() -> str:
+    """
+    All metrics in the Prometheus text format, of the whole server when the
+    workers share a metrics directory.
+    """
+    if _METRICS_DIR:
+        metrics = _server_metrics()
+    else:
+        _collect_caches()
+        metrics = list(_METRICS)
+    lines = [line for metric in metrics for line in metric.render()]
+    return "\n".join(lines) + "\n"
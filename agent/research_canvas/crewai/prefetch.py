@@ -0,0 +1,193 @@
+"""
+Speculative prefetch of deep-dive sources.
+"""
+
+import os
+import asyncio
+import weakref
+import contextvars
+from typing_extensions import Dict, List, Optional, Set
+from research_canvas.crewai.download import download_resource, get_resource
+from research_canvas.crewai.metrics import PREFETCH_EVENTS, PREFETCH_BYTES
+
+_ENABLED = os.getenv("PREFETCH_ENABLED", "false").lower() in ("1", "true", "yes")
+# Sources prefetched per session at most.
+_MAX_URLS = int(os.getenv("PREFETCH_MAX_URLS", "6"))
+# Prefetches running at once per worker, so they leave the connections to
+# the turns being served.
+_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "2"))
+# Seconds without a new turn after which a session is considered ended.
+_SESSION_TTL = float(os.getenv("PREFETCH_SESSION_TTL", "600"))
+
+
+class _Session:
+    """
+    The prefetches of one thread.
+    """
+
+    __slots__ = ("tasks", "sizes", "used", "expiry")
+
+    def __init__(self):
+        self.tasks: Dict[str, asyncio.Task] = {}
+        # URL -> size of the prefetched content, once it is in
+        self.sizes: Dict[str, int] = {}
+        self.used: Set[str] = set()
+        self.expiry: Optional[asyncio.TimerHandle] = None
+
+
+class _Prefetcher:
+    """
+    Prefetches for the sessions served on one event loop.
+    """
+
+    def __init__(self):
+        self.sessions: Dict[str, _Session] = {}
+        self.semaphore = asyncio.Semaphore(_CONCURRENCY)
+
+    def session(self, thread_id: str) -> _Session:
+        """
+        The session of a thread, kept alive for another TTL.
+        """
+        session = self.sessions.get(thread_id)
+        if session is None:
+            session = self.sessions[thread_id] = _Session()
+        if session.expiry is not None:
+            session.expiry.cancel()
+        session.expiry = asyncio.get_running_loop().call_later(_SESSION_TTL, self.end, thread_id)
+        return session
+
+    async def _prefetch(self, session: _Session, url: str):
+        try:
+            async with self.semaphore:
+                content = await download_resource(url, background=True)
+        except asyncio.CancelledError:
+            PREFETCH_EVENTS.inc("cancelled")
+            raise
+        finally:
+            session.tasks.pop(url, None)
+        if get_resource(url) in ("", "ERROR"):
+            PREFETCH_EVENTS.inc("failed")
+            return
+        PREFETCH_EVENTS.inc("completed")
+        size = len(content.encode("utf-8"))
+        session.sizes[url] = size
+        PREFETCH_BYTES.inc("fetched", amount=size)
+        if url in session.used:
+            PREFETCH_BYTES.inc("used", amount=size)
+
+    def start(self, thread_id: str, urls: List[str]):
+        """
+        Prefetch URLs for a thread, within its budget.
+        """
+        session = self.session(thread_id)
+        for url in urls:
+            started = len(session.tasks) + len(session.sizes)
+            if started >= _MAX_URLS:
+                break
+            if url in session.tasks or url in session.sizes or get_resource(url):
+                continue
+            PREFETCH_EVENTS.inc("started")
+            session.tasks[url] = asyncio.get_running_loop().create_task(
+                self._prefetch(session, url), context=contextvars.Context()
+            )
+
+    def use(self, thread_id: str, urls: List[str]):
+        """
+        Record that a deep dive asked for these sources.
+        """
+        session = self.session(thread_id)
+        for url in urls:
+            if url in session.used:
+                continue
+            PREFETCH_EVENTS.inc("requested")
+            if url in session.tasks or url in session.sizes:
+                PREFETCH_EVENTS.inc("hit")
+                PREFETCH_BYTES.inc("used", amount=session.sizes.get(url, 0))
+            elif get_resource(url):
+                # Downloaded before, so there was nothing to prefetch.
+                PREFETCH_EVENTS.inc("cached")
+            session.used.add(url)
+
+    def end(self, thread_id: str):
+        """
+        Cancel the prefetches of a session that are still running and count
+        the prefetched content it never used as wasted.
+        """
+        session = self.sessions.pop(thread_id, None)
+        if session is None:
+            return
+        if session.expiry is not None:
+            session.expiry.cancel()
+        for url, task in list(session.tasks.items()):
+            if url not in session.used:
+                task.cancel()
+        for url, size in session.sizes.items():
+            if url not in session.used:
+                PREFETCH_BYTES.inc("wasted", amount=size)
+
+
+_PREFETCHERS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _Prefetcher]" = (
+    weakref.WeakKeyDictionary()
+)
+
+def _get_prefetcher() -> _Prefetcher:
+    loop = asyncio.get_running_loop()
+    prefetcher = _PREFETCHERS.get(loop)
+    if prefetcher is None:
+        prefetcher = _PREFETCHERS[loop] = _Prefetcher()
+    return prefetcher
+
+def prefetch_sources(thread_id: str, urls: List[str]):
+    """
+    Start downloading the sources a deep dive is likely to ask for next into
+    the resource cache, in the background. Does nothing unless PREFETCH_ENABLED
+    is set.
+    """
+    if _ENABLED and urls:
+        _get_prefetcher().start(thread_id, urls)
+
+def use_prefetched(thread_id: str, urls: List[str]):
+    """
+    Record the sources a deep dive asked for, to count prefetch hits.
+    """
+    if _ENABLED and urls:
+        _get_prefetcher().use(thread_id, urls)
+
+def end_prefetch_session(thread_id: str):
+    """
+    End a session: cancel its running prefetches and account for unused ones.
+    """
+    prefetcher = _PREFETCHERS.get(asyncio.get_running_loop())
+    if prefetcher is not None:
+        prefetcher.end(thread_id)
+
+async def close_prefetcher():
+    """
+    End all sessions of the running event loop and wait for their prefetches
+    to be cancelled.
+    """
+    prefetcher = _PREFETCHERS.pop(asyncio.get_running_loop(), None)
+    if prefetcher is None:
+        return
+    tasks = [task for session in prefetcher.sessions.values() for task in session.tasks.values()]
+    for thread_id in list(prefetcher.sessions):
+        prefetcher.end(thread_id)
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+def get_prefetch_stats() -> Dict[str, float]:
+    """
+    Get the prefetch counters, with the hit rate of the deep-dive sources that
+    were not cached already and the share of prefetched bytes that were wasted.
+    """
+    requested = PREFETCH_EVENTS.value("requested") - PREFETCH_EVENTS.value("cached")
+    fetched = PREFETCH_BYTES.value("fetched")
+    stats = {
+        event: PREFETCH_EVENTS.value(event)
+        for event in ("started", "completed", "failed", "cancelled", "requested", "cached", "hit")
+    }
+    stats.update({
+        f"{kind}_bytes": PREFETCH_BYTES.value(kind) for kind in ("fetched", "used", "wasted")
+    })
+    stats["hit_rate"] = stats["hit"] / requested if requested else 0.0
+    stats["wasted_ratio"] = stats["wasted_bytes"] / fetched if fetched else 0.0
+    return stats
@@ -2,17 +2,72 @@
 Prompt
 """
 
+import os
+import logging
 from typing_extensions import Dict, Any, List
+from research_canvas.crewai.download import search_resources, get_resources_tokens
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of estimated tokens of resource content put into the prompt.
+_RESOURCE_TOKEN_BUDGET = int(os.getenv("PROMPT_RESOURCE_TOKEN_BUDGET", "4000"))
+# Chunks hold up to 200 tokens; fetching more candidates than the budget can
+# hold at a quarter of that lets short chunks fill the gaps.
+_MIN_CHUNK_TOKENS = 50
+
+
+def _select_passages(
+    research_question: str,
+    car_name: str,
+    resources: List[Dict[str, Any]],
+    token_budget: int
+) -> str:
+    """
+    Pick the most relevant resource chunks that fit the token budget, each
+    tagged with its source URL.
+    """
+    if not resources:
+        return "None yet."
+
+    candidates = search_resources(
+        f"{research_question} {car_name}",
+        resources,
+        k=max(1, token_budget // _MIN_CHUNK_TOKENS)
+    )
+    total_tokens = get_resources_tokens(resources)
+    used_tokens = 0
+    passages = []
+    for passage in candidates:
+        if used_tokens + passage.tokens > token_budget:
+            continue
+        used_tokens += passage.tokens
+        passages.append(f"[Source: {passage.url}]\n{passage.text}")
+
+    logger.info(
+        "Prompt resources: %d of %d tokens included, %d saved",
+        used_tokens, total_tokens, total_tokens - used_tokens
+    )
+
+    listing = "\n".join(
+        f"- {resource.get('title') or resource['url']} ({resource['url']})"
+        + (f": {resource['description']}" if resource.get("description") else "")
+        for resource in resources
+    )
+    return f"{listing}\n\nRelevant passages:\n\n" + "\n\n".join(passages)
 
 def format_prompt(
     research_question: str,
     car_name: str,
     report: str,
-    resources: List[Dict[str, Any]]
+    resources: List[Dict[str, Any]],
+    token_budget: int = _RESOURCE_TOKEN_BUDGET
 ):
     """
     Format the main prompt.
+    Only the resource passages most relevant to the research question and car
+    that fit in `token_budget` estimated tokens are included.
     """
+    passages = _select_passages(research_question, car_name, resources, token_budget)
 
     return f"""
         You are an expert AI Car Research Assistant.
@@ -25,6 +80,7 @@ def format_prompt(
         You should use the search tool to get resources before answering the user's question.
         After providing initial recommendations (from "Search" tool), DO NOT immediately search again or write a report unless explicitly asked. Instead, present the recommendations and ask the user if they'd like a "Deep Dive or Review" on any specific car, or if they want to refine the search, or ask a different question.
         If the user then asks for a detailed review of a specific car (e.g., "Tell me more about [Car Name]", "Review the [Car Name]"), use the "DeepDiveReview" tool with the specified car_name.
+        When a request needs several tools, such as a deep dive on each of several cars, call them all in one response; they run at the same time.
         If you finished writing the report, ask the user proactively for next steps, changes etc, make it engaging.
         If a research question is provided, YOU MUST NOT ASK FOR IT AGAIN.
 
@@ -39,5 +95,5 @@ def format_prompt(
         {report}
 
         Here are the resources that you have available:
-        {resources}
+        {passages}
     """
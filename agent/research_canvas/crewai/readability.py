@@ -0,0 +1,300 @@
+"""
+Main-content extraction from HTML pages, readability-style.
+"""
+
+import re
+from html import escape
+from html.parser import HTMLParser
+from typing_extensions import Dict, List, Optional, Tuple, Union
+
+# Elements dropped with everything in them.
+_SKIPPED = frozenset((
+    "script", "style", "noscript", "template", "svg", "iframe", "canvas", "object", "embed",
+))
+# Page chrome around the content, dropped before scoring.
+_CHROME = frozenset(("nav", "footer", "aside", "form", "button", "select", "dialog", "menu"))
+_VOID = frozenset((
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr",
+))
+# Elements a paragraph-like element implicitly closes when it starts.
+_CLOSED_BY_BLOCK = frozenset(("p", "li", "dt", "dd", "option"))
+_BLOCKS = frozenset((
+    "address", "article", "blockquote", "div", "dl", "figure", "h1", "h2", "h3", "h4", "h5", "h6",
+    "hr", "li", "main", "ol", "p", "pre", "section", "table", "ul",
+))
+# Attributes html2text uses; the others are dropped from the output.
+_KEPT_ATTRIBUTES = ("href", "src", "alt", "title")
+
+# Words in class and id attributes that mark chrome or content.
+_UNLIKELY = frozenset((
+    "ad", "ads", "advert", "advertisement", "banner", "breadcrumb", "breadcrumbs", "comment",
+    "comments", "cookie", "disqus", "footer", "masthead", "menu", "nav", "navbar", "newsletter",
+    "outbrain", "pager", "pagination", "popup", "promo", "related", "share", "sharing", "sidebar",
+    "social", "sponsor", "sponsored", "subscribe", "taboola", "widget",
+))
+_LIKELY = frozenset((
+    "article", "body", "content", "entry", "main", "post", "story", "text", "review",
+))
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Text of a paragraph below this many characters does not count.
+_MIN_PARAGRAPH = 25
+# Below this much text the page is returned as it is.
+_MIN_CONTENT = 250
+
+
+class _Node:
+    __slots__ = ("tag", "attrs", "children", "parent", "score", "length", "commas", "link_length")
+
+    def __init__(self, tag: str, attrs: Dict[str, str], parent: Optional["_Node"]):
+        self.tag = tag
+        self.attrs = attrs
+        self.children: List[Union["_Node", str]] = []
+        self.parent = parent
+        self.score = 0.0
+        # Text length, commas and length of link text, set by _measure.
+        self.length = 0
+        self.commas = 0
+        self.link_length = 0
+
+
+class _TreeBuilder(HTMLParser):
+    """
+    Builds a forgiving element tree: unclosed elements are closed by their
+    parent's end tag, and stray end tags are ignored.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = _Node("#root", {}, None)
+        self._current = self.root
+        self._skipping = 0
+        # Open elements per tag, so stray end tags are ignored without
+        # walking the open elements.
+        self._open: Dict[str, int] = {}
+
+    def _close_current(self):
+        self._open[self._current.tag] -= 1
+        self._current = self._current.parent or self.root
+
+    def handle_starttag(self, tag, attrs):
+        if self._skipping:
+            if tag in _SKIPPED:
+                self._skipping += 1
+            return
+        if tag in _SKIPPED:
+            self._skipping = 1
+            return
+        if tag in _BLOCKS and self._current.tag in _CLOSED_BY_BLOCK and not (
+            tag == "li" and self._current.tag != "li"
+        ):
+            self._close_current()
+        node = _Node(tag, {name: value or "" for name, value in attrs}, self._current)
+        self._current.children.append(node)
+        if tag not in _VOID:
+            self._current = node
+            self._open[tag] = self._open.get(tag, 0) + 1
+
+    def handle_startendtag(self, tag, attrs):
+        if not self._skipping and tag not in _SKIPPED:
+            self._current.children.append(_Node(tag, {name: value or "" for name, value in attrs}, self._current))
+
+    def handle_endtag(self, tag):
+        if self._skipping:
+            if tag in _SKIPPED:
+                self._skipping -= 1
+            return
+        if not self._open.get(tag):
+            return
+        while self._current.tag != tag:
+            self._close_current()
+        self._close_current()
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self._current.children.append(data)
+
+
+def _class_words(node: _Node) -> set:
+    return set(_WORD.findall(f"{node.attrs.get('class', '')} {node.attrs.get('id', '')}".lower()))
+
+def _unlikely(node: _Node) -> bool:
+    if node.tag in _CHROME:
+        return True
+    if node.tag in ("article", "main", "body", "html"):
+        return False
+    words = _class_words(node)
+    return bool(words & _UNLIKELY) and not words & _LIKELY
+
+def _strip_chrome(root: _Node):
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        node.children = [
+            child for child in node.children
+            if isinstance(child, str) or not _unlikely(child)
+        ]
+        stack.extend(child for child in node.children if not isinstance(child, str))
+
+def _text(node: _Node) -> str:
+    parts: List[str] = []
+    stack: List[Union[_Node, str]] = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            parts.append(item)
+        else:
+            stack.extend(reversed(item.children))
+    return " ".join("".join(parts).split())
+
+def _link_density(node: _Node) -> float:
+    return node.link_length / node.length if node.length else 0.0
+
+def _class_weight(node: _Node) -> float:
+    words = _class_words(node)
+    return 25.0 * bool(words & _LIKELY) - 25.0 * bool(words & _UNLIKELY)
+
+def _is_paragraph(node: _Node) -> bool:
+    if node.tag in ("p", "pre", "td", "blockquote"):
+        return True
+    # A div with no blocks in it is written like a paragraph.
+    return node.tag == "div" and not any(
+        not isinstance(child, str) and child.tag in _BLOCKS for child in node.children
+    )
+
+def _elements(node: _Node):
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        yield item
+        stack.extend(child for child in reversed(item.children) if not isinstance(child, str))
+
+def _measure(root: _Node):
+    """
+    Measure the text of every element in one pass, children before parents,
+    so that deeply nested pages are not walked again for every ancestor.
+    """
+    for node in reversed(list(_elements(root))):
+        length = commas = link_length = 0
+        for child in node.children:
+            if isinstance(child, str):
+                text = " ".join(child.split())
+                length += len(text)
+                commas += text.count(",")
+            else:
+                length += child.length
+                commas += child.commas
+                link_length += child.link_length
+        node.length = length
+        node.commas = commas
+        node.link_length = length if node.tag == "a" else link_length
+
+def _best_candidate(root: _Node) -> Optional[_Node]:
+    candidates: Dict[int, _Node] = {}
+    for node in _elements(root):
+        if not _is_paragraph(node):
+            continue
+        if node.length < _MIN_PARAGRAPH:
+            continue
+        # A point per paragraph, per comma and per 100 characters, up to 3.
+        score = 1 + node.commas + min(node.length // 100, 3)
+        ancestor, share = node.parent, 1.0
+        for _ in range(3):
+            if ancestor is None or ancestor is root:
+                break
+            if id(ancestor) not in candidates:
+                candidates[id(ancestor)] = ancestor
+                ancestor.score = _class_weight(ancestor)
+            ancestor.score += score * share
+            ancestor, share = ancestor.parent, share / 2
+    best: Optional[_Node] = None
+    best_score = 0.0
+    for candidate in candidates.values():
+        score = candidate.score * (1 - _link_density(candidate))
+        if score > best_score:
+            best, best_score = candidate, score
+    return best
+
+def _content(candidate: _Node) -> List[_Node]:
+    """
+    The best candidate and the siblings that look like part of the same
+    content, in page order.
+    """
+    if candidate.parent is None:
+        return [candidate]
+    threshold = max(10.0, candidate.score * 0.2)
+    content = []
+    for sibling in candidate.parent.children:
+        if isinstance(sibling, str):
+            continue
+        if sibling is candidate or sibling.score >= threshold:
+            content.append(sibling)
+        elif sibling.tag == "p" and sibling.length > 80 and _link_density(sibling) < 0.25:
+            content.append(sibling)
+    return content
+
+def _clean(root: _Node):
+    """
+    Drop link lists and other blocks of the content that are mostly links.
+    """
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        kept: List[Union[_Node, str]] = []
+        for child in node.children:
+            if (
+                not isinstance(child, str) and child.tag in ("ul", "ol", "div", "section", "table")
+                and _link_density(child) > 0.5
+            ):
+                continue
+            kept.append(child)
+        node.children = kept
+        stack.extend(child for child in kept if not isinstance(child, str))
+
+def _to_html(root: _Node, parts: List[str]):
+    # (node or text, whether it is the node's end tag)
+    stack: List[Tuple[Union[_Node, str], bool]] = [(root, False)]
+    while stack:
+        item, end = stack.pop()
+        if isinstance(item, str):
+            parts.append(escape(item, quote=False))
+            continue
+        if end:
+            parts.append(f"</{item.tag}>")
+            continue
+        attrs = "".join(
+            f' {name}="{escape(item.attrs[name])}"' for name in _KEPT_ATTRIBUTES if item.attrs.get(name)
+        )
+        parts.append(f"<{item.tag}{attrs}>")
+        if item.tag not in _VOID:
+            stack.append((item, True))
+            stack.extend((child, False) for child in reversed(item.children))
+
+def extract_main_content(html: str) -> str:
+    """
+    Keep the main content of a page, like the article of a review, and drop
+    the navigation, ads, comment threads, related links and footers around
+    it. Returns HTML; pages without a clear main content are returned as
+    they are.
+    """
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    root = builder.root
+    _strip_chrome(root)
+    _measure(root)
+    candidate = _best_candidate(root)
+    if candidate is None:
+        return html
+    content = _content(candidate)
+    parts: List[str] = []
+    for node in content:
+        _clean(node)
+        _to_html(node, parts)
+    extracted = "".join(parts)
+    if sum(len(_text(node)) for node in content) < _MIN_CONTENT:
+        return html
+    title = next((node for node in _elements(root) if node.tag == "title"), None)
+    if title is not None and not any(node.tag == "h1" for block in content for node in _elements(block)):
+        extracted = f"<h1>{escape(_text(title), quote=False)}</h1>{extracted}"
+    return extracted
@@ -0,0 +1,205 @@
+"""
+Deduplicated car recommendations.
+"""
+
+import os
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from typing_extensions import Any, Dict, List, NamedTuple, Optional, Tuple
+
+_YEAR = re.compile(r"\b(19[5-9]\d|20\d\d)\b")
+# Hyphens inside model names: CR-V, RAV-4, CX-5, Mercedes-Benz.
+_INNER_HYPHEN = re.compile(r"(?<=\w)-(?=\w)")
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+_MAKE_ALIASES = {
+    "vw": "volkswagen",
+    "chevy": "chevrolet",
+    "merc": "mercedes",
+    "mercedesbenz": "mercedes",
+    "benz": "mercedes",
+    "landrover": "land rover",
+    "alfa": "alfa romeo",
+}
+_FILLER = frozenset(("the", "a", "an", "new", "all"))
+
+# Minimum share of the words of a free-text car name that must be found in a
+# recommendation's name for a fuzzy match. Words up to this long, like "3" in
+# "Model 3" or "x5", must match exactly; longer ones may have typos.
+_MATCH_THRESHOLD = 0.8
+_EXACT_WORD_LENGTH = 3
+_WORD_THRESHOLD = 0.8
+
+# Search results kept per recommendation as the sources of a deep dive.
+_MAX_SOURCES = int(os.getenv("RECOMMENDATION_MAX_SOURCES", "2"))
+
+_MAX_CONTENT_SENTENCES = 8
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+
+class CarKey(NamedTuple):
+    """
+    A normalized car name: make and model words, and the model year if any.
+    """
+    model: str
+    year: str
+
+
+def car_key(name: str) -> CarKey:
+    """
+    Normalize a car name, so "2024 Toyota RAV-4 Hybrid" and "toyota rav4
+    hybrid (2024)" get the same key.
+    """
+    text = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii").lower()
+    match = _YEAR.search(text)
+    year = match.group(1) if match else ""
+    text = _YEAR.sub(" ", _INNER_HYPHEN.sub("", text))
+    words = []
+    for word in _NON_WORD.split(text):
+        if word and word not in _FILLER:
+            words.append(_MAKE_ALIASES.get(word, word))
+    return CarKey(" ".join(words), year)
+
+
+def _merge_content(existing: str, new: str) -> str:
+    sentences = _SENTENCE.split(existing.strip()) if existing.strip() else []
+    seen = {sentence.lower() for sentence in sentences}
+    for sentence in _SENTENCE.split(new.strip()):
+        if len(sentences) >= _MAX_CONTENT_SENTENCES:
+            break
+        if sentence and sentence.lower() not in seen:
+            sentences.append(sentence)
+            seen.add(sentence.lower())
+    return " ".join(sentences)
+
+
+def _similarity(words: List[str], model: str) -> float:
+    candidates = model.split()
+    total = 0.0
+    for word in words:
+        if word in candidates:
+            total += 1
+        elif len(word) > _EXACT_WORD_LENGTH:
+            best = max((SequenceMatcher(None, word, other).ratio() for other in candidates), default=0.0)
+            total += best if best >= _WORD_THRESHOLD else 0.0
+    return total / len(words)
+
+
+class RecommendationIndex:
+    """
+    Index over the recommendations list in the state.
+
+    The list stays the only copy, in the format the UI renders, so the state
+    carries each car once and nothing else; the lookup tables are rebuilt
+    from it in one pass. Entries that other indexes over the same list, like
+    those of parallel tool calls, append are indexed before every lookup.
+    """
+
+    def __init__(self, recommendations: List[Dict[str, Any]]):
+        self.recommendations = recommendations
+        self._by_key: Dict[CarKey, int] = {}
+        # model words -> positions of the recommendations with those words
+        self._by_model: Dict[str, List[int]] = {}
+        self._indexed = 0
+        self._sync()
+
+    def _sync(self):
+        for position in range(self._indexed, len(self.recommendations)):
+            self._add_key(car_key(self.recommendations[position].get("car", "")), position)
+        self._indexed = len(self.recommendations)
+
+    def _add_key(self, key: CarKey, position: int):
+        self._by_key.setdefault(key, position)
+        self._by_model.setdefault(key.model, []).append(position)
+
+    def _position(self, key: CarKey) -> Optional[int]:
+        self._sync()
+        position = self._by_key.get(key)
+        if position is not None:
+            return position
+        # Without a year on either side, the same make and model is the same car.
+        for position in self._by_model.get(key.model, ()):
+            year = car_key(self.recommendations[position].get("car", "")).year
+            if not key.year or not year:
+                return position
+        return None
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        """
+        The recommendation for exactly this car, after normalization.
+        """
+        position = self._position(car_key(name))
+        return None if position is None else self.recommendations[position]
+
+    def match(self, name: str) -> Optional[Dict[str, Any]]:
+        """
+        The recommendation a free-text car name refers to: an exact match if
+        there is one, otherwise the single name that contains most of its
+        words, above the threshold.
+        """
+        recommendation = self.get(name)
+        if recommendation is not None:
+            return recommendation
+        words = car_key(name).model.split()
+        if not words:
+            return None
+        self._sync()
+        scores: List[Tuple[float, int]] = []
+        for model, positions in self._by_model.items():
+            score = _similarity(words, model)
+            scores.extend((score, position) for position in positions)
+        scores.sort(reverse=True)
+        if not scores or scores[0][0] < _MATCH_THRESHOLD:
+            return None
+        if len(scores) > 1 and scores[1][0] == scores[0][0]:
+            # Ambiguous, like "Toyota" with several Toyotas recommended.
+            return None
+        return self.recommendations[scores[0][1]]
+
+    def merge(self, recommendations: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Add new recommendations and merge the content of ones already in the
+        index into their entries. Returns the added and the updated entries.
+        """
+        added: List[Dict[str, Any]] = []
+        updated: List[Dict[str, Any]] = []
+        for recommendation in recommendations:
+            key = car_key(recommendation.get("car", ""))
+            position = self._position(key)
+            if position is None:
+                entry = dict(recommendation)
+                self.recommendations.append(entry)
+                self._sync()
+                added.append(entry)
+                continue
+            entry = self.recommendations[position]
+            content = _merge_content(entry.get("content", ""), recommendation.get("content", ""))
+            if content != entry.get("content", ""):
+                entry["content"] = content
+                if not any(other is entry for other in added + updated):
+                    updated.append(entry)
+        return added, updated
+
+
+def attach_sources(recommendations: List[Dict[str, Any]], search_results: List[Dict[str, Any]]):
+    """
+    Keep the top search results that mention each recommended car, in search
+    order, as its "sources": the pages a deep dive on it would read.
+    """
+    results = []
+    for response in search_results:
+        for result in response.get("results", []):
+            if result.get("url"):
+                text = f"{result.get('title', '')} {result.get('content', '')}"
+                results.append((result, set(car_key(text).model.split())))
+    for recommendation in recommendations:
+        sources = recommendation.setdefault("sources", [])
+        words = set(car_key(recommendation.get("car", "")).model.split())
+        urls = {source["url"] for source in sources}
+        for result, text_words in results:
+            if len(sources) >= _MAX_SOURCES:
+                break
+            if words and words <= text_words and result["url"] not in urls:
+                sources.append({"url": result["url"], "title": result.get("title", "")})
+                urls.add(result["url"])
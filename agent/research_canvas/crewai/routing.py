@@ -0,0 +1,302 @@
+"""
+Latency-aware routing of model calls over several models and endpoints.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import httpx
+from litellm.exceptions import (
+    APIConnectionError,
+    APIError,
+    InternalServerError,
+    RateLimitError,
+    ServiceUnavailableError,
+    Timeout
+)
+from typing_extensions import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple, TypeVar
+from research_canvas.crewai.metrics import ROUTE_EVENTS
+
+logger = logging.getLogger(__name__)
+
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://openrouter.ai/api/v1")
+DEFAULT_MODEL = os.getenv("LLM_MODEL", "openai/deepseek/deepseek-chat-v3-0324")
+# Models to route calls to, in order of preference: comma-separated `model`
+# or `model@base_url` entries. Defaults to LLM_MODEL at LLM_BASE_URL.
+_ROUTES = os.getenv("LLM_ROUTES", "")
+# Seconds without a first token after which a call is also sent to the next
+# route; 0 turns hedging off.
+_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "2"))
+# Consecutive failures after which a route gets no calls, and the seconds
+# until one call is let through to probe it again.
+_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+# Weight of the latest call in the rolling statistics.
+_SMOOTHING = 0.2
+
+# Failures of the endpoint rather than of the request, so worth trying elsewhere.
+ROUTE_ERRORS = (
+    APIConnectionError,
+    Timeout,
+    RateLimitError,
+    ServiceUnavailableError,
+    InternalServerError,
+    APIError,
+    httpx.TransportError,
+    asyncio.TimeoutError
+)
+
+T = TypeVar("T")
+
+
+class ModelUnavailableError(Exception):
+    """
+    No route could serve a model call.
+    """
+
+
+class Route(NamedTuple):
+    """
+    A model at an OpenAI-compatible endpoint.
+    """
+    model: str
+    base_url: str
+
+    def __str__(self):
+        return f"{self.model}@{self.base_url}"
+
+
+def parse_routes(spec: str, base_url: str = LLM_BASE_URL) -> List[Route]:
+    """
+    Parse comma-separated `model` or `model@base_url` entries; models without
+    an endpoint are served from `base_url`.
+    """
+    routes = []
+    for entry in spec.split(","):
+        model, _, url = entry.strip().partition("@")
+        if model:
+            routes.append(Route(model, url.strip() or base_url))
+    return routes
+
+
+class _RouteStats:
+    """
+    Rolling statistics and circuit breaker state of one route.
+    """
+
+    __slots__ = ("latency", "error_rate", "failures", "open_until", "probing")
+
+    def __init__(self):
+        # Rolling time to first token, once a call has been served.
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+
+
+class Router:
+    """
+    Sends each call to the fastest healthy route, hedges it on the next one if
+    no first token arrives in time and fails over when a route errors.
+
+    A route that fails `breaker_failures` times in a row is skipped for
+    `breaker_cooldown` seconds; then one call probes it, and closes the
+    breaker again if it succeeds.
+    """
+
+    def __init__(
+        self,
+        routes: List[Route],
+        hedge_delay: float = _HEDGE_DELAY,
+        breaker_failures: int = _BREAKER_FAILURES,
+        breaker_cooldown: float = _BREAKER_COOLDOWN
+    ):
+        self.routes = routes
+        self.hedge_delay = hedge_delay
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self._stats: Dict[Route, _RouteStats] = {route: _RouteStats() for route in routes}
+
+    def _available(self, route: Route, now: float) -> bool:
+        stats = self._stats[route]
+        if stats.failures < self.breaker_failures:
+            return True
+        return now >= stats.open_until and not stats.probing
+
+    def ranked(self) -> List[Route]:
+        """
+        The routes that may take a call, fastest expected first. Routes that
+        have not served a call yet come after the others, in configured order.
+        """
+        now = time.monotonic()
+
+        def score(position: int, route: Route) -> Tuple[int, float, int]:
+            stats = self._stats[route]
+            if stats.latency is None:
+                return (1, 0.0, position)
+            # Expected wait, counting the calls that fail and must be retried.
+            return (0, stats.latency / max(0.05, 1 - stats.error_rate), position)
+
+        ranked = sorted(
+            (score(position, route), route)
+            for position, route in enumerate(self.routes)
+            if self._available(route, now)
+        )
+        return [route for _, route in ranked]
+
+    def _succeeded(self, route: Route, latency: float):
+        stats = self._stats[route]
+        stats.latency = latency if stats.latency is None else (
+            (1 - _SMOOTHING) * stats.latency + _SMOOTHING * latency
+        )
+        stats.error_rate *= 1 - _SMOOTHING
+        if stats.failures >= self.breaker_failures:
+            logger.info("Model route %s recovered", route)
+            ROUTE_EVENTS.inc(str(route), "closed")
+        stats.failures = 0
+
+    def _slow(self, route: Route, elapsed: float):
+        """
+        Count a call that lost a hedge race after `elapsed` seconds without a
+        first token: its latency is at least that.
+        """
+        stats = self._stats[route]
+        if stats.latency is None or elapsed > stats.latency:
+            stats.latency = elapsed if stats.latency is None else (
+                (1 - _SMOOTHING) * stats.latency + _SMOOTHING * elapsed
+            )
+
+    def failed(self, route: Route, error: BaseException):
+        """
+        Record a failed call on a route, opening its breaker after too many.
+        """
+        stats = self._stats[route]
+        stats.error_rate = (1 - _SMOOTHING) * stats.error_rate + _SMOOTHING
+        stats.failures += 1
+        ROUTE_EVENTS.inc(str(route), "failed")
+        if stats.failures >= self.breaker_failures:
+            stats.open_until = time.monotonic() + self.breaker_cooldown
+            logger.warning(
+                "Model route %s failed %d times in a row, skipping it for %.0fs: %s",
+                route, stats.failures, self.breaker_cooldown, error
+            )
+            ROUTE_EVENTS.inc(str(route), "opened")
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        The rolling statistics of every route.
+        """
+        now = time.monotonic()
+        return {
+            str(route): {
+                "latency": stats.latency,
+                "error_rate": stats.error_rate,
+                "failures": stats.failures,
+                "available": self._available(route, now),
+            }
+            for route, stats in self._stats.items()
+        }
+
+    async def first(
+        self,
+        attempt: Callable[[Route], Awaitable[T]],
+        release: Callable[[T], Awaitable[None]]
+    ) -> Tuple[Route, T]:
+        """
+        Run `attempt` on the best route and return the route and result of
+        the first attempt to succeed. An attempt should return as soon as the
+        first token arrives. If it has not within the hedge delay, it is
+        also run on the next route; if it fails, the next route is tried at
+        once. Attempts that lose are cancelled, or passed to `release` if
+        they had already returned.
+        """
+        candidates = self.ranked()
+        pending: Dict["asyncio.Future[T]", Tuple[Route, float]] = {}
+        # Routes whose breaker this call is probing.
+        probes: List[Route] = []
+        last_error: Optional[BaseException] = None
+        hedged = False
+        hedge_at = 0.0
+
+        def launch() -> Optional[Route]:
+            nonlocal hedge_at
+            now = time.monotonic()
+            while candidates:
+                route = candidates.pop(0)
+                # Another call may have started probing it since it was
+                # ranked; ranking and the first launch run without a pause.
+                if not self._available(route, now):
+                    continue
+                stats = self._stats[route]
+                if stats.failures >= self.breaker_failures:
+                    stats.probing = True
+                    probes.append(route)
+                pending[asyncio.ensure_future(attempt(route))] = (route, now)
+                hedge_at = now + self.hedge_delay
+                return route
+            return None
+
+        if launch() is None:
+            raise ModelUnavailableError("All model routes are failing, try again later.")
+        try:
+            while pending:
+                timeout = None
+                if self.hedge_delay > 0 and not hedged and candidates:
+                    timeout = max(0.0, hedge_at - time.monotonic())
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    route = launch()
+                    if route is not None:
+                        ROUTE_EVENTS.inc(str(route), "hedged")
+                    continue
+                winner: Optional[Tuple[Route, T]] = None
+                for task in done:
+                    route, started = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        if winner is None:
+                            winner = (route, task.result())
+                            self._succeeded(route, time.monotonic() - started)
+                        else:
+                            await release(task.result())
+                        continue
+                    if not isinstance(error, ROUTE_ERRORS):
+                        raise error
+                    self.failed(route, error)
+                    last_error = error
+                if winner is not None:
+                    if hedged:
+                        ROUTE_EVENTS.inc(str(winner[0]), "won")
+                    for route, started in pending.values():
+                        self._slow(route, time.monotonic() - started)
+                    return winner
+                if not pending:
+                    route = launch()
+                    if route is not None:
+                        ROUTE_EVENTS.inc(str(route), "failover")
+        finally:
+            # Whatever the outcome of this call's probes, even none because
+            # it was cancelled or failed on its request, they are over.
+            for route in probes:
+                self._stats[route].probing = False
+            for task in pending:
+                task.cancel()
+            for result in await asyncio.gather(*pending, return_exceptions=True):
+                if not isinstance(result, BaseException):
+                    await release(result)
+        raise ModelUnavailableError(f"No model route could serve the call: {last_error}") from last_error
+
+
+_ROUTER: Optional[Router] = None
+
+def get_router() -> Router:
+    """
+    Get the router over the configured routes, shared by all model calls.
+    """
+    global _ROUTER # pylint: disable=global-statement
+    if _ROUTER is None:
+        _ROUTER = Router(parse_routes(_ROUTES) or [Route(DEFAULT_MODEL, LLM_BASE_URL)])
+    return _ROUTER
@@ -0,0 +1,106 @@
+"""
+Compact search results for the extraction prompt.
+"""
+
+import os
+import re
+import logging
+from typing_extensions import Any, Dict, List
+from research_canvas.crewai.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Estimated token budget for the search results sent to the extraction call.
+_TOKEN_BUDGET = int(os.getenv("SEARCH_RESULTS_TOKEN_BUDGET", "1500"))
+# Snippets longer than this are cut down to their first sentences.
+_SNIPPET_TOKENS = int(os.getenv("SEARCH_SNIPPET_TOKENS", "80"))
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _snippet(content: str, max_tokens: int) -> str:
+    """
+    The leading whole sentences of a result's content that fit `max_tokens`,
+    or its leading words if even the first sentence does not.
+    """
+    content = " ".join(content.split())
+    if estimate_tokens(content) <= max_tokens:
+        return content
+    kept: List[str] = []
+    tokens = 0
+    for sentence in _SENTENCE_END.split(content):
+        tokens += estimate_tokens(sentence)
+        if tokens > max_tokens:
+            break
+        kept.append(sentence)
+    if kept:
+        return " ".join(kept)
+    words = []
+    tokens = 0
+    for word in content.split():
+        tokens += estimate_tokens(word)
+        if tokens > max_tokens:
+            break
+        words.append(word)
+    return " ".join(words) + " …"
+
+def _merged_results(search_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    The results of all queries, one per URL with its best score, best first
+    and then in search order.
+    """
+    by_url: Dict[str, Dict[str, Any]] = {}
+    for response in search_results:
+        for result in response.get("results", []):
+            url = result.get("url")
+            if not url:
+                continue
+            score = result.get("score") or 0.0
+            existing = by_url.get(url)
+            if existing is None:
+                by_url[url] = {**result, "score": score}
+            elif score > existing["score"]:
+                # Keep the first position but the better scored snippet.
+                existing.update(result, score=score)
+    return sorted(by_url.values(), key=lambda result: -result["score"])
+
+def compact_search_results(
+    search_results: List[Dict[str, Any]],
+    token_budget: int = _TOKEN_BUDGET,
+    snippet_tokens: int = _SNIPPET_TOKENS
+) -> str:
+    """
+    Format Tavily responses for the model: the results of all queries merged
+    and deduplicated by URL, ranked by score, each with only its title, URL,
+    score and a trimmed snippet, as many as fit in `token_budget` estimated
+    tokens. Failed queries are listed so the model knows results are missing.
+    """
+    queries = [response.get("query", "") for response in search_results]
+    lines = ["Queries: " + "; ".join(query for query in queries if query)]
+    lines.extend(
+        f"Search for {response.get('query', '')!r} failed: {response['error']}"
+        for response in search_results if response.get("error")
+    )
+    used_tokens = sum(estimate_tokens(line) for line in lines)
+    results = _merged_results(search_results)
+    included = 0
+    for result in results:
+        entry = (
+            f"[{included + 1}] {' '.join((result.get('title') or '').split())} "
+            f"({result['url']}, score {result['score']:.2f})\n"
+            f"{_snippet(result.get('content') or '', snippet_tokens)}"
+        )
+        tokens = estimate_tokens(entry)
+        if used_tokens + tokens > token_budget:
+            continue
+        used_tokens += tokens
+        included += 1
+        lines.append(entry)
+    if not included:
+        lines.append("No results.")
+
+    logger.info(
+        "Search results: %d of %d unique results included, %d estimated tokens",
+        included, len(results), used_tokens
+    )
+    return "\n".join(lines)
@@ -0,0 +1,144 @@
+"""
+State serialization.
+"""
+import json
+from collections import OrderedDict
+from typing_extensions import Any, Callable, Dict
+from litellm.types.utils import Message as LiteLLMMessage, ChatCompletionMessageToolCall
+
+try:
+    import orjson
+except ImportError: # pragma: no cover
+    orjson = None
+
+_PRIMITIVE_TYPES = (str, int, float, bool, type(None))
+
+# Converted messages, keyed by object id. The message itself is kept in the
+# entry so the id cannot be reused while the entry is alive.
+_MESSAGE_MEMO: "OrderedDict[int, tuple]" = OrderedDict()
+_MESSAGE_MEMO_SIZE = 4096
+
+
+def _convert_primitive(value):
+    return value
+
+def _convert_dict(value):
+    converters = _CONVERTERS
+    return {
+        key: item if converters.get(type(item)) is _convert_primitive
+        else prepare_state_for_serialization(item)
+        for key, item in value.items()
+    }
+
+def _convert_list(value):
+    converters = _CONVERTERS
+    return [
+        item if converters.get(type(item)) is _convert_primitive
+        else prepare_state_for_serialization(item)
+        for item in value
+    ]
+
+def _convert_message(message):
+    tool_calls = getattr(message, 'tool_calls', [])
+    fingerprint = (
+        getattr(message, 'role', ''),
+        getattr(message, 'content', ''),
+        getattr(message, 'tool_call_id', None),
+        id(tool_calls),
+        len(tool_calls) if tool_calls else 0
+    )
+    memo = _MESSAGE_MEMO.get(id(message))
+    if memo is not None and memo[0] is message and memo[1] == fingerprint:
+        _MESSAGE_MEMO.move_to_end(id(message))
+        return memo[2]
+
+    result = {
+        'role': fingerprint[0],
+        'content': fingerprint[1],
+        'tool_calls': prepare_state_for_serialization(tool_calls),
+        'tool_call_id': fingerprint[2]
+    }
+    _MESSAGE_MEMO[id(message)] = (message, fingerprint, result)
+    if len(_MESSAGE_MEMO) > _MESSAGE_MEMO_SIZE:
+        _MESSAGE_MEMO.popitem(last=False)
+    return result
+
+def _convert_tool_call(tool_call):
+    function_data = {}
+    if hasattr(tool_call, 'function'):
+        function_data = {
+            'name': getattr(tool_call.function, 'name', ''),
+            'arguments': getattr(tool_call.function, 'arguments', '')
+        }
+    return {
+        'id': getattr(tool_call, 'id', ''),
+        'type': getattr(tool_call, 'type', ''),
+        'function': function_data
+    }
+
+def _convert_object(obj):
+    # Try to convert other objects to dict if possible
+    try:
+        if hasattr(obj, '__dict__'):
+            return prepare_state_for_serialization(obj.__dict__)
+        if hasattr(obj, 'model_dump'):
+            return prepare_state_for_serialization(obj.model_dump())
+        if hasattr(obj, 'to_dict') and callable(getattr(obj, 'to_dict')):
+            return prepare_state_for_serialization(obj.to_dict())
+        return prepare_state_for_serialization(vars(obj))
+    except Exception: # pylint: disable=broad-except
+        # If all else fails, convert to string
+        return str(obj)
+
+
+# type -> converter, filled in the first time a type is seen
+_CONVERTERS: Dict[type, Callable[[Any], Any]] = {
+    dict: _convert_dict,
+    list: _convert_list,
+    **{cls: _convert_primitive for cls in _PRIMITIVE_TYPES},
+}
+
+def _resolve_converter(cls: type) -> Callable[[Any], Any]:
+    if issubclass(cls, dict):
+        return _convert_dict
+    if issubclass(cls, list):
+        return _convert_list
+    if issubclass(cls, _PRIMITIVE_TYPES):
+        return _convert_primitive
+    if issubclass(cls, LiteLLMMessage) or cls.__name__ == "Message":
+        return _convert_message
+    if issubclass(cls, ChatCompletionMessageToolCall) or cls.__name__ == "ChatCompletionMessageToolCall":
+        return _convert_tool_call
+    return _convert_object
+
+def prepare_state_for_serialization(state):
+    """
+    Recursively convert non-serializable objects in state to serializable dictionaries.
+    Converted messages are memoized across calls and must not be mutated.
+    """
+    cls = type(state)
+    converter = _CONVERTERS.get(cls)
+    if converter is None:
+        converter = _CONVERTERS[cls] = _resolve_converter(cls)
+    return converter(state)
+
+
+class MessageEncoder(json.JSONEncoder):
+    """
+    JSON encoder for state holding LiteLLM messages and tool calls.
+    """
+    def default(self, o):
+        return prepare_state_for_serialization(o)
+
+
+def dumps(state: Any) -> str:
+    """
+    Serialize state to a JSON string, using orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            state,
+            default=prepare_state_for_serialization,
+            option=orjson.OPT_NON_STR_KEYS
+        ).decode("utf-8")
+    return json.dumps(state, cls=MessageEncoder, separators=(",", ":"))
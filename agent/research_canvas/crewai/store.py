@@ -0,0 +1,225 @@
+"""
+Persistent stores for downloaded resources and extracted recommendations.
+"""
+
+import os
+import time
+import asyncio
+import weakref
+import aiosqlite
+from typing_extensions import NamedTuple, Optional
+
+
+class StoredResource(NamedTuple):
+    """
+    A converted resource together with the validators needed to revalidate it.
+    """
+    content: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+
+_RESOURCES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    url TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL
+)
+"""
+
+
+_EXTRACTIONS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS extractions (
+    key TEXT PRIMARY KEY,
+    arguments TEXT NOT NULL,
+    created_at REAL NOT NULL
+)
+"""
+
+
+class _SQLiteStore:
+    """
+    SQLite database that can be shared by several worker processes.
+
+    The database runs in WAL mode so readers in one process are not blocked
+    by a writer in another.
+    """
+
+    _schema = ""
+
+    def __init__(self, path: str):
+        self.path = path
+        # One connection per event loop, created on first use.
+        self._connections: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Task]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    async def _connect(self) -> aiosqlite.Connection:
+        db = await aiosqlite.connect(self.path)
+        await db.execute("PRAGMA journal_mode=WAL")
+        await db.execute("PRAGMA busy_timeout=5000")
+        await db.execute(self._schema)
+        await db.commit()
+        return db
+
+    async def _db(self) -> aiosqlite.Connection:
+        loop = asyncio.get_running_loop()
+        task = self._connections.get(loop)
+        if task is None:
+            task = loop.create_task(self._connect())
+            self._connections[loop] = task
+        return await task
+
+    async def connect(self):
+        """
+        Open the connection of the running event loop now rather than on first use.
+        """
+        await self._db()
+
+    async def close(self):
+        """
+        Close the connection of the running event loop.
+        """
+        task = self._connections.pop(asyncio.get_running_loop(), None)
+        if task is not None:
+            await (await task).close()
+
+
+class ResourceStore(_SQLiteStore):
+    """
+    SQLite-backed resource store.
+
+    Rows are read one URL at a time, so opening the store does not load it
+    into memory.
+    """
+
+    _schema = _RESOURCES_SCHEMA
+
+    async def get(self, url: str) -> Optional[StoredResource]:
+        """
+        Get a stored resource.
+        """
+        db = await self._db()
+        async with db.execute(
+            "SELECT content, etag, last_modified, fetched_at FROM resources WHERE url = ?",
+            (url,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        return StoredResource(*row) if row else None
+
+    async def put(
+        self,
+        url: str,
+        content: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None
+    ):
+        """
+        Store a converted resource and its validators.
+        """
+        db = await self._db()
+        await db.execute(
+            "INSERT OR REPLACE INTO resources (url, content, etag, last_modified, fetched_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (url, content, etag, last_modified, time.time())
+        )
+        await db.commit()
+
+    async def touch(self, url: str):
+        """
+        Record that a stored resource was successfully revalidated.
+        """
+        db = await self._db()
+        await db.execute(
+            "UPDATE resources SET fetched_at = ? WHERE url = ?",
+            (time.time(), url)
+        )
+        await db.commit()
+
+    async def delete(self, url: str):
+        """
+        Remove a stored resource.
+        """
+        db = await self._db()
+        await db.execute("DELETE FROM resources WHERE url = ?", (url,))
+        await db.commit()
+
+
+class ExtractionStore(_SQLiteStore):
+    """
+    SQLite-backed store of ExtractResources tool call arguments keyed by a
+    hash of their inputs. Holds at most `max_entries` rows, dropping the
+    oldest first.
+    """
+
+    _schema = _EXTRACTIONS_SCHEMA
+
+    def __init__(self, path: str, max_entries: int):
+        super().__init__(path)
+        self.max_entries = max_entries
+
+    async def get(self, key: str, ttl: Optional[float]) -> Optional[str]:
+        """
+        Get stored tool call arguments younger than `ttl` seconds.
+        """
+        db = await self._db()
+        async with db.execute(
+            "SELECT arguments, created_at FROM extractions WHERE key = ?",
+            (key,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None or (ttl is not None and row[1] + ttl <= time.time()):
+            return None
+        return row[0]
+
+    async def put(self, key: str, arguments: str):
+        """
+        Store tool call arguments, dropping the oldest rows over the limit.
+        """
+        db = await self._db()
+        await db.execute(
+            "INSERT OR REPLACE INTO extractions (key, arguments, created_at) VALUES (?, ?, ?)",
+            (key, arguments, time.time())
+        )
+        await db.execute(
+            "DELETE FROM extractions WHERE key NOT IN "
+            "(SELECT key FROM extractions ORDER BY created_at DESC LIMIT ?)",
+            (self.max_entries,)
+        )
+        await db.commit()
+
+
+_STORE: Optional[ResourceStore] = None
+
+def get_resource_store() -> Optional[ResourceStore]:
+    """
+    Get the persistent resource store, or None if RESOURCE_STORE_PATH is not set.
+    """
+    global _STORE # pylint: disable=global-statement
+    path = os.getenv("RESOURCE_STORE_PATH")
+    if not path:
+        return None
+    if _STORE is None or _STORE.path != path:
+        _STORE = ResourceStore(path)
+    return _STORE
+
+
+_EXTRACTION_STORE: Optional[ExtractionStore] = None
+
+def get_extraction_store() -> Optional[ExtractionStore]:
+    """
+    Get the persistent extraction store, or None if EXTRACTION_STORE_PATH is not set.
+    """
+    global _EXTRACTION_STORE # pylint: disable=global-statement
+    path = os.getenv("EXTRACTION_STORE_PATH")
+    if not path:
+        return None
+    if _EXTRACTION_STORE is None or _EXTRACTION_STORE.path != path:
+        _EXTRACTION_STORE = ExtractionStore(
+            path,
+            max_entries=int(os.getenv("EXTRACTION_STORE_MAX_ENTRIES", "10000"))
+        )
+    return _EXTRACTION_STORE
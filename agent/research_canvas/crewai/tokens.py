@@ -0,0 +1,18 @@
+"""
+Token estimation.
+"""
+
+import re
+
+# Words, numbers and single punctuation marks.
+_PIECE = re.compile(r"\w+|[^\w\s]")
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in a text without a model-specific tokenizer.
+    Counts one token per word or punctuation mark, plus one per six extra
+    characters of long words, which tracks BPE tokenizers on English prose.
+    """
+    if not text:
+        return 0
+    return sum(1 + (len(piece) - 1) // 6 for piece in _PIECE.findall(text))
@@ -2,13 +2,28 @@
 Tools
 """
 import os
+import re
 import json
+import asyncio
+import hashlib
 import logging
-from typing_extensions import Dict, Any, List, cast
-from tavily import TavilyClient
-from copilotkit.crewai import copilotkit_emit_state, copilotkit_predict_state, copilotkit_stream
-from litellm import completion
-from litellm.types.utils import Message as LiteLLMMessage, ChatCompletionMessageToolCall
+import weakref
+import httpx
+from typing_extensions import Any, Awaitable, Callable, Dict, List, Set, Tuple, cast
+from tavily import AsyncTavilyClient
+from copilotkit.runloop import get_context_execution
+from research_canvas.crewai.cache import CoalescingCache
+from research_canvas.crewai.emit import StateEmitter
+from research_canvas.crewai.llm import stream_completion, replay_tool_call
+from research_canvas.crewai.routing import get_router
+from research_canvas.crewai.admission import Overloaded, admit
+from research_canvas.crewai.store import get_extraction_store
+from research_canvas.crewai.history import request_messages
+from research_canvas.crewai.metrics import register_cache, stage
+from research_canvas.crewai.recommendations import RecommendationIndex, attach_sources
+from research_canvas.crewai.incremental_json import ArrayItemParser
+from research_canvas.crewai.prefetch import prefetch_sources, use_prefetched
+from research_canvas.crewai.search_results import compact_search_results
 
 
 logger = logging.getLogger(__name__)
@@ -17,95 +32,136 @@ logging.basicConfig(level=logging.INFO)
 
 HITL_TOOLS = []
 
-tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
-api_key = os.getenv("OPENROUTER_API_KEY")
-if api_key is None:
-    raise ValueError("OPENROUTER_API_KEY environment variable not set.")
-
-# Custom JSON encoder to handle Message objects
-class MessageEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, LiteLLMMessage) or (hasattr(obj, "__class__") and obj.__class__.__name__ == "Message"):
-            # Convert Message object to a serializable dictionary
-            return {
-                'role': getattr(obj, 'role', ''),
-                'content': getattr(obj, 'content', ''),
-                'tool_calls': getattr(obj, 'tool_calls', []),
-                'tool_call_id': getattr(obj, 'tool_call_id', None)
-            }
-        elif isinstance(obj, ChatCompletionMessageToolCall) or (hasattr(obj, "__class__") and obj.__class__.__name__ == "ChatCompletionMessageToolCall"):
-            # Convert ChatCompletionMessageToolCall to a serializable dictionary
-            return {
-                'id': getattr(obj, 'id', ''),
-                'type': getattr(obj, 'type', ''),
-                'function': {
-                    'name': getattr(obj.function, 'name', '') if hasattr(obj, 'function') else '',
-                    'arguments': getattr(obj.function, 'arguments', '') if hasattr(obj, 'function') else ''
-                }
-            }
-        return super().default(obj)
-
-# Helper function to prepare state for JSON serialization
-def prepare_state_for_serialization(state):
-    """
-    Recursively convert non-serializable objects in state to serializable dictionaries.
-    """
-    if isinstance(state, dict):
-        # Handle dictionary
-        result = {}
-        for key, value in state.items():
-            result[key] = prepare_state_for_serialization(value)
-        return result
-    elif isinstance(state, list):
-        # Handle list
-        return [prepare_state_for_serialization(item) for item in state]
-    elif isinstance(state, (str, int, float, bool, type(None))):
-        # Base primitive types
-        return state
-    elif isinstance(state, LiteLLMMessage) or (hasattr(state, "__class__") and state.__class__.__name__ == "Message"):
-        # Handle Message objects
-        return {
-            'role': getattr(state, 'role', ''),
-            'content': getattr(state, 'content', ''),
-            'tool_calls': prepare_state_for_serialization(getattr(state, 'tool_calls', [])),
-            'tool_call_id': getattr(state, 'tool_call_id', None)
-        }
-    elif isinstance(state, ChatCompletionMessageToolCall) or (hasattr(state, "__class__") and state.__class__.__name__ == "ChatCompletionMessageToolCall"):
-        # Handle ChatCompletionMessageToolCall objects
-        function_data = {}
-        if hasattr(state, 'function'):
-            function_data = {
-                'name': getattr(state.function, 'name', ''),
-                'arguments': getattr(state.function, 'arguments', '')
-            }
-        
-        return {
-            'id': getattr(state, 'id', ''),
-            'type': getattr(state, 'type', ''),
-            'function': function_data
-        }
-    else:
-        # Try to convert other objects to dict if possible
-        try:
-            # Try to convert to dict using __dict__
-            if hasattr(state, '__dict__'):
-                return prepare_state_for_serialization(state.__dict__)
-            # Try to use model_dump for pydantic models
-            elif hasattr(state, 'model_dump'):
-                return prepare_state_for_serialization(state.model_dump())
-            # If object has a to_dict method
-            elif hasattr(state, 'to_dict') and callable(getattr(state, 'to_dict')):
-                return prepare_state_for_serialization(state.to_dict())
-            # Last resort: try to convert using vars()
-            else:
-                return prepare_state_for_serialization(vars(state))
-        except:
-            # If all else fails, convert to string
-            return str(state)
+_SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", "4"))
+
+_TAVILY_API_BASE_URL = os.getenv("TAVILY_API_BASE_URL", "https://api.tavily.com")
+
+# One pooled Tavily client and its HTTP client per event loop (in practice,
+# one per worker process).
+_TAVILY_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[AsyncTavilyClient, httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+def _get_tavily_clients() -> Tuple[AsyncTavilyClient, httpx.AsyncClient]:
+    loop = asyncio.get_running_loop()
+    clients = _TAVILY_CLIENTS.get(loop)
+    if clients is None:
+        http_client = httpx.AsyncClient(base_url=_TAVILY_API_BASE_URL)
+        clients = _TAVILY_CLIENTS[loop] = (
+            AsyncTavilyClient(
+                api_key=os.getenv("TAVILY_API_KEY"),
+                api_base_url=_TAVILY_API_BASE_URL,
+                client=http_client
+            ),
+            http_client
+        )
+    return clients
+
+def _get_tavily_client() -> AsyncTavilyClient:
+    """
+    Get the shared Tavily client for the running event loop, creating it on first use.
+    """
+    return _get_tavily_clients()[0]
+
+async def warm_up_tavily_client():
+    """
+    Open a pooled connection to the Tavily API ahead of the first search.
+    """
+    try:
+        await _get_tavily_clients()[1].head("/")
+    except httpx.HTTPError:
+        pass
+
+async def close_tavily_client():
+    """
+    Close the shared Tavily client of the running event loop.
+    """
+    clients = _TAVILY_CLIENTS.pop(asyncio.get_running_loop(), None)
+    if clients is not None:
+        await clients[1].aclose()
+
+# Search results keyed by normalized query; each entry counts as one unit.
+_SEARCH_CACHE = CoalescingCache(
+    max_bytes=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "512")),
+    ttl=float(os.getenv("SEARCH_CACHE_TTL", "900")),
+    sizeof=lambda _: 1
+)
+
+def _normalize_query(query: str) -> str:
+    """
+    Normalize a search query so trivially different phrasings share a cache entry.
+    """
+    return " ".join(re.sub(r"[^\w]+", " ", query.lower()).split())
+
+async def _search(query: str):
+    """
+    Search with Tavily, sharing cached and in-flight results across sessions.
+    """
+    async def fetch():
+        async with admit("search"):
+            return await _get_tavily_client().search(query)
+
+    return await _SEARCH_CACHE.get_or_fetch(_normalize_query(query), fetch)
+
+def get_search_cache_stats():
+    """
+    Get the hit, miss, coalescing and eviction counters of the search cache.
+    """
+    return _SEARCH_CACHE.stats()
+
+register_cache("search", get_search_cache_stats)
+
+# ExtractResources tool call arguments keyed by a hash of their inputs;
+# each entry counts as one unit.
+_EXTRACTION_CACHE = CoalescingCache(
+    max_bytes=int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "256")),
+    ttl=float(os.getenv("EXTRACTION_CACHE_TTL", "3600")),
+    sizeof=lambda _: 1
+)
+
+def _extraction_key(state: Dict[str, Any], search_results: List[Dict[str, Any]]) -> str:
+    """
+    Hash the inputs that determine the extracted recommendations: the model,
+    the tool definition, the latest user request and the search results
+    without volatile fields such as timings and scores.
+    """
+    user_messages = [
+        message.get("content") or "" for message in state["messages"]
+        if message.get("role") == "user"
+    ]
+    results = sorted(
+        (
+            _normalize_query(response.get("query", "")),
+            [
+                (result.get("url"), result.get("title"), result.get("content"))
+                for result in response.get("results", [])
+            ]
+        )
+        for response in search_results
+    )
+    payload = {
+        # Any route may serve an extraction; key on the preferred model.
+        "model": get_router().routes[0].model,
+        "tool": EXTRACT_RESOURCES_TOOL,
+        "request": " ".join(user_messages[-1].lower().split()) if user_messages else "",
+        "results": results,
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def get_extraction_cache_stats():
+    """
+    Get the hit, miss, coalescing and eviction counters of the extraction cache.
+    """
+    return _EXTRACTION_CACHE.stats()
+
+register_cache("extraction", get_extraction_cache_stats)
 
 async def perform_tool_calls(state: Dict[str, Any]):
     """
-    Perform tool calls on the state.
+    Perform the tool calls of the last message concurrently and append their
+    results in call order. A failing call is reported in its own result and
+    does not affect the others.
     """
     if len(state["messages"]) == 0:
         return False
@@ -114,39 +170,123 @@ async def perform_tool_calls(state: Dict[str, Any]):
     if not message.get("tool_calls"):
         return False
 
-    tool_call = message["tool_calls"][0]
-    tool_call_id = tool_call["id"]
-    tool_call_name = tool_call["function"]["name"]
-    tool_call_args = json.loads(tool_call["function"]["arguments"])
-
-    if tool_call_name in HITL_TOOLS:
+    tool_calls = message["tool_calls"]
+    if any(tool_call["function"]["name"] in HITL_TOOLS for tool_call in tool_calls):
         return False
 
-    if tool_call_name == "Search":
-        queries = tool_call_args.get("queries", [])
-        await perform_search(state, queries, tool_call_id)
-
-    elif tool_call_name == "ExtractResources":
-        state["report"] = tool_call_args.get("recommendations", "")
-        state["messages"].append({
-            "role": "tool",
-            "content": "Resources extracted.",
-            "tool_call_id": tool_call_id
-        })
-
-    elif tool_call_name == "DeepDiveReview":
-        state["report"] = tool_call_args.get("car_name", "")
+    results = await asyncio.gather(*(_perform_tool_call(state, tool_call) for tool_call in tool_calls))
+    for tool_call, content in zip(tool_calls, results):
         state["messages"].append({
             "role": "tool",
-            "content": "Deep Dive Report written.",
-            "tool_call_id": tool_call_id
+            "content": content,
+            "tool_call_id": tool_call["id"]
         })
 
     return True
 
-async def perform_search(state: Dict[str, Any], queries: List[str], tool_call_id: str):
+async def _perform_tool_call(state: Dict[str, Any], tool_call: Dict[str, Any]) -> str:
     """
-    Perform a search.
+    Run one tool call through its handler and return the tool result.
+    """
+    name = tool_call["function"]["name"]
+    with stage("tool_call", tool=name) as span:
+        handler = _TOOL_HANDLERS.get(name)
+        if handler is None:
+            span.outcome = "error"
+            return f"Unknown tool: {name}"
+        try:
+            args = json.loads(tool_call["function"]["arguments"] or "{}")
+            return await handler(state, args, tool_call["id"])
+        except Exception as e: # pylint: disable=broad-except
+            logger.warning("Tool call %s failed: %s", name, e)
+            span.outcome = "error"
+            return f"{name} failed: {e}"
+
+async def _search_tool(state: Dict[str, Any], args: Dict[str, Any], tool_call_id: str) -> str:
+    return await perform_search(state, args.get("queries", []), tool_call_id)
+
+async def _extract_resources_tool(state: Dict[str, Any], args: Dict[str, Any], _tool_call_id: str) -> str:
+    state["report"] = args.get("recommendations", "")
+    return "Resources extracted."
+
+async def _deep_dive_review_tool(state: Dict[str, Any], args: Dict[str, Any], _tool_call_id: str) -> str:
+    car_name = args.get("car_name", "")
+    recommendation = RecommendationIndex(state.get("recommendations", [])).match(car_name)
+    if recommendation is not None:
+        car_name = recommendation["car"]
+        state["car_name"] = car_name
+        _add_sources(state, recommendation.get("sources", []))
+    state["report"] = car_name
+    if recommendation is None:
+        return "Deep Dive Report written; this car is not among the recommendations."
+    return "Deep Dive Report written."
+
+# Tool name -> async handler(state, arguments, tool_call_id) returning the tool result.
+_TOOL_HANDLERS: Dict[str, Callable[[Dict[str, Any], Dict[str, Any], str], Awaitable[str]]] = {
+    "Search": _search_tool,
+    "ExtractResources": _extract_resources_tool,
+    "DeepDiveReview": _deep_dive_review_tool,
+}
+
+class SearchAhead:
+    """
+    Starts the searches of Search tool calls while the model is still
+    streaming their arguments, one as soon as each query is complete.
+    `perform_search` later joins them through the search cache. Pass an
+    instance as `on_arguments` to `stream_completion`, and close it when the
+    turn's tool calls are done.
+    """
+
+    def __init__(self):
+        self._parsers: Dict[str, ArrayItemParser] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def __call__(self, tool_call_id: str, name: str, delta: str):
+        if name != "Search":
+            return
+        parser = self._parsers.setdefault(tool_call_id, ArrayItemParser("queries"))
+        for query in parser.feed(delta):
+            if isinstance(query, str):
+                task = asyncio.create_task(_search(query))
+                self._tasks.add(task)
+                task.add_done_callback(self._done)
+
+    def _done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            # perform_search searches again and reports the error.
+            logger.info("Early search failed: %s", task.exception())
+
+    async def close(self):
+        """
+        Cancel the searches still running once the tool calls have run, or
+        will not run because the turn ended first. A search that a tool call
+        joined has already finished.
+        """
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def _thread_id() -> str:
+    execution = get_context_execution()
+    return execution["thread_id"] if execution else ""
+
+def _add_sources(state: Dict[str, Any], sources: List[Dict[str, str]]):
+    """
+    Add the sources of a recommendation to the resources, so the next step
+    downloads them (or finds them prefetched) and reads them for the report.
+    """
+    use_prefetched(_thread_id(), [source["url"] for source in sources])
+    state["resources"] = state.get("resources", [])
+    urls = {resource["url"] for resource in state["resources"]}
+    for source in sources:
+        if source["url"] not in urls:
+            state["resources"].append({"url": source["url"], "title": source["title"], "description": ""})
+
+async def perform_search(state: Dict[str, Any], queries: List[str], tool_call_id: str) -> str:
+    """
+    Perform a search and return the tool result.
     """
     # state["resources"] = state.get("resources", [])
     # state["logs"] = state.get("logs", [])
@@ -154,75 +294,185 @@ async def perform_search(state: Dict[str, Any], queries: List[str], tool_call_id
     state["recommendations"] = state.get("recommendations", [])
     state["logs"] = state.get("logs", [])
 
-    for query in queries:
-        state["logs"].append({
-            "message": f"Search for {query}",
-            "done": False
-        })
+    # Other searches of the same message may be logging at the same time.
+    logs = [{"message": f"Search for {query}", "done": False} for query in queries]
+    state["logs"].extend(logs)
+
+    emitter = StateEmitter(state)
+    await emitter.emit(force=True)
+
+    semaphore = asyncio.Semaphore(_SEARCH_CONCURRENCY)
+    overloaded: List[Overloaded] = []
+
+    async def search(i: int, query: str):
+        async with semaphore:
+            with stage("search", tool="Search") as span:
+                try:
+                    response = await _search(query)
+                except Overloaded as e:
+                    overloaded.append(e)
+                    response = {"query": query, "results": [], "error": str(e)}
+                    span.outcome = "rejected"
+                except Exception as e: # pylint: disable=broad-except
+                    logger.warning("Search for %r failed: %s", query, e)
+                    response = {"query": query, "results": [], "error": str(e)}
+                    span.outcome = "error"
+        logs[i]["done"] = True
+        await emitter.emit()
+        return response
+
+    search_results = await asyncio.gather(*(
+        search(i, query) for i, query in enumerate(queries)
+    ))
+    await emitter.flush()
+
+    if overloaded and len(overloaded) == len(queries):
+        # Nothing to extract from; the tool result tells the model search is busy.
+        state["logs"] = [log for log in state["logs"] if not any(log is own for own in logs)]
+        await emitter.emit(force=True)
+        raise overloaded[0]
+
+    # Recommendations are merged into the index and shown one at a time as
+    # the model finishes each, rather than predicted from partial arguments.
+    index = RecommendationIndex(state["recommendations"])
+    added: List[Dict[str, Any]] = []
+    updated: List[Dict[str, Any]] = []
+    merged = 0
+
+    def merge(recommendations: List[Any]):
+        new, changed = index.merge([r for r in recommendations if isinstance(r, dict)])
+        added.extend(new)
+        updated.extend(entry for entry in changed if not any(entry is other for other in added + updated))
+        attach_sources(new + changed, search_results)
+
+    async def on_recommendation(recommendation: Any):
+        nonlocal merged
+        merged += 1
+        merge([recommendation])
+        await emitter.emit()
+
+    response = await _extract_resources(state, search_results, tool_call_id, on_recommendation)
+
+    # A replayed or shared extraction did not stream here; merge whatever is left.
+    message = cast(Any, response).choices[0]["message"]
+    merge(json.loads(message["tool_calls"][0]["function"]["arguments"])["recommendations"][merged:])
 
-    # Use the prepared state for serialization
-    serializable_state = prepare_state_for_serialization(state)
-    await copilotkit_emit_state(serializable_state)
-
-    search_results = []
-
-    for i, query in enumerate(queries):
-        response = tavily_client.search(query)
-        search_results.append(response)
-        state["logs"][i]["done"] = True
-        # Use the prepared state for serialization
-        serializable_state = prepare_state_for_serialization(state)
-        await copilotkit_emit_state(serializable_state)
-
-    await copilotkit_predict_state(
-        {
-            "recommendations": {
-                "tool_name": "ExtractResources",
-                "tool_argument": "recommendations",
-            },
-        }
+    state["logs"] = [log for log in state["logs"] if not any(log is own for own in logs)]
+    await emitter.emit(force=True)
+
+    prefetch_sources(
+        _thread_id(),
+        [source["url"] for recommendation in added + updated for source in recommendation["sources"]]
     )
 
-    response = await copilotkit_stream(
-        completion(
-            # model="openai/deepseek/deepseek-chat",
-            model="openai/deepseek/deepseek-chat-v3-0324",
-            base_url="https://openrouter.ai/api/v1",
-            api_key=api_key,
-            messages=[
-                {
+    return _recommendations_summary(added, updated)
+
+def _recommendations_summary(added: List[Dict[str, Any]], updated: List[Dict[str, Any]]) -> str:
+    """
+    The tool result for a search: new recommendations in full, cars that were
+    already recommended by name only.
+    """
+    lines = [
+        f"- {recommendation.get('car', '')}: {recommendation.get('tagline', '')}. "
+        f"{recommendation.get('content', '')}"
+        for recommendation in added
+    ]
+    lines.extend(
+        f"- {recommendation.get('car', '')} (already recommended, details updated)"
+        for recommendation in updated
+    )
+    if not lines:
+        return "No new recommendations; all of these cars were already recommended."
+    return "Added the following recommendations:\n" + "\n".join(lines)
+
+def _history_for_tool_call(messages: List[Any], tool_call_id: str) -> List[Any]:
+    """
+    The history as seen by one of several parallel tool calls: the last
+    message keeps only that call, since the others have no results yet.
+    """
+    tool_calls = (messages[-1].get("tool_calls") or []) if messages else []
+    if len(tool_calls) <= 1:
+        return messages
+    return messages[:-1] + [{
+        "role": "assistant",
+        "content": messages[-1].get("content"),
+        "tool_calls": [tool_call for tool_call in tool_calls if tool_call["id"] == tool_call_id]
+    }]
+
+async def _extract_resources(
+    state: Dict[str, Any],
+    search_results: List[Dict[str, Any]],
+    tool_call_id: str,
+    on_recommendation: Callable[[Any], Awaitable[None]]
+):
+    """
+    Extract recommendations from search results with the model, or replay a
+    cached extraction of the same results to the UI without calling it.
+    While the model streams, `on_recommendation` is awaited with each
+    recommendation as soon as it is complete.
+    """
+    parser = ArrayItemParser("recommendations")
+
+    async def on_arguments(_tool_call_id: str, name: str, delta: str):
+        if name == "ExtractResources":
+            for recommendation in parser.feed(delta):
+                await on_recommendation(recommendation)
+
+    key = _extraction_key(state, search_results)
+    # Don't cache extractions from partially failed searches.
+    cacheable = not any("error" in response for response in search_results)
+    streamed = None
+
+    async def extract():
+        nonlocal streamed
+        store = get_extraction_store()
+        if store and cacheable:
+            try:
+                arguments = await store.get(key, _EXTRACTION_CACHE.ttl)
+                if arguments is not None:
+                    return arguments
+            except Exception as e: # pylint: disable=broad-except
+                logger.warning("Reading the extraction store failed: %s", e)
+
+        streamed = await stream_completion(
+            stage_name="llm_extract_resources",
+            messages=request_messages(
+                "extract resources",
+                [{
                     "role": "system", 
                     "content": "You need to extract the 3-5 most relevant recommendations from the following search results."
-                },
-                *state["messages"],
-                {
+                }],
+                _history_for_tool_call(state["messages"], tool_call_id),
+                [{
                     "role": "tool",
-                    "content": f"Performed search: {search_results}",
+                    "content": f"Performed search:\n{compact_search_results(search_results)}",
                     "tool_call_id": tool_call_id
-                }
-            ],
+                }]
+            ),
             tools=[EXTRACT_RESOURCES_TOOL],
             tool_choice="required",
             parallel_tool_calls=False,
-            stream=True
+            on_arguments=on_arguments
         )
-    )
-
-    state["logs"] = []
-    # Use the prepared state for serialization
-    serializable_state = prepare_state_for_serialization(state)
-    await copilotkit_emit_state(serializable_state)
-
-    message = cast(Any, response).choices[0]["message"]
-    recommendations = json.loads(message["tool_calls"][0]["function"]["arguments"])["recommendations"]
-
-    state["recommendations"].extend(recommendations)
-
-    state["messages"].append({
-        "role": "tool",
-        "content": f"Added the following recommendations: {recommendations}",
-        "tool_call_id": tool_call_id
-    })
+        arguments = cast(Any, streamed).choices[0]["message"]["tool_calls"][0]["function"]["arguments"]
+        # Only well-formed extractions are cached.
+        json.loads(arguments)["recommendations"] # pylint: disable=expression-not-assigned
+        if store and cacheable:
+            try:
+                await store.put(key, arguments)
+            except Exception as e: # pylint: disable=broad-except
+                logger.warning("Writing the extraction store failed: %s", e)
+        return arguments
+
+    if not cacheable:
+        await extract()
+        return streamed
+    with stage("extract_resources", tool="ExtractResources") as span:
+        arguments = await _EXTRACTION_CACHE.get_or_fetch(key, extract)
+        if streamed is not None:
+            return streamed
+        span.outcome = "cached"
+        return await replay_tool_call("ExtractResources", arguments)
 
 # Tool definitions (EXTRACT_RESOURCES_TOOL, SEARCH_TOOL, etc.)
 EXTRACT_RESOURCES_TOOL = {
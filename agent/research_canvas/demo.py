@@ -6,12 +6,13 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # pylint: disable=wrong-import-position
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 import uvicorn
 from copilotkit.integrations.fastapi import add_fastapi_endpoint
 from copilotkit import CopilotKitRemoteEndpoint, LangGraphAgent
 from copilotkit.crewai import CrewAIAgent
 from research_canvas.crewai.agent import ResearchCanvasFlow
+from research_canvas.crewai.metrics import CONTENT_TYPE, render_metrics
 
 # from research_canvas.langgraph.agent import graph
 
@@ -79,6 +80,12 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+def metrics():
+    """Stage timings in the Prometheus text format."""
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
+
+
 def main():
     """Run the uvicorn server."""
     port = int(os.getenv("PORT", "8000"))
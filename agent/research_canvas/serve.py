@@ -0,0 +1,58 @@
+"""Production server"""
+
+import os
+import glob
+import tempfile
+from dotenv import load_dotenv
+import uvicorn
+
+load_dotenv()
+
+# Seconds to let in-flight streams finish after SIGTERM before they are cut off.
+_DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "60"))
+
+# Seconds a worker may take to start or answer a ping before it is restarted;
+# importing the agent alone takes several seconds.
+_WORKER_HEALTHCHECK_TIMEOUT = int(os.getenv("WORKER_HEALTHCHECK_TIMEOUT", "60"))
+
+
+def _metrics_dir() -> str:
+    """
+    The directory the workers write their metrics to, METRICS_DIR or a new
+    temporary one, emptied of the metrics of a previous server.
+    """
+    metrics_dir = os.getenv("METRICS_DIR") or tempfile.mkdtemp(prefix="research-canvas-metrics-")
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, "worker-*.json")):
+        os.remove(path)
+    return metrics_dir
+
+
+def main():
+    """
+    Run the production server: several worker processes, no reload.
+    HOST, PORT and WEB_CONCURRENCY (workers, default one per CPU) configure it.
+    On SIGTERM each worker stops accepting connections and lets in-flight
+    streams finish for up to DRAIN_TIMEOUT seconds.
+    A scrape of /metrics is answered by any one worker, so the workers share
+    a metrics directory and the answer adds up the metrics of all of them.
+
+    The app is passed by name so that only the workers import the agent and
+    its dependencies; the supervising process stays light and starts them
+    right away.
+    """
+    os.environ["METRICS_DIR"] = _metrics_dir()
+    uvicorn.run(
+        "research_canvas.app:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))),
+        reload=False,
+        timeout_graceful_shutdown=_DRAIN_TIMEOUT,
+        timeout_worker_healthcheck=_WORKER_HEALTHCHECK_TIMEOUT,
+        log_level=os.getenv("LOG_LEVEL", "info"),
+    )
+
+
+if __name__ == "__main__":
+    main()